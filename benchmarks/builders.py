@@ -0,0 +1,123 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Compare the throughput of thrum.pypy.BytesBuilder (the native builder on
+PyPy, ByteArrayBuilder elsewhere) with ByteArrayBuilder, with a bytearray
+preallocated to the size hint and with the list of chunks that the fallback
+used to be, building a buffer of small appends and
+slices as MessageWriter and copy_in_chunks do.
+
+Run under each interpreter from the top of the source tree:
+    python -m benchmarks.builders
+    pypy -m benchmarks.builders
+"""
+
+from __future__ import print_function
+
+import platform
+import sys
+import time
+
+from thrum import pypy
+
+
+class ListBuilder(object):
+    '''
+    The list-of-chunks fallback that ByteArrayBuilder replaced
+    '''
+
+    def __init__(self, *args):
+        self.buffer = []
+        self.append = self.buffer.append
+
+    def build(self):
+        return b"".join(self.buffer)
+
+    def append_slice(self, value, start, end):
+        self.append(value[start:end])
+
+    def __len__(self):
+        return sum(len(x) for x in self.buffer)
+
+
+class PreallocBuilder(object):
+    '''
+    A bytearray preallocated to the size hint, filled by slice assignment
+    and truncated to what was appended in build()
+    '''
+
+    def __init__(self, size_hint=0):
+        self.buffer = bytearray(size_hint)
+        self.length = 0
+
+    def append(self, value):
+        start = self.length
+        self.length = end = start + len(value)
+        self.buffer[start:end] = value
+
+    def append_slice(self, value, start, end):
+        self.append(memoryview(value)[start:end])
+
+    def build(self):
+        del self.buffer[self.length:]
+        return bytes(self.buffer)
+
+    def __len__(self):
+        return self.length
+
+
+CHUNKS = [b'B\x00\x00\x00\x1c', b'\x00', b'statement\x00',
+          b'\x00\x01\x00\x01', b'\x00\x01\x00\x00\x00\x04\x00\x00\x00\x07']
+SOURCE = b'x' * 1024
+
+
+def build(cls, count, size_hint):
+    builder = cls(size_hint)
+    append = builder.append
+    append_slice = builder.append_slice
+    for index in range(count):
+        for chunk in CHUNKS:
+            append(chunk)
+        append_slice(SOURCE, 100, 164)
+        if not index % 100:
+            # e.g. to check whether a chunk is full
+            len(builder)
+    return builder.build()
+
+
+def run(cls, count, size_hint, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        build(cls, count, size_hint)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count / best
+
+
+def main(repeat=5):
+    print('%s %s' % (platform.python_implementation(),
+                     sys.version.split()[0]))
+    builders = [('BytesBuilder', pypy.BytesBuilder),
+                ('ByteArrayBuilder', lambda hint: pypy.ByteArrayBuilder()),
+                ('PreallocBuilder', PreallocBuilder),
+                ('ListBuilder', ListBuilder)]
+    if issubclass(pypy.BytesBuilder, pypy.ByteArrayBuilder):
+        # BytesBuilder is the fallback
+        builders.pop(1)
+    expected = build(ListBuilder, 10, 0)
+    for count in (10, 1000, 100000):
+        for name, cls in builders:
+            assert build(cls, 10, 0) == expected
+            size_hint = count * 100
+            rate = run(cls, count, size_hint, repeat)
+            print('%-18s %7d messages  %12.0f messages/s' %
+                  (name, count, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Micro-benchmarks for the hot paths that everything else is built on: every
+*_pack/*_unpack pair in thrum.binary, array_pack and array_unpack,
+Cache.get_unpack_ints_for_index for widths that are precompiled and widths
+that go through the struct cache, and pypy.BytesBuilder append and build.
+
+Each case reports operations per second (the best of several timed runs,
+after a warm-up run so PyPy's JIT has compiled the loop) and, where
+tracemalloc is available (not on PyPy), the peak memory that one operation
+allocates, including what it returns.
+
+Results are compared with a JSON baseline for the same interpreter, and the
+run fails if any case is slower than its baseline by more than the
+threshold, e.g. from the top of the source tree:
+
+    python -m benchmarks.micro --save          # record a baseline
+    python -m benchmarks.micro                 # compare with it
+    pypy -m benchmarks.micro --threshold 0.2 --filter unpack
+
+Baselines are kept in benchmarks/baselines, one file per interpreter and
+version, since numbers from different interpreters can't be compared.
+They're only meaningful on the machine that recorded them.
+"""
+
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+from thrum import binary
+from thrum import constants
+from thrum import pypy
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'baselines')
+
+# A value to pack for each struct format character
+SAMPLES = {
+    'b': -7, 'B': 7, 'c': b'Q', 'h': -1234, 'H': 1234,
+    'i': -123456, 'I': 123456, 'q': -2 ** 40, 'Q': 2 ** 40,
+    'f': 0.5, 'd': 0.25,
+}
+
+# Element types and values for array_pack and array_unpack
+ARRAYS = (
+    ('int4', constants.INT4OID, list(range(100))),
+    ('int8', constants.INT8OID, list(range(-2 ** 40, -2 ** 40 + 100))),
+    ('float8', constants.FLOAT8OID, [index / 4.0 for index in range(100)]),
+    ('text', constants.TEXTOID, [b'element'] * 100),
+)
+
+CACHED_WIDTHS = (1, 4, 19)
+UNCACHED_WIDTHS = (20, 64)
+
+CHUNK = b'D\x00\x00\x00\x0c\x00\x01'
+
+
+def struct_pairs():
+    """
+    Return the (format, pack, unpack) of each *_pack/*_unpack pair in
+    thrum.binary that packs a struct format
+    """
+    pairs = []
+    for name in sorted(dir(binary)):
+        if not name.endswith('_pack'):
+            continue
+        fmt = name[:-len('_pack')]
+        unpack = getattr(binary, fmt + '_unpack', None)
+        if unpack is None or not all(char in SAMPLES for char in fmt):
+            continue
+        pairs.append((fmt, getattr(binary, name), unpack))
+    return pairs
+
+
+def cases():
+    """
+    Return (name, func, args) for each benchmark: calling func(*args) is one
+    operation
+    """
+    result = []
+    for fmt, pack, unpack in struct_pairs():
+        values = tuple(SAMPLES[char] for char in fmt)
+        data = pack(*values)
+        assert unpack(data) == values, fmt
+        result.append(('binary.%s_pack' % (fmt,), pack, values))
+        result.append(('binary.%s_unpack' % (fmt,), unpack, (data,)))
+
+    for name, oid, values in ARRAYS:
+        data = binary.array_pack(values, oid)
+        assert list(binary.array_unpack(data)[3]) == values, name
+        result.append(('binary.array_pack %s x%d' % (name, len(values)),
+                       binary.array_pack, (values, oid)))
+        result.append(('binary.array_unpack %s x%d' % (name, len(values)),
+                       binary.array_unpack, (data,)))
+
+    get = binary.Cache.get_unpack_ints_for_index
+
+    def get_and_unpack(index, data):
+        return get(index)(data)
+    for kind, widths in (('cached', CACHED_WIDTHS),
+                         ('uncached', UNCACHED_WIDTHS)):
+        for index in widths:
+            data = binary.structs.get_struct('!' + 'i' * index).pack(
+                *range(index))
+            result.append(('Cache.get_unpack_ints_for_index(%d) %s' %
+                           (index, kind), get_and_unpack, (index, data)))
+
+    def append_100():
+        builder = pypy.BytesBuilder(1024)
+        append = builder.append
+        for _ in range(100):
+            append(CHUNK)
+
+    def build_small():
+        builder = pypy.BytesBuilder(1024)
+        builder.append(CHUNK)
+        return builder.build()
+
+    def append_and_build_4k():
+        builder = pypy.BytesBuilder(4096)
+        append = builder.append
+        for _ in range(585):
+            append(CHUNK)
+        return builder.build()
+
+    result.append(('BytesBuilder new+append x100', append_100, ()))
+    result.append(('BytesBuilder build (1 append)', build_small, ()))
+    result.append(('BytesBuilder append+build (4kB)', append_and_build_4k,
+                   ()))
+    return result
+
+
+def _loop(func, args, count):
+    start = time.time()
+    for _ in itertools.repeat(None, count):
+        func(*args)
+    return time.time() - start
+
+
+def ops_per_sec(func, args, duration, repeat):
+    """
+    Time enough calls of func(*args) to take about 'duration' seconds, and
+    return the best rate of 'repeat' runs
+    """
+    count = 1000
+    while True:
+        elapsed = _loop(func, args, count)
+        if elapsed >= duration / 10:
+            break
+        count *= 10
+    count = max(int(count * duration / max(elapsed, 1e-9)), 1)
+    best = None
+    for _ in range(repeat):
+        elapsed = _loop(func, args, count)
+        if best is None or elapsed < best:
+            best = elapsed
+    return count / max(best, 1e-9)
+
+
+def peak_bytes(func, args, count=100):
+    """
+    Return the most memory in use at once during a call of func(*args),
+    including its temporary objects and what it returns, over 'count' calls,
+    or None without tracemalloc
+    """
+    if tracemalloc is None:
+        return None
+    func(*args)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(count):
+            func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return max(peak - before, 0)
+
+
+def interpreter():
+    return '%s-%d.%d' % (platform.python_implementation(),
+                         sys.version_info[0], sys.version_info[1])
+
+
+def baseline_path(directory=BASELINES):
+    return os.path.join(directory, interpreter().lower() + '.json')
+
+
+def measure(selected, duration, repeat):
+    results = {}
+    for name, func, args in selected:
+        # Warm up, e.g. so the JIT has compiled the loop
+        _loop(func, args, 10000)
+        results[name] = {
+            'ops_per_sec': ops_per_sec(func, args, duration, repeat),
+            'peak_bytes': peak_bytes(func, args),
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Return a list of (name, rate, baseline rate, change) for the cases that
+    are slower than their baseline by more than 'threshold'
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        rate = result['ops_per_sec']
+        base = previous['ops_per_sec']
+        change = rate / base - 1
+        if change < -threshold:
+            regressions.append((name, rate, base, change))
+    return regressions
+
+
+def report(results, baseline):
+    for name in sorted(results):
+        result = results[name]
+        line = '%-44s %14.0f ops/s' % (name, result['ops_per_sec'])
+        if result.get('peak_bytes') is not None:
+            line += ' %8d B peak' % (result['peak_bytes'],)
+        previous = baseline.get(name)
+        if previous is not None:
+            line += ' %+7.1f%%' % (
+                (result['ops_per_sec'] / previous['ops_per_sec'] - 1) * 100,)
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--baseline', default=baseline_path(),
+                        help='baseline JSON file (default: %(default)s)')
+    parser.add_argument('--save', action='store_true',
+                        help='write the results to the baseline file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fail if a case is slower than its baseline '
+                             'by more than this fraction')
+    parser.add_argument('--filter', default='',
+                        help='only run cases whose names contain this')
+    parser.add_argument('--duration', type=float, default=0.2,
+                        help='seconds per timed run')
+    parser.add_argument('--repeat', type=int, default=5)
+    options = parser.parse_args(argv)
+
+    print(interpreter().replace('-', ' '))
+    selected = [case for case in cases() if options.filter in case[0]]
+    results = measure(selected, options.duration, options.repeat)
+
+    baseline = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as f:
+            baseline = json.load(f)['results']
+    report(results, baseline)
+
+    if options.save:
+        directory = os.path.dirname(options.baseline)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        merged = dict(baseline)
+        merged.update(results)
+        with open(options.baseline, 'w') as f:
+            json.dump({'interpreter': interpreter(),
+                       'platform': platform.platform(),
+                       'results': merged}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Saved %s' % (options.baseline,))
+        return 0
+
+    if not baseline:
+        print('No baseline at %s; run with --save to record one' %
+              (options.baseline,))
+        return 0
+    regressions = compare(results, baseline, options.threshold)
+    for name, rate, base, change in regressions:
+        print('REGRESSION %s: %.0f ops/s, baseline %.0f (%.1f%%)' %
+              (name, rate, base, change * 100))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Measure NUMERIC encode/decode throughput of thrum.numeric against parsing the
+text format and against a binary decoder that builds a string for Decimal.
+
+Run under each interpreter from the top of the source tree:
+    python -m benchmarks.numeric
+    pypy -m benchmarks.numeric
+"""
+
+from __future__ import print_function
+
+import platform
+import sys
+import time
+from decimal import Decimal
+
+from thrum import binary
+from thrum import numeric
+
+VALUES = {
+    'money': Decimal('1234567.89'),
+    'small': Decimal('0.0042'),
+    'integer': Decimal('9876543210'),
+    'wide': Decimal('-12345678901234567890.123456789012345678'),
+}
+
+
+def numeric_recv_string(data, offset=0, length=None):
+    """
+    Decode by formatting the digit groups as text and parsing that
+    """
+    ndigits, weight, sign, dscale = binary.hhHh_unpack(data, offset)
+    digits = binary.Cache.get_unpack_shorts_for_index(ndigits)(
+        data, offset + 8) if ndigits else ()
+    text = ''.join('%04d' % (digit,) for digit in digits) or '0'
+    exponent = 4 * (weight - ndigits + 1)
+    value = Decimal('%s%sE%d' % ('-' if sign == numeric.NUMERIC_NEG else '',
+                                 text, exponent))
+    return value.quantize(Decimal(1).scaleb(-dscale), context=numeric._exact)
+
+
+def rate(func, args, count):
+    best = None
+    for _ in range(5):
+        start = time.time()
+        for _ in range(count):
+            func(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count / best
+
+
+def main(count=100000):
+    print('%s %s' % (platform.python_implementation(),
+                     sys.version.split()[0]))
+    for name in sorted(VALUES):
+        value = VALUES[name]
+        data = numeric.numeric_send(value)
+        text = str(value).encode('ascii')
+        assert numeric.numeric_recv(data) == value
+        assert numeric_recv_string(data) == value
+        print('%-8s recv %10.0f/s  recv via str %10.0f/s  text %10.0f/s  '
+              'send %10.0f/s' % (
+                  name,
+                  rate(numeric.numeric_recv, (data,), count),
+                  rate(numeric_recv_string, (data,), count),
+                  rate(lambda t: Decimal(t.decode('ascii')), (text,), count),
+                  rate(numeric.numeric_send, (value,), count)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Compare DataRow decoding throughput of the compiled per-layout decoders in
+thrum.rows against a generic loop that dispatches on each column's type.
+
+Run under each interpreter from the top of the source tree:
+    python -m benchmarks.rows
+    pypy -m benchmarks.rows
+"""
+
+from __future__ import print_function
+
+import platform
+import struct
+import sys
+import time
+
+from thrum import binary
+from thrum import constants
+from thrum import rows
+
+BINARY = constants.FC_BINARY
+TEXT = constants.FC_TEXT
+
+LAYOUTS = {
+    'fixed': ((constants.INT4OID, BINARY),
+              (constants.INT8OID, BINARY),
+              (constants.FLOAT8OID, BINARY),
+              (constants.BOOLOID, BINARY)),
+    'mixed': ((constants.INT4OID, BINARY),
+              (constants.TEXTOID, TEXT),
+              (constants.FLOAT8OID, BINARY),
+              (constants.INT8OID, BINARY),
+              (constants.VARCHAROID, TEXT)),
+}
+
+VALUES = {
+    constants.INT4OID: 123456,
+    constants.INT8OID: 2 ** 40,
+    constants.FLOAT8OID: 3.25,
+    constants.BOOLOID: True,
+    constants.TEXTOID: b'some text value',
+    constants.VARCHAROID: b'varchar',
+}
+
+
+def encode_row(layout, nulls=False):
+    parts = [binary.h_pack(len(layout))]
+    for index, (type_oid, format_code) in enumerate(layout):
+        if nulls and index % 2:
+            parts.append(constants.NULL)
+            continue
+        value = VALUES[type_oid]
+        if format_code == TEXT:
+            field = value
+        else:
+            fmt = rows.fixed_width[type_oid].format
+            field = struct.pack(fmt, value)
+        parts.append(binary.i_pack(len(field)))
+        parts.append(field)
+    return b''.join(parts)
+
+
+def decode_row_generic(layout, data):
+    """
+    What we'd do without compiled decoders: look up the decoder for each
+    column of each row
+    """
+    i_unpack = binary.i_unpack
+    fixed_width = rows.fixed_width
+    binary_decoders = rows.binary_decoders
+    pos = 2
+    row = []
+    for type_oid, format_code in layout:
+        length = i_unpack(data, pos)[0]
+        pos += 4
+        if length < 0:
+            row.append(None)
+            continue
+        if format_code == BINARY:
+            if type_oid in fixed_width:
+                row.append(fixed_width[type_oid].unpack_from(data, pos)[0])
+            elif type_oid in binary_decoders:
+                row.append(binary_decoders[type_oid](data, pos, length))
+            else:
+                row.append(bytes(data[pos:pos + length]))
+        else:
+            row.append(bytes(data[pos:pos + length]))
+        pos += length
+    return tuple(row)
+
+
+def run(func, payloads, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for payload in payloads:
+            func(payload)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(payloads) / best
+
+
+def main(count=200000, repeat=5):
+    print('%s %s' % (platform.python_implementation(),
+                     sys.version.split()[0]))
+    for name in sorted(LAYOUTS):
+        layout = LAYOUTS[name]
+        for nulls in (False, True):
+            payloads = [encode_row(layout, nulls)] * count
+            compiled = rows.get_row_decoder(layout)
+            assert compiled(payloads[0]) == \
+                decode_row_generic(layout, payloads[0])
+
+            generic_rate = run(lambda data: decode_row_generic(layout, data),
+                               payloads, repeat)
+            compiled_rate = run(compiled, payloads, repeat)
+            label = '%s%s' % (name, ' (with nulls)' if nulls else '')
+            print('%-20s generic %12.0f rows/s  compiled %12.0f rows/s  '
+                  'x%.1f' % (label, generic_rate, compiled_rate,
+                             compiled_rate / generic_rate))
+
+
+if __name__ == '__main__':
+    main()
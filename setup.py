@@ -10,7 +10,7 @@ with open('HISTORY.rst') as history_file:
     history = history_file.read()
 
 requirements = [
-    # TODO: put package requirements here
+    'ipaddress; python_version < "3"',
 ]
 
 test_requirements = [
@@ -32,6 +32,7 @@ setup(
                  'thrum'},
     include_package_data=True,
     install_requires=requirements,
+    extras_require={'numpy': ['numpy'], 'twisted': ['twisted']},
     license="MIT license",
     zip_safe=False,
     keywords='thrum',
@@ -0,0 +1,316 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+asyncio protocol for a connection to Postgres, e.g.:
+
+conn = await connect(u'localhost', 5432, user=u'postgres', database=u'test',
+                     password=u'secret')
+result = await conn.execute(u'SELECT $1::int4 + 1', (1,), (INT4OID,))
+result.rows == [(2,)]
+
+This is the twin of txconnection.PostgresProtocol: all the protocol state
+lives in connection.Connection, and this only wraps it with futures, so it
+frames, decodes and raises errors exactly as the Twisted protocol does. It
+works with any asyncio event loop, including uvloop's.
+"""
+
+import asyncio
+
+from . import connection
+from . import errors
+from . import notify
+
+
+class PostgresProtocol(asyncio.Protocol):
+    '''
+    A connection to Postgres. 'ready' is a future that resolves to the
+    protocol once startup and authentication have finished, and 'closed' one
+    that resolves when the connection is lost.
+    '''
+
+    def __init__(self, user, database=None, password=None, parameters=None,
+                 statement_cache_size=256, loop=None, decode_text=False):
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.connection = connection.Connection(
+            user, database, password, parameters, statement_cache_size,
+            decode_text)
+        self.connection.startup_callbacks.append(self._startup_finished)
+        self.dispatcher = notify.Dispatcher(self.listen, self.unlisten)
+        self.dispatcher.attach(self.connection)
+        self.transport = None
+        self.ready = self.loop.create_future()
+        self.closed = self.loop.create_future()
+
+    @property
+    def transaction_status(self):
+        return self.connection.transaction_status
+
+    @property
+    def idle(self):
+        return self.connection.idle
+
+    @property
+    def pending(self):
+        """
+        The number of operations waiting for responses
+        """
+        return len(self.connection)
+
+    @property
+    def connected(self):
+        return self.transport is not None and not self.connection.closed
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.connection.connection_made(transport)
+
+    def data_received(self, data):
+        try:
+            self.connection.data_received(data)
+        except Exception as e:
+            # We can't know where the next message starts
+            self.connection.connection_lost(e)
+            self.transport.abort()
+
+    def connection_lost(self, exc):
+        self.connection.connection_lost(exc)
+        if not self.closed.done():
+            self.closed.set_result(self)
+
+    def _startup_finished(self, conn, error):
+        if self.ready.done():
+            return
+        if error is None:
+            self.ready.set_result(self)
+        else:
+            self.ready.set_exception(error)
+            if self.transport is not None:
+                self.transport.close()
+
+    def run_pipeline(self, pipe):
+        """
+        Send 'pipe' and return a future that resolves to it when all of its
+        responses have arrived. Errors are in the StatementResults.
+        """
+        future = self.loop.create_future()
+
+        def done(pipe):
+            if not future.done():
+                future.set_result(pipe)
+        pipe.callbacks.append(done)
+        self.connection.send(pipe)
+        return future
+
+    def pipeline(self):
+        return self.connection.pipeline()
+
+    def _send(self, pipe, results, many):
+        future = self.loop.create_future()
+
+        def done(pipe):
+            if future.done():
+                return
+            for result in results:
+                if result.error is not None:
+                    future.set_exception(result.error)
+                    return
+            future.set_result(results if many else results[0])
+        pipe.callbacks.append(done)
+        self.connection.send(pipe)
+        return future
+
+    def execute(self, sql, params=(), type_oids=(), columnar=False):
+        """
+        Return a future for the StatementResult of 'sql', which raises its
+        error
+        """
+        pipe = self.connection.pipeline()
+        result = pipe.execute(sql, params, type_oids, columnar)
+        return self._send(pipe, [result], False)
+
+    def executemany(self, sql, params_seq, type_oids=(), columnar=False):
+        """
+        Run 'sql' for each parameter sequence in one round trip. Return a
+        future for the StatementResults, which raises the first error.
+        """
+        pipe = self.connection.pipeline()
+        results = pipe.executemany(sql, params_seq, type_oids, columnar)
+        return self._send(pipe, results, True)
+
+    def cursor(self, sql, params=(), type_oids=(), fetch_size=1000,
+               adaptive=True, columnar=False):
+        """
+        Send a cursor.Cursor for 'sql' and return it wrapped in a Cursor
+        """
+        cur = self.connection.cursor(sql, params, type_oids, fetch_size,
+                                     adaptive, columnar)
+        self.connection.send(cur)
+        return Cursor(cur, self.loop)
+
+    def listen(self, channel):
+        return self.execute(u'LISTEN ' + notify.quote_ident(channel))
+
+    def unlisten(self, channel):
+        if not self.connected:
+            return None
+        return self.execute(u'UNLISTEN ' + notify.quote_ident(channel))
+
+    def subscribe(self, channel, maxsize=1000, policy=notify.DROP_OLDEST):
+        """
+        Subscribe to 'channel', sending LISTEN if nothing else has, and
+        return its Notifications. To have a callback called with each
+        notification instead, use self.dispatcher.subscribe().
+        """
+        return Notifications(self.dispatcher.subscribe(
+            channel, maxsize=maxsize, policy=policy), self.loop)
+
+    def close(self):
+        """
+        Send Terminate and close the connection. Return the 'closed' future.
+        """
+        if self.connected:
+            self.connection.terminate()
+            self.transport.close()
+        return self.closed
+
+
+class Cursor(object):
+    '''
+    Fetch the rows of a cursor.Cursor in batches, e.g.:
+
+    async for rows in conn.cursor(u'SELECT * FROM big'):
+        ...
+    '''
+
+    def __init__(self, cursor, loop):
+        self.cursor = cursor
+        self.loop = loop
+
+    def _request(self, end):
+        future = self.loop.create_future()
+
+        def delivered(cursor, rows):
+            if future.done():
+                return
+            if cursor.error is not None:
+                future.set_exception(cursor.error)
+            elif not rows and end is not None:
+                future.set_exception(end())
+            else:
+                future.set_result(rows)
+        self.cursor.request(delivered)
+        return future
+
+    def fetch(self):
+        """
+        Return a future for the next batch of rows, which is empty once
+        there are no more, and raises the cursor's error
+        """
+        return self._request(None)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._request(StopAsyncIteration)
+
+    def close(self):
+        """
+        Stop fetching. Return a future that resolves when the connection has
+        moved on.
+        """
+        self.cursor.close()
+        future = self.loop.create_future()
+        if self.cursor.done:
+            future.set_result(None)
+        else:
+            self.cursor.callbacks.append(
+                lambda cursor: future.done() or future.set_result(None))
+        return future
+
+
+class Notifications(object):
+    '''
+    Take the notifications queued for a notify.Subscription, e.g.:
+
+    async for notification in conn.subscribe(u'invalidate'):
+        ...
+    '''
+
+    def __init__(self, subscription, loop):
+        self.subscription = subscription
+        self.loop = loop
+
+    def _request(self, end):
+        future = self.loop.create_future()
+
+        def delivered(notification):
+            if future.done():
+                return
+            if notification is None and end is not None:
+                future.set_exception(end())
+            else:
+                future.set_result(notification)
+        self.subscription.request(delivered)
+        return future
+
+    def get(self):
+        """
+        Return a future for the next notify.Notification, which is None
+        once the subscription is closed
+        """
+        return self._request(None)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._request(StopAsyncIteration)
+
+    def close(self):
+        self.subscription.close()
+
+
+def connect(host, port=5432, user=None, database=None, password=None,
+            parameters=None, statement_cache_size=256, loop=None,
+            decode_text=False):
+    """
+    Connect to Postgres over TCP. Return a future that resolves to a
+    PostgresProtocol once it's ready for queries.
+    """
+    if user is None:
+        raise errors.ThrumError("A user name is required")
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    ready = loop.create_future()
+
+    def factory():
+        return PostgresProtocol(user, database, password, parameters,
+                                statement_cache_size, loop, decode_text)
+
+    def started(future):
+        if ready.done():
+            return
+        if future.exception() is not None:
+            ready.set_exception(future.exception())
+        else:
+            ready.set_result(future.result())
+
+    def connected(task):
+        if ready.done():
+            return
+        if task.cancelled():
+            ready.cancel()
+        elif task.exception() is not None:
+            ready.set_exception(task.exception())
+        else:
+            transport, proto = task.result()
+            proto.ready.add_done_callback(started)
+
+    task = asyncio.ensure_future(
+        loop.create_connection(factory, host, port), loop=loop)
+    task.add_done_callback(connected)
+    return ready
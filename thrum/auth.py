@@ -0,0 +1,100 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Compute the responses to the backend's authentication requests: md5 password
+hashes and the SCRAM-SHA-256 exchange (RFC 5802 and RFC 7677, without channel
+binding), e.g.:
+
+scram = ScramSHA256(password)
+send(scram.client_first())
+send(scram.client_final(server_first))
+scram.verify(server_final)
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+
+from . import binary
+from . import errors
+
+SCRAM_SHA_256 = b'SCRAM-SHA-256'
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+def md5_password(user, password, salt):
+    """
+    Return the response to AuthenticationMD5Password: 'md5' followed by the
+    hex md5 of the hex md5 of the password and user name, and the salt
+    """
+    inner = hashlib.md5(_text(password) + _text(user)).hexdigest()
+    outer = hashlib.md5(inner.encode('ascii') + salt).hexdigest()
+    return b'md5' + outer.encode('ascii')
+
+
+def _hmac(key, data):
+    return hmac.new(key, data, hashlib.sha256).digest()
+
+
+def _xor(left, right):
+    return bytes(bytearray(a ^ b for a, b in
+                           zip(bytearray(left), bytearray(right))))
+
+
+class ScramSHA256(object):
+    '''
+    The client side of one SCRAM-SHA-256 exchange. Postgres ignores the
+    user name in the SCRAM messages and uses the one from the startup
+    message, so by default none is sent.
+    '''
+
+    def __init__(self, password, nonce=None, user=b''):
+        self.password = _text(password)
+        if nonce is None:
+            nonce = base64.b64encode(os.urandom(18))
+        self.nonce = nonce
+        self.client_first_bare = b'n=' + _text(user) + b',r=' + nonce
+        self.server_signature = None
+
+    def client_first(self):
+        # 'n,,' means the client doesn't support channel binding
+        return b'n,,' + self.client_first_bare
+
+    def client_final(self, server_first):
+        server_first = binary.to_bytes(server_first)
+        fields = dict(item.split(b'=', 1) for item in server_first.split(b','))
+        nonce = fields[b'r']
+        if not nonce.startswith(self.nonce):
+            raise errors.ThrumError("SCRAM server nonce doesn't begin with "
+                                    "the client nonce")
+        salt = base64.b64decode(fields[b's'])
+        iterations = int(fields[b'i'])
+
+        salted = hashlib.pbkdf2_hmac('sha256', self.password, salt,
+                                     iterations)
+        client_key = _hmac(salted, b'Client Key')
+        stored_key = hashlib.sha256(client_key).digest()
+        without_proof = b'c=biws,r=' + nonce
+        auth_message = b','.join((self.client_first_bare, server_first,
+                                  without_proof))
+        signature = _hmac(stored_key, auth_message)
+        proof = base64.b64encode(_xor(client_key, signature))
+        server_key = _hmac(salted, b'Server Key')
+        self.server_signature = base64.b64encode(
+            _hmac(server_key, auth_message))
+        return without_proof + b',p=' + proof
+
+    def verify(self, server_final):
+        server_final = binary.to_bytes(server_final)
+        if not server_final.startswith(b'v=') or not hmac.compare_digest(
+                server_final[2:], self.server_signature or b''):
+            raise errors.ThrumError("SCRAM server signature doesn't match")
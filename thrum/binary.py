@@ -8,11 +8,94 @@ Pack and unpack data using network (big-endian) byte order per the Postgres
 wire protocol
 """
 
+import array
 import struct
+import sys
+
+from . import lru
 
 error = struct.error
 
 
+def array_typecode(typecode, size):
+    """
+    Return 'typecode' if array.array supports it with items of 'size' bytes,
+    else None, e.g. for 'q' on Python 2
+    """
+    try:
+        if array.array(typecode).itemsize == size:
+            return typecode
+    except ValueError:
+        pass
+    return None
+
+
+# tostring and fromstring were renamed in Python 3
+if hasattr(array.array, 'tobytes'):
+    array_tobytes = array.array.tobytes
+    array_frombytes = array.array.frombytes
+else:
+    def array_tobytes(arr):
+        return arr.tostring()
+
+    def array_frombytes(arr, data):
+        arr.fromstring(to_bytes(data))
+
+
+try:
+    memoryview(b'ab')[::2]
+    strided_views = True
+except NotImplementedError:
+    # Python 2 memoryviews can't be sliced with a step
+    strided_views = False
+
+
+if bytes(memoryview(b'a')) == b'a':
+    to_bytes = bytes
+else:
+    def to_bytes(data):
+        """
+        Return a copy of 'data' (bytes, a bytearray or a memoryview) as
+        bytes. On Python 2 bytes() of a memoryview is its repr
+        """
+        if isinstance(data, memoryview):
+            return data.tobytes()
+        return bytes(data)
+
+
+class StructCache(lru.LRUCache):
+    '''
+    Size-bounded LRU cache of compiled struct.Struct objects keyed by format
+    string, so that a layout which is not one of the precompiled ones below
+    is only compiled once while it remains in use, e.g.:
+
+    struc = structs.get_struct('ihq')
+    (1, 2, 3) = struc.unpack_from(bytes)
+
+    Formats without a byte order prefix are taken to be network (big-endian)
+    byte order.
+    '''
+
+    def get_struct(self, fmt):
+        struc = self.get(fmt)
+        if struc is None:
+            if fmt[:1] in ('!', '>', '<', '=', '@'):
+                struc = struct.Struct(fmt)
+            else:
+                struc = struct.Struct('!' + fmt)
+            self[fmt] = struc
+        return struc
+
+    def get_pack(self, fmt):
+        return self.get_struct(fmt).pack
+
+    def get_unpack(self, fmt):
+        return self.get_struct(fmt).unpack_from
+
+
+structs = StructCache(maxsize=512)
+
+
 class Cache(object):
     '''
     Cache for pack/unpack methods, e.g. to unpack bytes representing a sequence
@@ -67,19 +150,24 @@ class Cache(object):
 
     @classmethod
     def get_pack_shorts_for_index(cls, index):
-        if index not in cls.pack_shorts:
-            packer, unpacker = cls._create_func_pair(index, 'h')
-            return packer
+        try:
+            return cls.pack_shorts[index]
+        except KeyError:
+            return structs.get_struct('!' + (index * 'h')).pack
 
-        return cls.pack_shorts[index]
+    @classmethod
+    def get_unpack_shorts_for_index(cls, index):
+        try:
+            return cls.unpack_shorts[index]
+        except KeyError:
+            return structs.get_struct('!' + (index * 'h')).unpack_from
 
     @classmethod
     def get_unpack_ints_for_index(cls, index):
-        if index not in cls.unpack_ints:
-            packer, unpacker = cls._create_func_pair(index, 'i')
-            return unpacker
-
-        return cls.unpack_ints[index]
+        try:
+            return cls.unpack_ints[index]
+        except KeyError:
+            return structs.get_struct('!' + (index * 'i')).unpack_from
 
 
 Cache.init()
@@ -136,3 +224,188 @@ B_pack, B_unpack = _pack_funcs('B')
 Bi_pack, Bi_unpack = _pack_funcs('Bi')
 BBBB_pack, BBBB_unpack = _pack_funcs('BBBB')
 BBBBBB_pack, BBBBBB_unpack = _pack_funcs('BBBBBB')
+
+
+class Arrays(object):
+    '''
+    Encode and decode the Postgres binary array format:
+
+    int32 ndim, int32 has_null flag, int32 element type OID,
+    ndim x (int32 dimension size, int32 lower bound),
+    then each element as an int32 length (-1 for NULL) followed by its bytes
+
+    Arrays of int2/int4/int8/float4/float8 without NULLs take a fast path
+    that gathers and byte-swaps every element with a fixed number of calls
+    into array.array, regardless of the number of elements. Those values are
+    returned as an array.array; anything else is returned as a list with
+    None for NULL (and the raw bytes of elements of other types), e.g.:
+
+    data = Arrays.pack(array.array('q', range(100000)), constants.INT8OID)
+    (element_oid, dims, lower_bounds, values) = Arrays.unpack(data)
+    '''
+    layouts = {}
+
+    _swap = sys.byteorder == 'little'
+    _ready = False
+
+    @classmethod
+    def init(cls):
+        if cls._ready:
+            return
+        # constants imports this module, so it can't be imported at the top
+        from . import constants
+        for oid, typecode, fmt in ((constants.INT2OID, 'h', 'h'),
+                                   (constants.INT4OID, 'i', 'i'),
+                                   (constants.INT8OID, 'q', 'q'),
+                                   (constants.FLOAT4OID, 'f', 'f'),
+                                   (constants.FLOAT8OID, 'd', 'd')):
+            struc = struct.Struct('!' + fmt)
+            typecode = array_typecode(typecode, struc.size)
+            cls.layouts[oid] = (typecode, struc.size, struc.pack,
+                                struc.unpack_from)
+        cls._null = constants.NULL
+        cls._ready = True
+
+    @classmethod
+    def pack(cls, values, element_oid, dims=None, lower_bounds=None):
+        cls.init()
+        count = len(values)
+        if dims is None:
+            dims = (count,) if count else ()
+        if lower_bounds is None:
+            lower_bounds = (1,) * len(dims)
+
+        size = 1 if dims else 0
+        for dim in dims:
+            size *= dim
+        if size != count:
+            msg = "Array dimensions %s do not match %s values"
+            raise ValueError(msg % (tuple(dims), count))
+
+        layout = cls.layouts.get(element_oid)
+        has_null = not isinstance(values, array.array) and None in values
+        header = [iii_pack(len(dims), int(has_null), element_oid)]
+        for dim, lower_bound in zip(dims, lower_bounds):
+            header.append(ii_pack(dim, lower_bound))
+
+        if layout is not None and layout[0] is not None and not has_null:
+            header.append(cls._pack_fixed(values, layout))
+        else:
+            header.append(cls._pack_elements(values, layout))
+        return b''.join(header)
+
+    @classmethod
+    def _pack_fixed(cls, values, layout):
+        typecode, size, packer, unpacker = layout
+        count = len(values)
+        stride = size + 4
+        arr = array.array(typecode, values)
+        if cls._swap:
+            arr.byteswap()
+        raw = array_tobytes(arr)
+
+        buf = bytearray(count * stride)
+        length = i_pack(size)
+        for index in range(4):
+            buf[index::stride] = length[index:index + 1] * count
+        for index in range(size):
+            buf[4 + index::stride] = raw[index::size]
+        return bytes(buf)
+
+    @classmethod
+    def _pack_elements(cls, values, layout):
+        null = cls._null
+        rval = []
+        append = rval.append
+        if layout is not None:
+            length = i_pack(layout[1])
+            packer = layout[2]
+            for value in values:
+                if value is None:
+                    append(null)
+                else:
+                    append(length)
+                    append(packer(value))
+        else:
+            for value in values:
+                if value is None:
+                    append(null)
+                else:
+                    append(i_pack(len(value)))
+                    append(value)
+        return b''.join(rval)
+
+    @classmethod
+    def unpack(cls, data, offset=0, length=None):
+        cls.init()
+        if length is None:
+            end = len(data)
+        else:
+            end = offset + length
+
+        ndim, has_null, element_oid = iii_unpack(data, offset)
+        pos = offset + 12
+        if ndim:
+            bounds = Cache.get_unpack_ints_for_index(2 * ndim)(data, pos)
+            pos += 8 * ndim
+            dims = bounds[0::2]
+            lower_bounds = bounds[1::2]
+            count = 1
+            for dim in dims:
+                count *= dim
+        else:
+            dims = lower_bounds = ()
+            count = 0
+
+        layout = cls.layouts.get(element_oid)
+        if layout is not None and layout[0] is not None and not has_null:
+            values = cls._unpack_fixed(data, pos, end, count, layout)
+        else:
+            values = cls._unpack_elements(data, pos, end, count, layout)
+        return element_oid, dims, lower_bounds, values
+
+    @classmethod
+    def _unpack_fixed(cls, data, pos, end, count, layout):
+        typecode, size, packer, unpacker = layout
+        stride = size + 4
+        if end - pos != count * stride:
+            msg = "Array of %s x %s byte elements cannot fill %s bytes"
+            raise error(msg % (count, size, end - pos))
+
+        if not strided_views and isinstance(data, memoryview):
+            data = data[pos:end].tobytes()
+            end -= pos
+            pos = 0
+        raw = bytearray(count * size)
+        for index in range(size):
+            raw[index::size] = data[pos + 4 + index:end:stride]
+        values = array.array(typecode)
+        array_frombytes(values, raw)
+        if cls._swap:
+            values.byteswap()
+        return values
+
+    @classmethod
+    def _unpack_elements(cls, data, pos, end, count, layout):
+        values = []
+        append = values.append
+        unpacker = layout[3] if layout is not None else None
+        for _ in range(count):
+            length = i_unpack(data, pos)[0]
+            pos += 4
+            if length == -1:
+                append(None)
+                continue
+            if unpacker is not None:
+                append(unpacker(data, pos)[0])
+            else:
+                append(to_bytes(data[pos:pos + length]))
+            pos += length
+        if pos != end:
+            msg = "Array elements end at byte %s, expected %s"
+            raise error(msg % (pos, end))
+        return values
+
+
+array_pack = Arrays.pack
+array_unpack = Arrays.unpack
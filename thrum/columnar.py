@@ -0,0 +1,217 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Collect the DataRow messages of a result set into numpy arrays, one per
+column, rather than into a tuple of Python objects per row, e.g.:
+
+columns = rows.parse_row_description(row_description_payload)
+result = NumpyColumns(rows.row_key(columns))
+framer.dispatch({constants.DATA_ROW: result.feed, ...})
+ids, scores, names = result.columns()
+
+Binary fields of the fixed-width types (see rows.fixed_width, which includes
+any types added with rows.register_fixed_width) are collected into numpy
+arrays. When every column is fixed-width, DataRows are copied into a batch
+as they arrive and each batch is converted with a single numpy.frombuffer
+call using a structured big-endian dtype that describes the whole row, so no
+field is unpacked on its own. Other columns are decoded as rows.get_row_decoder
+would and collected into lists.
+
+Pipeline.execute and Cursor collect their rows this way when 'columnar' is
+set.
+
+numpy is an optional dependency, only needed by this module.
+"""
+
+from . import binary
+from . import constants
+from . import errors
+from . import rows as _rows
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+h_pack = binary.h_pack
+i_pack = binary.i_pack
+i_unpack = binary.i_unpack
+
+"""
+numpy dtypes for the struct format characters used in rows.fixed_width
+"""
+dtypes = {'?': '?',
+          'b': 'i1',
+          'B': 'u1',
+          'h': '>i2',
+          'H': '>u2',
+          'i': '>i4',
+          'I': '>u4',
+          'q': '>i8',
+          'Q': '>u8',
+          'f': '>f4',
+          'd': '>f8'}
+
+
+class NumpyColumns(object):
+    '''
+    Decode DataRow payloads with the column layout 'key' (as returned by
+    rows.row_key) into columns: a numpy.ma.MaskedArray in native byte order
+    for each fixed-width binary column, masked where the field is NULL, and
+    a list for each other column.
+
+    The payloads are copied, so they may be memoryviews of a buffer that is
+    reused afterwards.
+    '''
+
+    def __init__(self, key, batch_size=4096):
+        if numpy is None:
+            raise errors.ThrumError("numpy is not installed")
+        self.key = tuple(key)
+        self.batch_size = batch_size
+        self.row_count = 0
+        self.nulls = [[] for _ in self.key]
+
+        self._fields = []
+        self._raw = []
+        self._values = []
+        for type_oid, format_code in self.key:
+            struc = None
+            if format_code == constants.FC_BINARY:
+                struc = _rows.fixed_width.get(type_oid)
+            dtype = None
+            if struc is not None:
+                dtype = dtypes.get(struc.format[-1])
+            if dtype is not None:
+                self._fields.append((numpy.dtype(dtype), struc.size, None))
+                self._raw.append(bytearray())
+                self._values.append(None)
+            else:
+                decoder = None
+                if format_code == constants.FC_BINARY:
+                    decoder = _rows.binary_decoders.get(type_oid)
+                self._fields.append((None, None, decoder))
+                self._raw.append(None)
+                self._values.append([])
+
+        self._record = None
+        if self.key and all(raw is not None for raw in self._raw):
+            layout = [('count', '>i2')]
+            for index, (dtype, size, decoder) in enumerate(self._fields):
+                layout.append(('length%d' % (index,), '>i4'))
+                layout.append(('field%d' % (index,), dtype))
+            self._record = numpy.dtype(layout)
+            self._chunks = [[] for _ in self.key]
+            self._batch = bytearray()
+            self._batch_rows = 0
+
+    def feed(self, data):
+        """
+        Consume the payload of a DataRow message
+        """
+        if self._record is None:
+            self._parse_row(data)
+            return
+
+        if len(data) == self._record.itemsize:
+            self._batch += data
+        else:
+            # A fixed-width row is only ever shorter than the record when it
+            # has NULLs, so fill them with zeros to keep the batch uniform
+            self._batch += self._fill_nulls(data)
+        self._batch_rows += 1
+        self.row_count += 1
+        if self._batch_rows >= self.batch_size:
+            self._flush()
+
+    def _fill_nulls(self, data):
+        count = binary.h_unpack(data)[0]
+        if count != len(self._fields):
+            msg = "DataRow has %s fields, expected %s"
+            raise errors.ThrumError(msg % (count, len(self._fields)))
+        parts = [h_pack(count)]
+        pos = 2
+        row = self.row_count
+        for column, (dtype, size, decoder) in enumerate(self._fields):
+            length = i_unpack(data, pos)[0]
+            pos += 4
+            if length < 0:
+                self.nulls[column].append(row)
+                parts.append(i_pack(size))
+                parts.append(b'\x00' * size)
+            else:
+                parts.append(bytes(data[pos - 4:pos + length]))
+                pos += length
+        return b''.join(parts)
+
+    def _flush(self):
+        if not self._batch_rows:
+            return
+        records = numpy.frombuffer(self._batch, self._record)
+        for index, (dtype, size, decoder) in enumerate(self._fields):
+            field = records['field%d' % (index,)]
+            self._chunks[index].append(field.astype(dtype.newbyteorder('=')))
+        self._batch = bytearray()
+        self._batch_rows = 0
+
+    def _parse_row(self, data):
+        count = binary.h_unpack(data)[0]
+        if count != len(self._fields):
+            msg = "DataRow has %s fields, expected %s"
+            raise errors.ThrumError(msg % (count, len(self._fields)))
+        pos = 2
+        row = self.row_count
+        nulls = self.nulls
+        raw = self._raw
+        values = self._values
+        for column, (dtype, size, decoder) in enumerate(self._fields):
+            length = i_unpack(data, pos)[0]
+            pos += 4
+            if length < 0:
+                nulls[column].append(row)
+                if dtype is None:
+                    values[column].append(None)
+                else:
+                    raw[column] += b'\x00' * size
+                continue
+            if dtype is not None:
+                raw[column] += data[pos:pos + length]
+            elif decoder is not None:
+                values[column].append(decoder(data, pos, length))
+            else:
+                values[column].append(bytes(data[pos:pos + length]))
+            pos += length
+        self.row_count = row + 1
+
+    def columns(self):
+        """
+        Return the decoded columns
+        """
+        if self._record is not None:
+            self._flush()
+        rval = []
+        for index, (dtype, size, decoder) in enumerate(self._fields):
+            if dtype is None:
+                rval.append(self._values[index])
+                continue
+            native = dtype.newbyteorder('=')
+            if self._record is not None:
+                chunks = self._chunks[index]
+                if len(chunks) == 1:
+                    column = chunks[0]
+                elif chunks:
+                    column = numpy.concatenate(chunks)
+                else:
+                    column = numpy.zeros(0, native)
+            else:
+                column = numpy.frombuffer(self._raw[index], dtype)
+                column = column.astype(native)
+            mask = numpy.ma.nomask
+            if self.nulls[index]:
+                mask = numpy.zeros(len(column), bool)
+                mask[self.nulls[index]] = True
+            rval.append(numpy.ma.MaskedArray(column, mask))
+        return rval
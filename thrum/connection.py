@@ -0,0 +1,324 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+The state of one connection to the backend, independent of any event loop:
+startup and authentication, the backend's parameters, its transaction status
+and the queue of operations (e.g. pipeline.Pipeline) whose responses have not
+all arrived yet.
+
+An event loop specific protocol creates a Connection, calls
+connection_made(transport) with anything that has a write(bytes) method,
+passes every chunk of received data to data_received() and calls
+connection_lost() at the end, e.g.:
+
+conn = Connection(user=u'postgres', database=u'test', password=u'secret')
+conn.startup_callbacks.append(on_startup)   # on_startup(conn, error)
+conn.connection_made(transport)
+...
+pipe = conn.pipeline()
+result = pipe.execute(u'SELECT 1')
+pipe.callbacks.append(on_done)
+conn.send(pipe)
+
+Operations are sent as soon as they are given to send() and their responses
+are handled in the order they were sent, each operation ending with the
+ReadyForQuery that answers its Sync. The exception is an operation whose
+'exclusive' attribute is set, such as a cursor.Cursor, which keeps talking
+to the backend until it sends its Sync: operations sent after it wait until
+it has finished. Operations sent before startup has finished wait for the
+ReadyForQuery that ends it.
+
+The startup packet asks for a client_encoding of UTF8 unless 'parameters'
+gives another. 'codec' is the textcodec.TextCodec for the client_encoding
+that the backend reports, which the pipelines and cursors that the
+connection creates encode SQL and text parameters with. With 'decode_text'
+set they also decode text columns with it, a batch at a time; otherwise
+they're returned as bytes.
+"""
+
+from collections import deque
+
+from . import auth
+from . import binary
+from . import constants
+from . import cursor
+from . import errors
+from . import framing
+from . import messages
+from . import notices
+from . import pipeline
+from . import statements
+from . import textcodec
+
+i_unpack = binary.i_unpack
+ii_unpack = binary.ii_unpack
+
+
+class Connection(object):
+    '''
+    Protocol state for one connection. 'transaction_status' is the status
+    byte from the latest ReadyForQuery (constants.IDLE,
+    IDLE_IN_TRANSACTION or IDLE_IN_FAILED_TRANSACTION) and 'parameters'
+    holds what the backend has reported with ParameterStatus.
+    '''
+
+    def __init__(self, user, database=None, password=None, parameters=None,
+                 statement_cache_size=256, decode_text=False):
+        self.user = user
+        self.password = password
+        self.startup_parameters = {u'user': user,
+                                   u'client_encoding': u'UTF8'}
+        if database is not None:
+            self.startup_parameters[u'database'] = database
+        if parameters:
+            self.startup_parameters.update(parameters)
+
+        self.statements = None
+        if statement_cache_size:
+            self.statements = statements.StatementCache(statement_cache_size)
+
+        self.transport = None
+        self.framer = framing.MessageFramer()
+        self.parameters = {}
+        self.codec = textcodec.get_codec(
+            self.startup_parameters[u'client_encoding'])
+        self.decode_text = decode_text
+        self.backend_pid = None
+        self.backend_secret = None
+        self.transaction_status = None
+        self.ready = False
+        self.closed = False
+        self.error = None
+
+        # Called with (connection, error or None) when startup finishes
+        self.startup_callbacks = []
+        # Called with a notices.Notice for each NoticeResponse
+        self.notice_callbacks = []
+        # Called with (pid, channel, payload) for each NotificationResponse
+        self.notification_callbacks = []
+        # Called with the connection after each ReadyForQuery
+        self.ready_callbacks = []
+
+        self._operations = deque()
+        self._waiting = deque()
+        self._scram = None
+
+        self._base_handlers = {
+            constants.AUTHENTICATION_REQUEST: self.authentication_request,
+            constants.PARAMETER_STATUS: self.parameter_status,
+            constants.BACKEND_KEY_DATA: self.backend_key_data,
+            constants.NOTICE_RESPONSE: self.notice_response,
+            constants.NOTIFICATION_RESPONSE: self.notification_response,
+            constants.READY_FOR_QUERY: self.ready_for_query,
+            constants.ERROR_RESPONSE: self.error_response,
+        }
+        self._handlers = self._base_handlers
+
+    def __len__(self):
+        """
+        The number of operations waiting for responses
+        """
+        return len(self._operations) + len(self._waiting)
+
+    @property
+    def idle(self):
+        """
+        True if the connection is ready, not waiting for anything and not in
+        a transaction
+        """
+        return (self.ready and not self.closed and not self._operations and
+                self.transaction_status == constants.IDLE)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        writer = messages.MessageWriter()
+        writer.startup(self.startup_parameters)
+        writer.write_to(transport)
+
+    def data_received(self, data):
+        framer = self.framer
+        framer.feed(data)
+        for code, payload in framer:
+            handler = self._handlers.get(code)
+            if handler is None:
+                raise errors.ThrumError("Unexpected message %r" % (code,))
+            handler(payload)
+
+    def connection_lost(self, reason=None):
+        if self.closed:
+            return
+        self.closed = True
+        error = errors.ThrumError("Connection lost: %s" % (reason,))
+        if self.statements is not None:
+            self.statements.clear()
+        if not self.ready:
+            self._startup_finished(error)
+        operations = self._operations
+        operations.extend(self._waiting)
+        self._operations = deque()
+        self._waiting = deque()
+        self._handlers = self._base_handlers
+        for operation in operations:
+            operation.abort(error)
+
+    def pipeline(self):
+        """
+        Return a new Pipeline that uses this connection's statement cache
+        """
+        return pipeline.Pipeline(statements=self.statements,
+                                 codec=self.codec,
+                                 decode_text=self.decode_text)
+
+    def cursor(self, sql, params=(), type_oids=(), fetch_size=1000,
+               adaptive=True, columnar=False):
+        """
+        Return a new Cursor that uses this connection's statement cache. It
+        still has to be sent.
+        """
+        return cursor.Cursor(sql, params, type_oids, fetch_size,
+                             statements=self.statements, adaptive=adaptive,
+                             codec=self.codec, decode_text=self.decode_text,
+                             columnar=columnar)
+
+    def send(self, operation):
+        """
+        Write 'operation' and queue it to receive its responses, or hold it
+        back until startup or an exclusive operation has finished
+        """
+        if self.closed:
+            raise errors.ThrumError("Connection is closed")
+        operations = self._operations
+        if not self.ready or self._waiting or (operations and
+                                               operations[-1].exclusive):
+            self._waiting.append(operation)
+            return
+        self._write(operation)
+
+    def _write(self, operation):
+        self._operations.append(operation)
+        if len(self._operations) == 1:
+            self._update_handlers()
+        operation.write_to(self.transport)
+
+    def _send_waiting(self):
+        waiting = self._waiting
+        while waiting and not self.closed:
+            operation = waiting.popleft()
+            self._write(operation)
+            if operation.exclusive:
+                break
+
+    def terminate(self):
+        """
+        Tell the backend we're closing the connection
+        """
+        if self.transport is not None and not self.closed:
+            self.transport.write(constants.TERMINATE_MSG)
+
+    def _update_handlers(self):
+        if not self._operations:
+            self._handlers = self._base_handlers
+            return
+        handlers = dict(self._operations[0].handlers)
+        handlers.update(self._base_handlers)
+        self._handlers = handlers
+
+    def _startup_finished(self, error):
+        self.error = error
+        callbacks = self.startup_callbacks
+        self.startup_callbacks = []
+        for callback in callbacks:
+            callback(self, error)
+
+    def authentication_request(self, payload):
+        kind = i_unpack(payload)[0]
+        if kind == constants.AUTH_OK:
+            return
+        writer = messages.MessageWriter(256)
+        if kind == constants.AUTH_CLEARTEXT_PASSWORD:
+            writer.password(self._password())
+        elif kind == constants.AUTH_MD5_PASSWORD:
+            salt = bytes(payload[4:8])
+            writer.password(auth.md5_password(self.user, self._password(),
+                                              salt))
+        elif kind == constants.AUTH_SASL:
+            mechanisms = bytes(payload[4:]).split(b'\x00')
+            if auth.SCRAM_SHA_256 not in mechanisms:
+                raise errors.ThrumError("No supported SASL mechanism in %r" %
+                                        (mechanisms,))
+            self._scram = auth.ScramSHA256(self._password())
+            writer.sasl_initial_response(auth.SCRAM_SHA_256,
+                                         self._scram.client_first())
+        elif kind == constants.AUTH_SASL_CONTINUE:
+            writer.sasl_response(self._scram.client_final(payload[4:]))
+        elif kind == constants.AUTH_SASL_FINAL:
+            self._scram.verify(payload[4:])
+            self._scram = None
+            return
+        else:
+            raise errors.ThrumError("Unsupported authentication request %s"
+                                    % (kind,))
+        writer.write_to(self.transport)
+
+    def _password(self):
+        if self.password is None:
+            raise errors.ThrumError("The backend requires a password")
+        return self.password
+
+    def parameter_status(self, payload):
+        name, value = bytes(payload).split(b'\x00')[:2]
+        decode = self.codec.decode
+        name = decode(name)
+        value = decode(value)
+        self.parameters[name] = value
+        if name == u'client_encoding':
+            self.codec = textcodec.get_codec(value)
+
+    def backend_key_data(self, payload):
+        self.backend_pid, self.backend_secret = ii_unpack(payload)
+
+    def notice_response(self, payload):
+        if self.notice_callbacks:
+            notice = notices.Notice(bytes(payload))
+            for callback in self.notice_callbacks:
+                callback(notice)
+
+    def notification_response(self, payload):
+        if self.notification_callbacks:
+            pid = i_unpack(payload)[0]
+            channel, text = bytes(payload[4:]).split(b'\x00')[:2]
+            decode = self.codec.decode
+            channel = decode(channel)
+            text = decode(text)
+            for callback in self.notification_callbacks:
+                callback(pid, channel, text)
+
+    def error_response(self, payload):
+        if self._operations:
+            self._operations[0].handlers[constants.ERROR_RESPONSE](payload)
+            return
+        # An error outside of any operation ends the connection, e.g. bad
+        # credentials during startup or the backend shutting down
+        error = errors.from_payload(payload)
+        if not self.ready:
+            self._startup_finished(error)
+        self.error = error
+
+    def ready_for_query(self, payload):
+        self.transaction_status = bytes(payload[:1])
+        if not self._operations:
+            if not self.ready:
+                self.ready = True
+                self._startup_finished(None)
+                self._send_waiting()
+        else:
+            operation = self._operations.popleft()
+            self._update_handlers()
+            operation.handlers[constants.READY_FOR_QUERY](payload)
+            if operation.exclusive:
+                self._send_waiting()
+        for callback in self.ready_callbacks:
+            callback(self)
@@ -21,12 +21,57 @@ PGSQL_AF_INET6 = 3  # IPv6
 NUMERIC_POS = 0x0000
 NUMERIC_NEG = 0x4000
 NUMERIC_NAN = 0xC000
+NUMERIC_PINF = 0xD000
+NUMERIC_NINF = 0xF000
+
+# Type OIDs from the pg_type table
+BOOLOID = 16
+BYTEAOID = 17
+CHAROID = 18
+NAMEOID = 19
+INT8OID = 20
+INT2OID = 21
+INT4OID = 23
+TEXTOID = 25
+OIDOID = 26
+POINTOID = 600
+LSEGOID = 601
+PATHOID = 602
+BOXOID = 603
+POLYGONOID = 604
+CIDROID = 650
+FLOAT4OID = 700
+FLOAT8OID = 701
+CIRCLEOID = 718
+MACADDR8OID = 774
+MACADDROID = 829
+INETOID = 869
+BPCHAROID = 1042
+VARCHAROID = 1043
+DATEOID = 1082
+TIMEOID = 1083
+TIMESTAMPOID = 1114
+TIMESTAMPTZOID = 1184
+INTERVALOID = 1186
+NUMERICOID = 1700
+TSVECTOROID = 3614
+
+INT2ARRAYOID = 1005
+INT4ARRAYOID = 1007
+INT8ARRAYOID = 1016
+FLOAT4ARRAYOID = 1021
+FLOAT8ARRAYOID = 1022
+NUMERICARRAYOID = 1231
 
 # Default protocol version
 VERSION_MAJOR = 3
 VERSION_MINOR = 0
 DEFAULT_PROTOCOL_VERSION = (VERSION_MAJOR << 16) | VERSION_MINOR
 
+# Codes sent in place of the protocol version in the startup packet
+CANCEL_REQUEST_CODE = 80877102
+SSL_REQUEST_CODE = 80877103
+
 # Message codes
 NOTICE_RESPONSE = b'N'
 AUTHENTICATION_REQUEST = b'R'
@@ -59,12 +104,25 @@ PASSWORD = b'p'
 DESCRIBE = b'D'
 TERMINATE = b'X'
 CLOSE = b'C'
+QUERY = b'Q'
+COPY_FAIL = b'f'
 
 FLUSH_MSG = FLUSH + binary.i_pack(4)
 SYNC_MSG = SYNC + binary.i_pack(4)
 TERMINATE_MSG = TERMINATE + binary.i_pack(4)
 COPY_DONE_MSG = COPY_DONE + binary.i_pack(4)
 
+# AuthenticationRequest types
+AUTH_OK = 0
+AUTH_KERBEROS_V5 = 2
+AUTH_CLEARTEXT_PASSWORD = 3
+AUTH_MD5_PASSWORD = 5
+AUTH_GSS = 7
+AUTH_SSPI = 9
+AUTH_SASL = 10
+AUTH_SASL_CONTINUE = 11
+AUTH_SASL_FINAL = 12
+
 # DESCRIBE constants
 STATEMENT = b'S'
 PORTAL = b'P'
@@ -148,11 +206,13 @@ pg_to_py = {
 
     # Different name:
     'euc_cn': 'gb2312',
-    'iso_8859_5': 'is8859_5',
-    'iso_8859_6': 'is8859_6',
-    'iso_8859_7': 'is8859_7',
-    'iso_8859_8': 'is8859_8',
+    'iso_8859_5': 'iso8859_5',
+    'iso_8859_6': 'iso8859_6',
+    'iso_8859_7': 'iso8859_7',
+    'iso_8859_8': 'iso8859_8',
     'koi8': 'koi8_r',
+    'koi8r': 'koi8_r',
+    'koi8u': 'koi8_u',
     'latin1': 'iso8859-1',
     'latin2': 'iso8859_2',
     'latin3': 'iso8859_3',
@@ -163,7 +223,7 @@ pg_to_py = {
     'latin8': 'iso8859_14',
     'latin9': 'iso8859_15',
     'sql_ascii': 'ascii',
-    'win866': 'cp886',
+    'win866': 'cp866',
     'win874': 'cp874',
     'win1250': 'cp1250',
     'win1251': 'cp1251',
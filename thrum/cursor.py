@@ -0,0 +1,318 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Stream the rows of a query in batches through a portal, so a result of any
+size can be consumed in bounded memory, e.g.:
+
+cur = Cursor(u'SELECT * FROM big WHERE x > $1', (0,), (constants.INT4OID,))
+conn.send(cur)
+cur.request(on_batch)   # on_batch(cursor, rows) once the first batch is in
+...
+cur.request(on_batch)   # ask for the next batch only when ready for it
+
+Each batch is one Execute with a row limit followed by a Flush instead of a
+Sync, so the portal stays open and the backend waits, holding nothing but
+the portal's state, until the next Execute. PortalSuspended ends each batch
+while there are more rows, and CommandComplete ends the last, which is
+always delivered and may be empty; after it request() delivers [] forever.
+Once the cursor is exhausted, fails or is closed it sends its Sync and the
+connection moves on.
+
+While the portal is open the backend can't be sent anything else, so a
+Cursor is an exclusive operation: the connection holds back operations sent
+after it until it has finished.
+
+With 'adaptive' set, the fetch size follows the consumer: it doubles when
+the consumer asks for the next batch sooner than the previous batch took
+to arrive, since the round trips are then what it's waiting for, and halves
+when the consumer takes much longer than that, since bigger batches would
+only cost memory.
+
+SQL and text parameters are encoded with 'codec', the textcodec.TextCodec
+for the connection's client_encoding, or as UTF-8 without one. With
+'decode_text' set, the cursor also decodes the text columns of each batch
+with it before delivering the batch.
+
+With 'columnar' set, the DataRows of each batch are collected into a
+columnar.NumpyColumns rather than decoded into rows, and a batch with rows
+in it is delivered as the list of its columns. An empty batch is still [].
+"""
+
+import time
+
+from . import columnar as _columnar
+from . import constants
+from . import errors
+from . import messages
+from . import rows as _rows
+from . import textcodec
+
+
+class Cursor(object):
+    '''
+    One query streamed through the unnamed portal. 'columns' is its
+    RowDescription, 'command_tag' its CommandComplete, 'rowcount' the number
+    of rows delivered so far and 'error' the error that ended it, if any.
+    'done' is set, and each function in 'callbacks' is called with the
+    cursor, when the ReadyForQuery for its Sync arrives.
+    '''
+
+    exclusive = True
+
+    def __init__(self, sql, params=(), type_oids=(), fetch_size=1000,
+                 statements=None, adaptive=True, min_fetch_size=100,
+                 max_fetch_size=100000, clock=time.time, codec=None,
+                 decode_text=False, columnar=False):
+        type_oids = tuple(type_oids)
+        if len(params) != len(type_oids):
+            msg = "%s parameters given for %s types"
+            raise errors.ThrumError(msg % (len(params), len(type_oids)))
+        if columnar and _columnar.numpy is None:
+            raise errors.ThrumError("numpy is not installed")
+        if fetch_size < 1:
+            raise ValueError("Bad fetch size %s" % (fetch_size,))
+        self.sql = sql
+        self.params = params
+        self.type_oids = type_oids
+        self.fetch_size = fetch_size
+        self.statements = statements
+        self.adaptive = adaptive
+        self.min_fetch_size = min(min_fetch_size, fetch_size)
+        self.max_fetch_size = max(max_fetch_size, fetch_size)
+        self.clock = clock
+        if codec is None:
+            codec = textcodec.get_codec(u'UTF8')
+        self.codec = codec
+        self.decode_text = decode_text
+        self.columnar = columnar
+
+        self.transport = None
+        self.columns = None
+        self.decode_row = None
+        self.command_tag = None
+        self.error = None
+        self.rowcount = 0
+        self.suspended = False
+        self.complete = False
+        self.closing = False
+        self.synced = False
+        self.done = False
+        self.transaction_status = None
+        self.callbacks = []
+
+        self._rows = []
+        self._collector = None
+        self._held = None
+        self._waiter = None
+        self._requested_at = None
+        self._arrived_at = None
+        self._round_trip = None
+
+        self.handlers = {
+            constants.PARSE_COMPLETE: self.parse_complete,
+            constants.BIND_COMPLETE: self.bind_complete,
+            constants.CLOSE_COMPLETE: self.close_complete,
+            constants.ROW_DESCRIPTION: self.row_description,
+            constants.NO_DATA: self.no_data,
+            constants.DATA_ROW: self.data_row,
+            constants.PORTAL_SUSPENDED: self.portal_suspended,
+            constants.COMMAND_COMPLETE: self.command_complete,
+            constants.EMPTY_QUERY_RESPONSE: self.empty_query_response,
+            constants.ERROR_RESPONSE: self.error_response,
+            constants.READY_FOR_QUERY: self.ready_for_query,
+        }
+
+    @property
+    def finished(self):
+        """
+        True once no more rows will be delivered
+        """
+        return self.complete or self.closing or self.error is not None
+
+    def write_to(self, transport):
+        """
+        Bind the portal and request the first batch
+        """
+        self.transport = transport
+        writer = messages.MessageWriter(codec=self.codec)
+        statement = None
+        if self.statements is not None:
+            statement = self.statements.get(self.sql, self.type_oids)
+        if statement is not None and statement.described:
+            self.columns = statement.columns
+            self.decode_row = statement.decode_row
+            name = statement.name
+        else:
+            writer.parse(b'', self.sql, self.type_oids)
+            name = b''
+        params = _rows.get_row_encoder(self.type_oids, self.codec)(
+            self.params)
+        writer.bind(b'', name, params)
+        if not name:
+            writer.describe(constants.PORTAL, b'')
+        self._execute(writer)
+
+    def _execute(self, writer):
+        writer.execute(b'', self.fetch_size)
+        writer.flush()
+        self._requested_at = self.clock()
+        writer.write_to(self.transport)
+
+    def request(self, callback):
+        """
+        Ask for the next batch. callback(cursor, rows) is called when it has
+        arrived, which may be at once; if cursor.error is set the rows are
+        empty and the cursor has failed.
+        """
+        if self._waiter is not None:
+            raise errors.ThrumError("A batch has already been requested")
+        if self._held is not None:
+            rows = self._held
+            self._held = None
+            callback(self, rows)
+        elif self.finished:
+            callback(self, [])
+        else:
+            self._waiter = callback
+            if self.suspended:
+                self._adapt()
+                self.suspended = False
+                self._execute(messages.MessageWriter(64))
+
+    def _adapt(self):
+        if not self.adaptive or self._round_trip is None:
+            return
+        waited = self.clock() - self._arrived_at
+        if waited < self._round_trip:
+            self.fetch_size = min(self.fetch_size * 2, self.max_fetch_size)
+        elif waited > self._round_trip * 4:
+            self.fetch_size = max(self.fetch_size // 2, self.min_fetch_size)
+
+    def close(self):
+        """
+        Stop fetching. A pending request() gets [] when the cursor is done.
+        """
+        if self.finished:
+            return
+        self.closing = True
+        if self.suspended:
+            self._sync(close=True)
+        self._held = None
+
+    def _sync(self, close=False):
+        if self.synced:
+            return
+        self.synced = True
+        writer = messages.MessageWriter(64)
+        if close:
+            writer.close(constants.PORTAL, b'')
+        writer.sync()
+        writer.write_to(self.transport)
+
+    def _deliver(self, rows):
+        callback = self._waiter
+        if callback is None:
+            self._held = rows
+            return
+        self._waiter = None
+        callback(self, rows)
+
+    def parse_complete(self, payload):
+        pass
+
+    def bind_complete(self, payload):
+        pass
+
+    def close_complete(self, payload):
+        pass
+
+    def row_description(self, payload):
+        # The portal's RowDescription has the result formats we asked for
+        self.columns = _rows.parse_row_description(payload)
+        self.decode_row = _rows.get_row_decoder(_rows.row_key(self.columns),
+                                                self.codec)
+
+    def no_data(self, payload):
+        pass
+
+    def data_row(self, payload):
+        if self.decode_row is None:
+            raise errors.ThrumError("Unexpected DataRow in cursor")
+        if self.columnar:
+            if self._collector is None:
+                self._collector = _columnar.NumpyColumns(
+                    _rows.row_key(self.columns))
+            self._collector.feed(payload)
+            return
+        self._rows.append(self.decode_row(payload))
+
+    def _batch_arrived(self):
+        if self.columnar:
+            rows = []
+            if self._collector is not None:
+                rows = self._collector.columns()
+                self.rowcount += self._collector.row_count
+                self._collector = None
+        else:
+            rows = self._rows
+            self._rows = []
+            if self.decode_text and rows:
+                rows = self.codec.decode_rows(rows, self.columns)
+            self.rowcount += len(rows)
+        now = self.clock()
+        self._round_trip = now - self._requested_at
+        self._arrived_at = now
+        return rows
+
+    def portal_suspended(self, payload):
+        rows = self._batch_arrived()
+        self.suspended = True
+        if self.closing:
+            self._sync(close=True)
+            return
+        self._deliver(rows)
+
+    def command_complete(self, payload):
+        self.command_tag = bytes(payload[:-1])
+        rows = self._batch_arrived()
+        self.complete = True
+        self._sync()
+        if not self.closing:
+            self._deliver(rows)
+
+    def empty_query_response(self, payload):
+        self.command_complete(b'\x00')
+
+    def error_response(self, payload):
+        self._rows = []
+        self._collector = None
+        self.error = errors.from_payload(payload)
+        self._held = None
+        # The backend discards everything up to the Sync
+        self._sync()
+        self._deliver([])
+
+    def abort(self, error):
+        """
+        Fail the cursor, e.g. because the connection was lost, and finish it
+        """
+        if self.done:
+            return
+        if self.error is None:
+            self.error = error
+        self._held = None
+        self.done = True
+        self._deliver([])
+        for callback in self.callbacks:
+            callback(self)
+
+    def ready_for_query(self, payload):
+        self.transaction_status = bytes(payload[:1])
+        self.done = True
+        if self._waiter is not None:
+            self._deliver([])
+        for callback in self.callbacks:
+            callback(self)
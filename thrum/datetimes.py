@@ -0,0 +1,215 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Convert between the datetime module and the binary formats of the Postgres
+date/time types, which count from the Postgres epoch of 2000-01-01:
+
+date                    int32 days
+time                    int64 microseconds since midnight
+timestamp/timestamptz   int64 microseconds (timestamptz in UTC)
+interval                int64 microseconds, int32 days, int32 months
+
+The *_recv_raw functions return those integers without building datetime
+objects. To get them for whole result sets or COPY exports, where they are
+then unpacked along with the other fixed-width columns, register the types as
+fixed-width:
+
+for type_oid, fmt in datetimes.raw_formats.items():
+    rows.register_fixed_width(type_oid, fmt)
+
+Add UNIX_EPOCH_USEC to a raw timestamp to count from 1970-01-01 instead.
+"""
+
+import datetime
+
+from . import binary
+from . import constants
+
+date = datetime.date
+time = datetime.time
+timedelta = datetime.timedelta
+
+
+class UTC(datetime.tzinfo):
+    '''
+    The UTC tzinfo, for Python 2, which has no datetime.timezone
+    '''
+
+    _zero = timedelta(0)
+
+    def utcoffset(self, dt):
+        return self._zero
+
+    def dst(self, dt):
+        return self._zero
+
+    def tzname(self, dt):
+        return 'UTC'
+
+    def __repr__(self):
+        return 'UTC'
+
+
+try:
+    utc = datetime.timezone.utc
+except AttributeError:
+    utc = UTC()
+
+i_pack = binary.i_pack
+i_unpack = binary.i_unpack
+q_pack = binary.q_pack
+q_unpack = binary.q_unpack
+qii_pack = binary.qii_pack
+qii_unpack = binary.qii_unpack
+
+USEC_PER_SEC = 1000000
+USEC_PER_DAY = 86400 * USEC_PER_SEC
+
+POSTGRES_EPOCH_DATE = date(2000, 1, 1)
+POSTGRES_EPOCH_DATETIME = datetime.datetime(2000, 1, 1)
+POSTGRES_EPOCH_DATETIME_UTC = datetime.datetime(2000, 1, 1, tzinfo=utc)
+POSTGRES_EPOCH_ORDINAL = POSTGRES_EPOCH_DATE.toordinal()
+
+# Microseconds from the Unix epoch to the Postgres epoch
+UNIX_EPOCH_USEC = (POSTGRES_EPOCH_ORDINAL -
+                   date(1970, 1, 1).toordinal()) * USEC_PER_DAY
+
+# 'infinity' and '-infinity'
+DATE_INFINITY = constants.MAX_INT4
+DATE_NEG_INFINITY = constants.MIN_INT4
+TIMESTAMP_INFINITY = constants.MAX_INT8
+TIMESTAMP_NEG_INFINITY = constants.MIN_INT8
+
+raw_formats = {constants.DATEOID: 'i',
+               constants.TIMEOID: 'q',
+               constants.TIMESTAMPOID: 'q',
+               constants.TIMESTAMPTZOID: 'q'}
+
+_fromordinal = date.fromordinal
+_epoch_add = POSTGRES_EPOCH_DATETIME.__add__
+_epoch_utc_add = POSTGRES_EPOCH_DATETIME_UTC.__add__
+
+
+def date_recv_raw(data, offset=0, length=None):
+    return i_unpack(data, offset)[0]
+
+
+def date_recv(data, offset=0, length=None):
+    days = i_unpack(data, offset)[0]
+    try:
+        return _fromordinal(days + POSTGRES_EPOCH_ORDINAL)
+    except (ValueError, OverflowError):
+        if days == DATE_INFINITY:
+            return date.max
+        if days == DATE_NEG_INFINITY:
+            return date.min
+        raise
+
+
+def date_send(value):
+    if value == date.max:
+        return i_pack(DATE_INFINITY)
+    if value == date.min:
+        return i_pack(DATE_NEG_INFINITY)
+    return i_pack(value.toordinal() - POSTGRES_EPOCH_ORDINAL)
+
+
+def time_recv_raw(data, offset=0, length=None):
+    return q_unpack(data, offset)[0]
+
+
+def time_recv(data, offset=0, length=None):
+    seconds, microseconds = divmod(q_unpack(data, offset)[0], USEC_PER_SEC)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours == 24:
+        # Postgres allows '24:00:00'
+        return time.max
+    return time(hours, minutes, seconds, microseconds)
+
+
+def time_send(value):
+    seconds = (value.hour * 60 + value.minute) * 60 + value.second
+    return q_pack(seconds * USEC_PER_SEC + value.microsecond)
+
+
+def timestamp_recv_raw(data, offset=0, length=None):
+    return q_unpack(data, offset)[0]
+
+
+def timestamp_recv(data, offset=0, length=None):
+    microseconds = q_unpack(data, offset)[0]
+    try:
+        return _epoch_add(timedelta(0, 0, microseconds))
+    except OverflowError:
+        if microseconds == TIMESTAMP_INFINITY:
+            return datetime.datetime.max
+        if microseconds == TIMESTAMP_NEG_INFINITY:
+            return datetime.datetime.min
+        raise
+
+
+def timestamptz_recv(data, offset=0, length=None):
+    microseconds = q_unpack(data, offset)[0]
+    try:
+        return _epoch_utc_add(timedelta(0, 0, microseconds))
+    except OverflowError:
+        if microseconds == TIMESTAMP_INFINITY:
+            return datetime.datetime.max.replace(tzinfo=utc)
+        if microseconds == TIMESTAMP_NEG_INFINITY:
+            return datetime.datetime.min.replace(tzinfo=utc)
+        raise
+
+
+def _timedelta_usec(delta):
+    return ((delta.days * 86400 + delta.seconds) * USEC_PER_SEC +
+            delta.microseconds)
+
+
+def timestamp_send(value):
+    """
+    Encode the wall time of 'value', ignoring any tzinfo
+    """
+    value = value.replace(tzinfo=None)
+    if value == datetime.datetime.max:
+        return q_pack(TIMESTAMP_INFINITY)
+    if value == datetime.datetime.min:
+        return q_pack(TIMESTAMP_NEG_INFINITY)
+    return q_pack(_timedelta_usec(value - POSTGRES_EPOCH_DATETIME))
+
+
+def timestamptz_send(value):
+    """
+    Encode 'value' in UTC. Naive datetimes are taken to be in UTC already.
+    """
+    if value.tzinfo is None:
+        return timestamp_send(value)
+    naive = value.replace(tzinfo=None)
+    if naive == datetime.datetime.max:
+        return q_pack(TIMESTAMP_INFINITY)
+    if naive == datetime.datetime.min:
+        return q_pack(TIMESTAMP_NEG_INFINITY)
+    return q_pack(_timedelta_usec(value - POSTGRES_EPOCH_DATETIME_UTC))
+
+
+def interval_recv_raw(data, offset=0, length=None):
+    """
+    Return (microseconds, days, months)
+    """
+    return qii_unpack(data, offset)
+
+
+def interval_recv(data, offset=0, length=None):
+    """
+    Return a timedelta, counting each month as 30 days
+    """
+    microseconds, days, months = qii_unpack(data, offset)
+    return timedelta(days + months * 30, 0, microseconds)
+
+
+def interval_send(value):
+    return qii_pack(value.seconds * USEC_PER_SEC + value.microseconds,
+                    value.days, 0)
@@ -3,16 +3,93 @@
 # Copyright (c) Dónal McMullan
 # See LICENSE for details.
 
+"""
+Exceptions, including a PostgresError subclass for each common SQLSTATE so
+that callers can catch by condition rather than compare codes, e.g.:
+
+try:
+    ...
+except errors.UniqueViolation:
+    ...         # 23505
+except errors.IntegrityError:
+    ...         # any other 23xxx
+
+from_payload() picks the class for an ErrorResponse by finding its SQLSTATE
+field and looking it up in 'sqlstate_errors', falling back to the class for
+the SQLSTATE's first two characters and then to PostgresError. The error
+keeps the payload and only parses the rest of its fields when one of them
+is first read, so an error that is caught and retried costs little more
+than the lookup.
+"""
+
+from . import binary
+
 
 class ThrumError(Exception):
     pass
 
 
+class PipelineAborted(ThrumError):
+    """
+    Set as the error of each statement in a pipeline that the backend skipped
+    because an earlier statement in the same pipeline failed
+    """
+
+
+def parse_fields(data):
+    """
+    Return a dict of the fields of an ErrorResponse or NoticeResponse
+    payload: pairs of a 1 byte field code and a NUL-terminated string
+    """
+    data = binary.to_bytes(data)
+    fields = {}
+    pos = 0
+    end = len(data)
+    while pos < end and data[pos:pos + 1] != b'\x00':
+        following = data.index(b'\x00', pos + 1)
+        fields[data[pos:pos + 1].decode('ascii')] = \
+            data[pos + 1:following].decode('utf-8', 'replace')
+        pos = following + 1
+    return fields
+
+
+def find_sqlstate(data):
+    """
+    Return the SQLSTATE field of an ErrorResponse or NoticeResponse payload
+    without parsing the other fields, or None if it has none
+    """
+    code = find_field(data, b'C')
+    if code is None:
+        return None
+    return code.decode('ascii', 'replace')
+
+
+def find_field(data, code):
+    """
+    Return the undecoded bytes of the field 'code' (e.g. b'M') of an
+    ErrorResponse or NoticeResponse payload, or None if it has none
+    """
+    pos = 0
+    end = len(data)
+    while pos < end:
+        found = data[pos:pos + 1]
+        if found == b'\x00':
+            break
+        following = data.index(b'\x00', pos + 1)
+        if found == code:
+            return data[pos + 1:following]
+        pos = following + 1
+    return None
+
+
 class PostgresError(Exception):
     """
     Parse the fields that Postgres returns in its error messages into a Python
     Exception with the attributes listed in 'keys'
 
+    It may be created with a dict of the fields, or with the payload of an
+    ErrorResponse, which is only parsed when an attribute is first read.
+
     More info on the Postgres fields can be found here:
     https://www.postgresql.org/docs/9.6/static/protocol-error-fields.html
     """
@@ -35,10 +112,295 @@ class PostgresError(Exception):
             'L': 'line',
             'R': 'routine'}
 
+    # The SQLSTATE this class stands for, set on the subclasses
+    sqlstate = None
+
     def __init__(self, error_data):
-        for key, value in self.keys.items():
-            setattr(self, value, error_data.get(key))
+        if isinstance(error_data, dict):
+            self.payload = None
+            self._fields = error_data
+        else:
+            self.payload = error_data
+            self._fields = None
+
+    @property
+    def fields(self):
+        """
+        The dict of fields, parsed from the payload on first use
+        """
+        fields = self._fields
+        if fields is None:
+            fields = self._fields = parse_fields(self.payload)
+        return fields
 
     def __str__(self):
-        r = "PostgresError: %s" % (self.message,)
+        r = "%s: %s" % (type(self).__name__, self.message)
         return r
+
+
+def field_property(key):
+    """
+    Return a property that reads the field 'key' from self.fields
+    """
+    def get(self):
+        return self.fields.get(key)
+    return property(get)
+
+
+for _key, _name in PostgresError.keys.items():
+    setattr(PostgresError, _name, field_property(_key))
+
+
+# Class 08
+class ConnectionException(PostgresError):
+    sqlstate = '08000'
+
+
+# Class 0A
+class FeatureNotSupported(PostgresError):
+    sqlstate = '0A000'
+
+
+# Class 21
+class CardinalityViolation(PostgresError):
+    sqlstate = '21000'
+
+
+# Class 22
+class DataError(PostgresError):
+    sqlstate = '22000'
+
+
+class StringDataRightTruncation(DataError):
+    sqlstate = '22001'
+
+
+class NumericValueOutOfRange(DataError):
+    sqlstate = '22003'
+
+
+class InvalidDatetimeFormat(DataError):
+    sqlstate = '22007'
+
+
+class DatetimeFieldOverflow(DataError):
+    sqlstate = '22008'
+
+
+class DivisionByZero(DataError):
+    sqlstate = '22012'
+
+
+class CharacterNotInRepertoire(DataError):
+    sqlstate = '22021'
+
+
+class UntranslatableCharacter(DataError):
+    sqlstate = '22P05'
+
+
+class InvalidTextRepresentation(DataError):
+    sqlstate = '22P02'
+
+
+# Class 23
+class IntegrityError(PostgresError):
+    sqlstate = '23000'
+
+
+class RestrictViolation(IntegrityError):
+    sqlstate = '23001'
+
+
+class NotNullViolation(IntegrityError):
+    sqlstate = '23502'
+
+
+class ForeignKeyViolation(IntegrityError):
+    sqlstate = '23503'
+
+
+class UniqueViolation(IntegrityError):
+    sqlstate = '23505'
+
+
+class CheckViolation(IntegrityError):
+    sqlstate = '23514'
+
+
+class ExclusionViolation(IntegrityError):
+    sqlstate = '23P01'
+
+
+# Class 25
+class InvalidTransactionState(PostgresError):
+    sqlstate = '25000'
+
+
+class ActiveSQLTransaction(InvalidTransactionState):
+    sqlstate = '25001'
+
+
+class ReadOnlySQLTransaction(InvalidTransactionState):
+    sqlstate = '25006'
+
+
+class InFailedSQLTransaction(InvalidTransactionState):
+    sqlstate = '25P02'
+
+
+# Class 28
+class InvalidAuthorizationSpecification(PostgresError):
+    sqlstate = '28000'
+
+
+class InvalidPassword(InvalidAuthorizationSpecification):
+    sqlstate = '28P01'
+
+
+# Class 40
+class TransactionRollback(PostgresError):
+    sqlstate = '40000'
+
+
+class SerializationFailure(TransactionRollback):
+    sqlstate = '40001'
+
+
+class DeadlockDetected(TransactionRollback):
+    sqlstate = '40P01'
+
+
+# Class 42
+class SyntaxErrorOrAccessRuleViolation(PostgresError):
+    sqlstate = '42000'
+
+
+class InsufficientPrivilege(SyntaxErrorOrAccessRuleViolation):
+    sqlstate = '42501'
+
+
+class SQLSyntaxError(SyntaxErrorOrAccessRuleViolation):
+    sqlstate = '42601'
+
+
+class UndefinedColumn(SyntaxErrorOrAccessRuleViolation):
+    sqlstate = '42703'
+
+
+class UndefinedFunction(SyntaxErrorOrAccessRuleViolation):
+    sqlstate = '42883'
+
+
+class UndefinedTable(SyntaxErrorOrAccessRuleViolation):
+    sqlstate = '42P01'
+
+
+class UndefinedParameter(SyntaxErrorOrAccessRuleViolation):
+    sqlstate = '42P02'
+
+
+class DuplicateObject(SyntaxErrorOrAccessRuleViolation):
+    sqlstate = '42710'
+
+
+class DuplicateTable(SyntaxErrorOrAccessRuleViolation):
+    sqlstate = '42P07'
+
+
+class DuplicatePreparedStatement(SyntaxErrorOrAccessRuleViolation):
+    sqlstate = '42P05'
+
+
+class InvalidPreparedStatementDefinition(SyntaxErrorOrAccessRuleViolation):
+    sqlstate = '42P14'
+
+
+# Class 53
+class InsufficientResources(PostgresError):
+    sqlstate = '53000'
+
+
+class DiskFull(InsufficientResources):
+    sqlstate = '53100'
+
+
+class OutOfMemory(InsufficientResources):
+    sqlstate = '53200'
+
+
+class TooManyConnections(InsufficientResources):
+    sqlstate = '53300'
+
+
+# Class 55
+class ObjectNotInPrerequisiteState(PostgresError):
+    sqlstate = '55000'
+
+
+class ObjectInUse(ObjectNotInPrerequisiteState):
+    sqlstate = '55006'
+
+
+class LockNotAvailable(ObjectNotInPrerequisiteState):
+    sqlstate = '55P03'
+
+
+# Class 57
+class OperatorIntervention(PostgresError):
+    sqlstate = '57000'
+
+
+class QueryCanceled(OperatorIntervention):
+    sqlstate = '57014'
+
+
+class AdminShutdown(OperatorIntervention):
+    sqlstate = '57P01'
+
+
+class CrashShutdown(OperatorIntervention):
+    sqlstate = '57P02'
+
+
+class CannotConnectNow(OperatorIntervention):
+    sqlstate = '57P03'
+
+
+# Class XX
+class InternalError(PostgresError):
+    sqlstate = 'XX000'
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        for descendant in _subclasses(subclass):
+            yield descendant
+
+
+"""
+The PostgresError subclass for each SQLSTATE, including the class-level
+codes ending in '000' that the lookup falls back to
+"""
+sqlstate_errors = dict((cls.sqlstate, cls)
+                       for cls in _subclasses(PostgresError))
+
+
+def error_class(sqlstate):
+    """
+    Return the PostgresError subclass for the code 'sqlstate'
+    """
+    cls = sqlstate_errors.get(sqlstate)
+    if cls is None and sqlstate:
+        cls = sqlstate_errors.get(sqlstate[:2] + '000', PostgresError)
+    return cls or PostgresError
+
+
+def from_payload(payload):
+    """
+    Return an instance of the PostgresError subclass for the SQLSTATE of an
+    ErrorResponse payload, which parses the payload's other fields lazily
+    """
+    payload = binary.to_bytes(payload)
+    return error_class(find_sqlstate(payload))(payload)
@@ -0,0 +1,942 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+A stand-in for a Postgres backend that speaks protocol 3.0 and answers with
+scripted results, for tests and benchmarks that shouldn't need a database,
+e.g.:
+
+server = FakeServer(users={u'alice': u'secret'}, auth=MD5)
+server.script(u'SELECT id, name FROM t',
+              Result([(u'id', constants.INT4OID),
+                      (u'name', constants.TEXTOID)],
+                     [(1, u'one'), (2, u'two')]))
+server.script(u'SELECT * FROM big',
+              generate([(u'n', constants.INT8OID)], 1000000))
+server.script(u'SELECT $1::int4', lambda session, params: ...)
+
+conn = connection.Connection(u'alice', password=u'secret')
+server.loopback(conn)           # connected in-process, synchronously
+
+or over TCP with asyncio or Twisted:
+
+await loop.create_server(server.session, u'127.0.0.1', 0)
+reactor.listenTCP(0, server.twisted_factory(), interface=u'127.0.0.1')
+
+It handles startup (refusing SSL), trust, cleartext, md5 and SCRAM-SHA-256
+authentication, the simple Query protocol with text results, the extended
+protocol (Parse, Bind, Describe, Execute with a row limit, Close, Flush and
+Sync) with text or binary results, COPY FROM STDIN and TO STDOUT in the
+binary format, BEGIN, COMMIT and ROLLBACK, and LISTEN, UNLISTEN and NOTIFY.
+A Session is one connection to the server, and is event loop independent.
+
+A script is a Result, or a function called with the Session and the decoded
+Bind parameters that returns one; the parameters are None when a statement
+is only being described. Results with a latency delay their response by
+that many seconds, if the server was given a call_later(delay, func)
+function such as reactor.callLater or loop.call_later. Statements without a
+script fail with SQLSTATE 42P01, unless 'default' is set to a script for
+them.
+
+Everything the session writes in response to one chunk of data goes out in
+one write, as it does from a real backend.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+from collections import deque
+
+from . import auth as _auth
+from . import binary
+from . import constants
+from . import framing
+from . import pgcopy
+from . import rows as _rows
+
+ci_pack = binary.ci_pack
+h_pack = binary.h_pack
+i_pack = binary.i_pack
+h_unpack = binary.h_unpack
+i_unpack = binary.i_unpack
+
+TRUST = 'trust'
+CLEARTEXT = 'cleartext'
+MD5 = 'md5'
+SCRAM_SHA_256 = 'scram-sha-256'
+
+COPY_IN = 'in'
+COPY_OUT = 'out'
+
+_listen = re.compile(r'\s*(UN)?LISTEN\s+("(?:[^"]|"")+"|\*|\w+)\s*;?\s*$',
+                     re.IGNORECASE | re.UNICODE)
+_notify = re.compile(r'\s*NOTIFY\s+("(?:[^"]|"")+"|\w+)'
+                     r"\s*(?:,\s*'((?:[^']|'')*)')?\s*;?\s*$",
+                     re.IGNORECASE | re.UNICODE)
+
+
+class Result(object):
+    '''
+    A scripted response: 'columns' is a sequence of (name, type OID) pairs,
+    'rows' a sequence of tuples of Python values of those types, 'error' a
+    (SQLSTATE, message) pair to fail with instead and 'latency' the number of
+    seconds to wait before answering. 'copy' makes it the response to COPY
+    ... FROM STDIN (COPY_IN), which accepts rows of the column types, or to
+    COPY ... TO STDOUT (COPY_OUT), which sends 'rows'.
+    '''
+
+    def __init__(self, columns=(), rows=(), command_tag=None, error=None,
+                 latency=0.0, copy=None):
+        self.columns = tuple(columns)
+        self.rows = rows
+        self.command_tag = command_tag
+        self.error = error
+        self.latency = latency
+        self.copy = copy
+
+    @property
+    def type_oids(self):
+        return tuple(type_oid for name, type_oid in self.columns)
+
+    def tag(self, count):
+        if self.command_tag is not None:
+            return self.command_tag
+        if self.copy is not None:
+            return b'COPY %d' % (count,)
+        return b'SELECT %d' % (count,)
+
+
+class GeneratedRows(object):
+    '''
+    'count' rows made by calling each function in 'makers' with the row
+    number, generated afresh every time they're iterated over
+    '''
+
+    def __init__(self, makers, count):
+        self.makers = makers
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        makers = self.makers
+        for index in range(self.count):
+            yield tuple(make(index) for make in makers)
+
+
+value_makers = {
+    constants.BOOLOID: lambda index: index % 2 == 0,
+    constants.INT2OID: lambda index: index % 32768,
+    constants.INT4OID: lambda index: index,
+    constants.INT8OID: lambda index: index,
+    constants.OIDOID: lambda index: index,
+    constants.FLOAT4OID: lambda index: index * 0.5,
+    constants.FLOAT8OID: lambda index: index * 0.5,
+    constants.TEXTOID: lambda index: u'row %d' % (index,),
+    constants.VARCHAROID: lambda index: u'row %d' % (index,),
+    constants.BYTEAOID: lambda index: b'%08d' % (index,),
+}
+
+
+def generate(columns, count, latency=0.0):
+    """
+    Return a Result of 'count' rows with values made by value_makers for the
+    types of 'columns'
+    """
+    columns = tuple(columns)
+    makers = []
+    for name, type_oid in columns:
+        if type_oid not in value_makers:
+            raise ValueError("Can't generate values of type %s" %
+                             (type_oid,))
+        makers.append(value_makers[type_oid])
+    return Result(columns, GeneratedRows(makers, count), latency=latency)
+
+
+def _cstring(value):
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+    return value + b'\x00'
+
+
+def _text_value(value):
+    if value is None or isinstance(value, bytes):
+        return value
+    if value is True or value is False:
+        return b't' if value else b'f'
+    if isinstance(value, float):
+        value = repr(value)
+    return (u'%s' % (value,)).encode('utf-8')
+
+
+def _unquote(name):
+    if name.startswith(u'"'):
+        return name[1:-1].replace(u'""', u'"')
+    return name.lower()
+
+
+def _row_encoder(type_oids, formats):
+    if all(fc == constants.FC_BINARY for fc in formats):
+        return _rows.get_row_encoder(type_oids)
+    if all(fc == constants.FC_TEXT for fc in formats):
+        formats = None
+    encoders = [_rows.get_row_encoder((type_oid,)) for type_oid in type_oids]
+    count = h_pack(len(type_oids))
+
+    def encode_row(row):
+        parts = [count]
+        for index, value in enumerate(row):
+            if formats is not None and formats[index]:
+                # Strip the field count from the binary encoding
+                parts.append(encoders[index]((value,))[2:])
+                continue
+            value = _text_value(value)
+            if value is None:
+                parts.append(constants.NULL)
+            else:
+                parts.append(i_pack(len(value)))
+                parts.append(value)
+        return b''.join(parts)
+    return encode_row
+
+
+class _Portal(object):
+
+    def __init__(self, sql, result, formats):
+        self.sql = sql
+        self.result = result
+        self.formats = formats
+        self.rows = None
+        self.count = 0
+
+
+class Session(object):
+    '''
+    One connection to a FakeServer. It can be an asyncio protocol, or given
+    any transport with write() and close() (or Twisted's loseConnection())
+    with connection_made(), and fed with data_received().
+    '''
+
+    def __init__(self, server):
+        self.server = server
+        self.pid = server._next_pid()
+        self.secret = 0
+        self.transport = None
+        self.user = None
+        self.parameters = {}
+        self.started = False
+        self.authenticated = False
+        self.closing = False
+        self.closed = False
+        self.transaction_status = constants.IDLE
+        self.listening = set()
+        self.statements = {}
+        self.portals = {}
+
+        self.framer = framing.MessageFramer()
+        self._startup = b''
+        self._failed = False
+        self._copy = None
+        self._scram = None
+        self._buffer = []
+        self._output = deque()
+        self._sleeping = False
+
+        self.handlers = {
+            constants.PASSWORD: self.password,
+            constants.QUERY: self.query,
+            constants.PARSE: self.parse,
+            constants.BIND: self.bind,
+            constants.DESCRIBE: self.describe,
+            constants.EXECUTE: self.execute,
+            constants.CLOSE: self.close,
+            constants.SYNC: self.sync,
+            constants.FLUSH: self.flush,
+            constants.TERMINATE: self.terminate,
+            constants.COPY_DATA: self.copy_data,
+            constants.COPY_DONE: self.copy_done,
+            constants.COPY_FAIL: self.copy_fail,
+        }
+
+    # Twisted protocol methods
+    def makeConnection(self, transport):
+        self.connection_made(transport)
+
+    def dataReceived(self, data):
+        self.data_received(data)
+
+    def connectionLost(self, reason=None):
+        self.connection_lost(reason)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.sessions.add(self)
+
+    def connection_lost(self, exc=None):
+        self.closed = True
+        self.server.sessions.discard(self)
+
+    def eof_received(self):
+        pass
+
+    def data_received(self, data):
+        if not self.started:
+            data = self._receive_startup(data)
+        if data:
+            self.framer.feed(data)
+            handlers = self.handlers
+            for code, payload in self.framer:
+                if self.closing:
+                    break
+                if self._failed and code != constants.SYNC:
+                    # Everything up to the Sync is discarded after an error
+                    continue
+                handler = handlers.get(code)
+                if handler is None or (self._copy is not None and code not in
+                                       (constants.COPY_DATA,
+                                        constants.COPY_DONE,
+                                        constants.COPY_FAIL)):
+                    self._fatal(b'08P01', u'Unexpected message %r' % (code,))
+                    break
+                handler(payload)
+        self._flush()
+
+    def _receive_startup(self, data):
+        buf = self._startup + data
+        while not self.started and not self.closing and len(buf) >= 8:
+            length = i_unpack(buf)[0]
+            if len(buf) < length:
+                break
+            packet = buf[4:length]
+            buf = buf[length:]
+            self._startup_packet(packet)
+        if self.started:
+            self._startup = b''
+            return buf
+        self._startup = buf
+        return b''
+
+    # Output
+    def _emit(self, code, payload=b''):
+        self._buffer.append(ci_pack(code, len(payload) + 4))
+        self._buffer.append(payload)
+
+    def _wait(self, delay):
+        if delay > 0 and self.server.call_later is not None:
+            self._output.append(b''.join(self._buffer))
+            self._buffer = []
+            self._output.append(float(delay))
+
+    def _flush(self):
+        if self._buffer:
+            self._output.append(b''.join(self._buffer))
+            self._buffer = []
+        if self._sleeping:
+            return
+        output = self._output
+        while output:
+            item = output.popleft()
+            if isinstance(item, float):
+                self._sleeping = True
+                self.server.call_later(item, self._wake)
+                return
+            if item is None:
+                close = getattr(self.transport, 'loseConnection', None)
+                (close or self.transport.close)()
+            elif item and not self.closed:
+                self.transport.write(item)
+
+    def _wake(self):
+        self._sleeping = False
+        self._flush()
+
+    def _error(self, sqlstate, message, severity=b'ERROR'):
+        self._emit(constants.ERROR_RESPONSE,
+                   b'S' + severity + b'\x00V' + severity + b'\x00C' +
+                   sqlstate + b'\x00M' + _cstring(message) + b'\x00')
+
+    def _fatal(self, sqlstate, message):
+        self._error(sqlstate, message, b'FATAL')
+        self._output.append(b''.join(self._buffer))
+        self._buffer = []
+        # Close once everything before this has been written
+        self._output.append(None)
+        self.started = True
+        self.closing = True
+
+    def _ready(self):
+        self._emit(constants.READY_FOR_QUERY, self.transaction_status)
+
+    def _fail(self, sqlstate, message):
+        self._error(sqlstate, message)
+        if self.transaction_status == constants.IDLE_IN_TRANSACTION:
+            self.transaction_status = constants.IDLE_IN_FAILED_TRANSACTION
+
+    # Startup and authentication
+    def _startup_packet(self, packet):
+        code = i_unpack(packet)[0]
+        if code == constants.SSL_REQUEST_CODE:
+            self._buffer.append(b'N')
+            return
+        if code == constants.CANCEL_REQUEST_CODE:
+            self._output.append(None)
+            self.started = self.closing = True
+            return
+        if code != constants.DEFAULT_PROTOCOL_VERSION:
+            self._fatal(b'0A000', u'Unsupported protocol %s' % (code,))
+            return
+        items = packet[4:].split(b'\x00')
+        for index in range(0, len(items) - 1, 2):
+            if items[index]:
+                self.parameters[items[index].decode('utf-8')] = \
+                    items[index + 1].decode('utf-8')
+        self.started = True
+        self.user = self.parameters.get(u'user')
+        server = self.server
+        if self.user is None:
+            self._fatal(b'28000', u'No user name given')
+        elif server.users is not None and self.user not in server.users:
+            self._fatal(b'28000', u'Role "%s" does not exist' % (self.user,))
+        elif server.auth == TRUST:
+            self._authenticated()
+        elif server.auth == CLEARTEXT:
+            self._auth_request(constants.AUTH_CLEARTEXT_PASSWORD)
+        elif server.auth == MD5:
+            self._salt = os.urandom(4)
+            self._auth_request(constants.AUTH_MD5_PASSWORD, self._salt)
+        else:
+            self._auth_request(constants.AUTH_SASL,
+                               _auth.SCRAM_SHA_256 + b'\x00\x00')
+
+    def _auth_request(self, kind, data=b''):
+        self._emit(constants.AUTHENTICATION_REQUEST, i_pack(kind) + data)
+
+    def _user_password(self):
+        return self.server.users[self.user]
+
+    def password(self, payload):
+        if self.authenticated:
+            self._fatal(b'08P01', u'Unexpected password message')
+            return
+        auth = self.server.auth
+        payload = bytes(payload)
+        if auth == SCRAM_SHA_256:
+            self._scram_message(payload)
+            return
+        expected = _cstring(self._user_password())
+        if auth == MD5:
+            expected = _cstring(_auth.md5_password(
+                self.user, self._user_password(), self._salt))
+        if not hmac.compare_digest(payload, expected):
+            self._password_failed()
+            return
+        self._authenticated()
+
+    def _password_failed(self):
+        self._fatal(b'28P01', u'Password authentication failed for user '
+                              u'"%s"' % (self.user,))
+
+    def _scram_message(self, payload):
+        if self._scram is None:
+            end = payload.index(b'\x00')
+            if payload[:end] != _auth.SCRAM_SHA_256:
+                self._fatal(b'28000', u'Unsupported SASL mechanism')
+                return
+            client_first = payload[end + 5:]
+            client_first_bare = client_first.split(b',', 2)[2]
+            fields = dict(item.split(b'=', 1)
+                          for item in client_first_bare.split(b','))
+            nonce = fields[b'r'] + base64.b64encode(os.urandom(18))
+            salt = os.urandom(16)
+            iterations = self.server.scram_iterations
+            server_first = (b'r=' + nonce + b',s=' + base64.b64encode(salt) +
+                            b',i=' + str(iterations).encode('ascii'))
+            self._scram = (client_first_bare, server_first, nonce, salt,
+                           iterations)
+            self._auth_request(constants.AUTH_SASL_CONTINUE, server_first)
+            return
+
+        client_first_bare, server_first, nonce, salt, iterations = \
+            self._scram
+        without_proof, proof = payload.rsplit(b',p=', 1)
+        if without_proof != b'c=biws,r=' + nonce:
+            self._password_failed()
+            return
+        password = self._user_password().encode('utf-8')
+        salted = hashlib.pbkdf2_hmac('sha256', password, salt, iterations)
+        client_key = _auth._hmac(salted, b'Client Key')
+        stored_key = hashlib.sha256(client_key).digest()
+        auth_message = b','.join((client_first_bare, server_first,
+                                  without_proof))
+        signature = _auth._hmac(stored_key, auth_message)
+        if not hmac.compare_digest(
+                _auth._xor(base64.b64decode(proof), signature), client_key):
+            self._password_failed()
+            return
+        server_key = _auth._hmac(salted, b'Server Key')
+        server_signature = _auth._hmac(server_key, auth_message)
+        self._auth_request(constants.AUTH_SASL_FINAL,
+                           b'v=' + base64.b64encode(server_signature))
+        self._authenticated()
+
+    def _authenticated(self):
+        self.authenticated = True
+        self._auth_request(constants.AUTH_OK)
+        parameters = dict(self.server.parameters)
+        requested = self.parameters.get(u'client_encoding')
+        if requested is not None:
+            parameters[u'client_encoding'] = requested
+        for name, value in sorted(parameters.items()):
+            self._emit(constants.PARAMETER_STATUS,
+                       _cstring(name) + _cstring(value))
+        self._emit(constants.BACKEND_KEY_DATA,
+                   binary.ii_pack(self.pid, self.secret))
+        self._ready()
+
+    def _check_authenticated(self):
+        if not self.authenticated:
+            self._fatal(b'08P01', u'Not authenticated')
+            return False
+        return True
+
+    # Statements
+    def _resolve(self, sql, params):
+        """
+        Return the Result for 'sql', running the built-in commands
+        """
+        server = self.server
+        if server.log is not None and params is not None:
+            server.log.append((sql, params))
+        script = server.scripts.get(sql)
+        if script is None:
+            script = self._builtin(sql, params)
+        if script is None:
+            script = server.default
+        if script is None:
+            return Result(error=(b'42P01', u'No script for %s' % (sql,)))
+        if callable(script):
+            script = script(self, params)
+        if self.transaction_status == \
+                constants.IDLE_IN_FAILED_TRANSACTION and script.error is None:
+            return Result(error=(b'25P02', u'Current transaction is aborted, '
+                                           u'commands ignored until end of '
+                                           u'transaction block'))
+        return script
+
+    def _builtin(self, sql, params):
+        words = sql.split(None, 1)
+        if not words:
+            return None
+        command = words[0].rstrip(u';').upper()
+        if params is None:
+            # Only being described
+            if command in (u'BEGIN', u'START', u'COMMIT', u'END',
+                           u'ROLLBACK', u'LISTEN', u'UNLISTEN', u'NOTIFY'):
+                return Result()
+            return None
+        status = self.transaction_status
+        if command in (u'BEGIN', u'START'):
+            if status == constants.IDLE:
+                self.transaction_status = constants.IDLE_IN_TRANSACTION
+            return Result(command_tag=b'BEGIN')
+        if command in (u'COMMIT', u'END', u'ROLLBACK'):
+            self.transaction_status = constants.IDLE
+            if command == u'ROLLBACK' or \
+                    status == constants.IDLE_IN_FAILED_TRANSACTION:
+                return Result(command_tag=b'ROLLBACK')
+            return Result(command_tag=b'COMMIT')
+        match = _listen.match(sql)
+        if match is not None:
+            channel = match.group(2)
+            if match.group(1):
+                if channel == u'*':
+                    self.listening.clear()
+                else:
+                    self.listening.discard(_unquote(channel))
+                return Result(command_tag=b'UNLISTEN')
+            self.listening.add(_unquote(channel))
+            return Result(command_tag=b'LISTEN')
+        match = _notify.match(sql)
+        if match is not None:
+            payload = (match.group(2) or u'').replace(u"''", u"'")
+            self.server.notify(_unquote(match.group(1)), payload, self.pid)
+            return Result(command_tag=b'NOTIFY')
+        return None
+
+    def _row_description(self, columns, formats):
+        parts = [h_pack(len(columns))]
+        for (name, type_oid), format_code in zip(columns, formats):
+            struc = _rows.fixed_width.get(type_oid)
+            size = struc.size if struc is not None else -1
+            parts.append(_cstring(name))
+            parts.append(binary.structs.get_pack('ihihih')(
+                0, 0, type_oid, size, -1, format_code))
+        self._emit(constants.ROW_DESCRIPTION, b''.join(parts))
+
+    def _send_rows(self, result, rows, formats, max_rows=0):
+        """
+        Send DataRows for up to 'max_rows' (or all) of 'rows', an iterator,
+        and return how many were sent and whether there may be more
+        """
+        encode_row = _row_encoder(result.type_oids, formats)
+        emit = self._emit
+        code = constants.DATA_ROW
+        count = 0
+        for row in rows:
+            emit(code, encode_row(row))
+            count += 1
+            if count == max_rows:
+                return count, True
+        return count, False
+
+    def query(self, payload):
+        if not self._check_authenticated():
+            return
+        sql = bytes(payload[:-1]).decode('utf-8')
+        if not sql.strip():
+            self._emit(constants.EMPTY_QUERY_RESPONSE)
+            self._ready()
+            return
+        result = self._resolve(sql, ())
+        self._wait(result.latency)
+        if result.error is not None:
+            self._fail(*result.error)
+        elif result.copy is not None:
+            self._start_copy(sql, result)
+            if self._copy is not None:
+                return
+        else:
+            formats = (constants.FC_TEXT,) * len(result.columns)
+            if result.columns:
+                self._row_description(result.columns, formats)
+            count, more = self._send_rows(result, iter(result.rows), formats)
+            self._emit(constants.COMMAND_COMPLETE,
+                       _cstring(result.tag(count)))
+        self._ready()
+
+    def parse(self, payload):
+        if not self._check_authenticated():
+            return
+        payload = bytes(payload)
+        end = payload.index(b'\x00')
+        name = payload[:end]
+        following = payload.index(b'\x00', end + 1)
+        sql = payload[end + 1:following].decode('utf-8')
+        count = h_unpack(payload, following + 1)[0]
+        type_oids = binary.structs.get_unpack('I' * count)(
+            payload, following + 3)
+        if name and name in self.statements:
+            self._extended_error(b'42P05', u'Prepared statement "%s" '
+                                 u'already exists' % (name.decode('utf-8'),))
+            return
+        self.statements[name] = (sql, tuple(type_oids))
+        self._emit(constants.PARSE_COMPLETE)
+
+    def bind(self, payload):
+        payload = bytes(payload)
+        end = payload.index(b'\x00')
+        portal = payload[:end]
+        following = payload.index(b'\x00', end + 1)
+        name = payload[end + 1:following]
+        statement = self.statements.get(name)
+        if statement is None:
+            self._extended_error(b'26000', u'Prepared statement "%s" does '
+                                 u'not exist' % (name.decode('utf-8'),))
+            return
+        sql, type_oids = statement
+
+        pos = following + 1
+        count = h_unpack(payload, pos)[0]
+        param_formats = binary.structs.get_unpack('h' * count)(
+            payload, pos + 2)
+        pos += 2 + 2 * count
+        start = pos
+        count = h_unpack(payload, pos)[0]
+        pos += 2
+        for _ in range(count):
+            length = i_unpack(payload, pos)[0]
+            pos += 4 + max(length, 0)
+        if len(param_formats) == 1:
+            param_formats = param_formats * count
+        elif not param_formats:
+            param_formats = (constants.FC_TEXT,) * count
+        oids = tuple(type_oids[index] if index < len(type_oids) else 0
+                     for index in range(count))
+        params = _rows.get_row_decoder(tuple(zip(oids, param_formats)))(
+            payload[start:pos]) if count else ()
+
+        result = self._resolve(sql, params)
+        count = h_unpack(payload, pos)[0]
+        formats = binary.structs.get_unpack('h' * count)(payload, pos + 2)
+        columns = len(result.columns)
+        if len(formats) == 1:
+            formats = formats * columns
+        elif not formats:
+            formats = (constants.FC_TEXT,) * columns
+        self.portals[portal] = _Portal(sql, result, formats)
+        self._emit(constants.BIND_COMPLETE)
+
+    def describe(self, payload):
+        kind = bytes(payload[:1])
+        name = bytes(payload[1:-1])
+        if kind == constants.STATEMENT:
+            statement = self.statements.get(name)
+            if statement is None:
+                self._extended_error(b'26000', u'Prepared statement "%s" '
+                                     u'does not exist' % (name.decode(
+                                         'utf-8'),))
+                return
+            sql, type_oids = statement
+            self._emit(constants.PARAMETER_DESCRIPTION,
+                       binary.structs.get_pack('h' + 'I' * len(type_oids))(
+                           len(type_oids), *type_oids))
+            result = self._resolve(sql, None)
+            formats = (constants.FC_TEXT,) * len(result.columns)
+        else:
+            portal = self.portals.get(name)
+            if portal is None:
+                self._extended_error(b'34000', u'Portal "%s" does not exist'
+                                     % (name.decode('utf-8'),))
+                return
+            result = portal.result
+            formats = portal.formats
+        if result.columns and result.copy is None:
+            self._row_description(result.columns, formats)
+        else:
+            self._emit(constants.NO_DATA)
+
+    def execute(self, payload):
+        payload = bytes(payload)
+        end = payload.index(b'\x00')
+        portal = self.portals.get(payload[:end])
+        if portal is None:
+            self._extended_error(b'34000', u'Portal does not exist')
+            return
+        max_rows = i_unpack(payload, end + 1)[0]
+        result = portal.result
+        if portal.rows is None:
+            self._wait(result.latency)
+            portal.rows = iter(result.rows)
+        if result.error is not None:
+            self._extended_error(*result.error)
+            return
+        if result.copy is not None:
+            self._extended_error(b'0A000', u'COPY is only supported with '
+                                           u'the simple Query protocol')
+            return
+        count, more = self._send_rows(result, portal.rows, portal.formats,
+                                      max_rows)
+        portal.count += count
+        if more:
+            self._emit(constants.PORTAL_SUSPENDED)
+        else:
+            self._emit(constants.COMMAND_COMPLETE,
+                       _cstring(result.tag(portal.count)))
+
+    def _extended_error(self, sqlstate, message):
+        self._fail(sqlstate, message)
+        self._failed = True
+
+    def close(self, payload):
+        kind = bytes(payload[:1])
+        name = bytes(payload[1:-1])
+        if kind == constants.STATEMENT:
+            self.statements.pop(name, None)
+        else:
+            self.portals.pop(name, None)
+        self._emit(constants.CLOSE_COMPLETE)
+
+    def sync(self, payload):
+        self._failed = False
+        # The unnamed portal only lasts until the end of the transaction
+        if self.transaction_status == constants.IDLE:
+            self.portals.clear()
+        self._ready()
+
+    def flush(self, payload):
+        pass
+
+    def terminate(self, payload):
+        self._output.append(b''.join(self._buffer))
+        self._buffer = []
+        self._output.append(None)
+        self.closing = True
+
+    # COPY
+    def _start_copy(self, sql, result):
+        columns = len(result.columns)
+        header = b'\x01' + h_pack(columns) + h_pack(1) * columns
+        if result.copy == COPY_OUT:
+            self._emit(constants.COPY_OUT_RESPONSE, header)
+            counted = []
+
+            def count_rows():
+                for row in result.rows:
+                    counted.append(None)
+                    yield row
+            for chunk in pgcopy.copy_in_chunks(count_rows(),
+                                               result.type_oids):
+                self._emit(constants.COPY_DATA, chunk)
+            self._emit(constants.COPY_DONE)
+            self._emit(constants.COMMAND_COMPLETE,
+                       _cstring(result.tag(len(counted))))
+        else:
+            self._emit(constants.COPY_IN_RESPONSE, header)
+            self._copy = (sql, result,
+                          pgcopy.CopyOutDecoder(result.type_oids))
+
+    def copy_data(self, payload):
+        if self._copy is None:
+            self._fatal(b'08P01', u'Unexpected CopyData')
+            return
+        self._copy[2].feed(payload)
+
+    def copy_done(self, payload):
+        if self._copy is None:
+            self._fatal(b'08P01', u'Unexpected CopyDone')
+            return
+        sql, result, decoder = self._copy
+        self._copy = None
+        self.server.copied.append((sql, decoder.columns()))
+        self._emit(constants.COMMAND_COMPLETE,
+                   _cstring(result.tag(decoder.row_count)))
+        self._ready()
+
+    def copy_fail(self, payload):
+        self._copy = None
+        self._fail(b'57014', u'COPY from stdin failed: %s' %
+                   (bytes(payload[:-1]).decode('utf-8', 'replace'),))
+        self._ready()
+
+    def notification(self, pid, channel, payload):
+        """
+        Send a NotificationResponse if this session listens on 'channel'
+        """
+        if channel in self.listening and self.authenticated:
+            self._emit(constants.NOTIFICATION_RESPONSE,
+                       i_pack(pid) + _cstring(channel) + _cstring(payload))
+            self._flush()
+
+
+class _Pipe(object):
+    '''
+    One direction of a loopback connection. Data written while the receiver
+    is still handling earlier data is passed on when it returns, so neither
+    side is re-entered.
+    '''
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+        self.peer = None
+        self.pending = []
+        self.busy = False
+        self.closed = False
+
+    def write(self, data):
+        if self.closed:
+            return
+        self.pending.append(data)
+        if self.busy:
+            return
+        self.busy = True
+        try:
+            while self.pending and not self.closed:
+                data = b''.join(self.pending)
+                del self.pending[:]
+                self.receiver.data_received(data)
+        finally:
+            self.busy = False
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.receiver.connection_lost(None)
+            self.peer.close()
+
+
+class FakeServer(object):
+    '''
+    Scripts and settings shared by every Session. 'users' maps user names
+    to passwords; if it's None any user may connect. 'auth' is TRUST,
+    CLEARTEXT, MD5 or SCRAM_SHA_256. 'parameters' are sent with
+    ParameterStatus after authentication, with the client_encoding that the
+    client asked for in its startup packet, if any, in place of the
+    server's. With 'record' set, 'log' lists
+    the (SQL, parameters) of each statement run.
+    '''
+
+    def __init__(self, users=None, auth=TRUST, parameters=None,
+                 call_later=None, scram_iterations=4096, record=False):
+        if auth not in (TRUST, CLEARTEXT, MD5, SCRAM_SHA_256):
+            raise ValueError("Unknown authentication method %r" % (auth,))
+        if auth != TRUST and users is None:
+            raise ValueError("Password authentication needs 'users'")
+        self.users = users
+        self.auth = auth
+        self.parameters = {u'client_encoding': u'UTF8',
+                           u'server_encoding': u'UTF8',
+                           u'server_version': u'10.0',
+                           u'integer_datetimes': u'on'}
+        if parameters:
+            self.parameters.update(parameters)
+        self.call_later = call_later
+        self.scram_iterations = scram_iterations
+        self.scripts = {}
+        self.default = None
+        self.sessions = set()
+        self.copied = []
+        self.log = [] if record else None
+        self._pid = 1000
+
+    def _next_pid(self):
+        self._pid += 1
+        return self._pid
+
+    def script(self, sql, result):
+        """
+        Answer 'sql' with 'result', a Result or a function that returns one
+        """
+        self.scripts[sql] = result
+
+    def session(self):
+        """
+        Return a new Session, e.g. as an asyncio protocol factory
+        """
+        return Session(self)
+
+    def notify(self, channel, payload=u'', pid=0):
+        """
+        Send a notification to every session that listens on 'channel'
+        """
+        for session in list(self.sessions):
+            session.notification(pid, channel, payload)
+
+    def loopback(self, client):
+        """
+        Connect 'client' (e.g. a connection.Connection, or anything else with
+        connection_made(), data_received() and connection_lost()) to a new
+        Session in-process, and return the Session. Data is delivered as
+        soon as it's written, so the exchange runs synchronously.
+        """
+        session = self.session()
+        to_session = _Pipe(session)
+        to_client = _Pipe(client)
+        to_session.peer = to_client
+        to_client.peer = to_session
+        session.connection_made(to_client)
+        client.connection_made(to_session)
+        return session
+
+    def twisted_factory(self):
+        """
+        Return a Twisted protocol factory for the server, to listen on
+        """
+        from twisted.internet import protocol
+        factory = protocol.Factory()
+        factory.buildProtocol = lambda addr: self.session()
+        return factory
@@ -0,0 +1,146 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Split the byte stream from the backend into protocol messages without copying
+their payloads
+
+Each backend message is a 1 byte message code followed by an int32 length
+(which counts itself but not the code) and the payload, e.g.:
+
+framer = MessageFramer()
+framer.feed(chunk_from_socket)
+for code, payload in framer:
+    if code == constants.DATA_ROW:
+        ...
+
+or, to dispatch each message to a handler keyed by its message code:
+
+framer.dispatch({constants.DATA_ROW: on_data_row,
+                 constants.COMMAND_COMPLETE: on_command_complete})
+
+The payloads are memoryviews of the framer's buffer, so they are only valid
+until the next call to feed(). Handlers that need to keep a payload must copy
+it, e.g. with bytes(payload).
+
+Python 2 memoryviews don't behave like str (bytes() of one is its repr and
+indexing doesn't return a character), so there the payloads are str copies
+sliced from a buffer object instead.
+"""
+
+from . import binary
+from . import errors
+
+i_unpack = binary.i_unpack
+
+# bytes objects for each message code, so we never allocate one per message
+_codes = [bytes(bytearray((index,))) for index in range(256)]
+
+try:
+    _view = buffer
+except NameError:
+    _view = memoryview
+
+
+class MessageFramer(object):
+    '''
+    Accumulate chunks of the backend byte stream in a reusable bytearray and
+    yield a (code, memoryview) pair for each complete message. The buffer is
+    only compacted or grown when a new chunk doesn't fit after the data that
+    hasn't been consumed yet.
+    '''
+
+    def __init__(self, size_hint=65536):
+        self.buffer = bytearray(size_hint)
+        self.view = _view(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        """
+        The number of bytes received but not yet consumed as messages
+        """
+        return self.end - self.start
+
+    def feed(self, data):
+        size = len(data)
+        end = self.end
+        if end + size > len(self.buffer):
+            self._make_room(size)
+            end = self.end
+        self.buffer[end:end + size] = data
+        self.end = end + size
+
+    def _make_room(self, size):
+        start = self.start
+        pending = self.end - start
+        capacity = len(self.buffer)
+
+        if pending + size <= capacity:
+            # Move the partial message to the front of the buffer. This
+            # doesn't resize the buffer, so it's safe even though memoryviews
+            # of it may still be alive.
+            if pending:
+                self.buffer[0:pending] = self.view[start:start + pending]
+        else:
+            capacity = max(capacity * 2, pending + size)
+            buf = bytearray(capacity)
+            buf[0:pending] = self.view[start:start + pending]
+            self.buffer = buf
+            self.view = _view(buf)
+
+        self.start = 0
+        self.end = pending
+
+    def __iter__(self):
+        buf = self.buffer
+        view = self.view
+        pos = self.start
+        end = self.end
+        while end - pos >= 5:
+            length = i_unpack(buf, pos + 1)[0]
+            if length < 4:
+                msg = "Bad length %s for message %r"
+                raise errors.ThrumError(msg % (length, _codes[buf[pos]]))
+            following = pos + 1 + length
+            if following > end:
+                break
+            self.start = following
+            yield _codes[buf[pos]], view[pos + 5:following]
+            pos = following
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def dispatch(self, handlers):
+        """
+        Call handlers[code](payload) for every complete message. Messages
+        with codes that aren't in 'handlers' are passed to unhandled()
+        """
+        buf = self.buffer
+        view = self.view
+        pos = self.start
+        end = self.end
+        get = handlers.get
+        while end - pos >= 5:
+            length = i_unpack(buf, pos + 1)[0]
+            if length < 4:
+                msg = "Bad length %s for message %r"
+                raise errors.ThrumError(msg % (length, _codes[buf[pos]]))
+            following = pos + 1 + length
+            if following > end:
+                break
+            self.start = following
+            code = _codes[buf[pos]]
+            handler = get(code)
+            if handler is None:
+                self.unhandled(code, view[pos + 5:following])
+            else:
+                handler(view[pos + 5:following])
+            pos = following
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def unhandled(self, code, payload):
+        raise errors.ThrumError("Unexpected message %r" % (code,))
@@ -0,0 +1,169 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Convert the binary formats of the Postgres geometric types, which are all made
+of float8 coordinates:
+
+point       x, y                            returned as (x, y)
+lseg        x1, y1, x2, y2                  returned as ((x1, y1), (x2, y2))
+box         high x, high y, low x, low y    returned as ((x1, y1), (x2, y2))
+circle      x, y, radius                    returned as ((x, y), radius)
+path        uint8 closed, int32 npts, xys   returned as (closed, points)
+polygon     int32 npts, xys                 returned as points
+
+The points of a path or polygon are returned as one flat array.array('d') of
+interleaved coordinates (x0, y0, x1, y1, ...), which is converted from the
+wire with a single byteswap however many vertices there are. To get them as
+an (npts, 2) numpy array instead, register the *_recv_numpy variants, e.g.:
+
+rows.register_binary_decoder(constants.POLYGONOID,
+                             geometric.polygon_recv_numpy)
+
+The send functions accept points as a sequence of (x, y) pairs, a flat
+array.array('d') or a numpy array.
+"""
+
+import array
+import sys
+
+from . import binary
+from . import errors
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+dd_pack = binary.dd_pack
+dd_unpack = binary.dd_unpack
+ddd_pack = binary.ddd_pack
+ddd_unpack = binary.ddd_unpack
+dddd_pack = binary.dddd_pack
+dddd_unpack = binary.dddd_unpack
+i_pack = binary.i_pack
+i_unpack = binary.i_unpack
+Bi_pack = binary.Bi_pack
+Bi_unpack = binary.Bi_unpack
+
+_swap = sys.byteorder == 'little'
+
+
+def point_recv(data, offset=0, length=None):
+    return dd_unpack(data, offset)
+
+
+def point_send(value):
+    return dd_pack(value[0], value[1])
+
+
+def lseg_recv(data, offset=0, length=None):
+    x1, y1, x2, y2 = dddd_unpack(data, offset)
+    return ((x1, y1), (x2, y2))
+
+
+def lseg_send(value):
+    (x1, y1), (x2, y2) = value
+    return dddd_pack(x1, y1, x2, y2)
+
+
+box_recv = lseg_recv
+
+
+def box_send(value):
+    """
+    Encode a box given by any two opposite corners. Postgres stores the upper
+    right corner first and so returns boxes that way.
+    """
+    (x1, y1), (x2, y2) = value
+    return dddd_pack(max(x1, x2), max(y1, y2), min(x1, x2), min(y1, y2))
+
+
+def circle_recv(data, offset=0, length=None):
+    x, y, radius = ddd_unpack(data, offset)
+    return ((x, y), radius)
+
+
+def circle_send(value):
+    (x, y), radius = value
+    return ddd_pack(x, y, radius)
+
+
+def _points(data, offset, npts):
+    end = offset + 16 * npts
+    if npts < 0 or end > len(data):
+        raise ValueError("Bad point count %s" % (npts,))
+    points = array.array('d')
+    binary.array_frombytes(points, data[offset:end])
+    if _swap:
+        points.byteswap()
+    return points
+
+
+def _points_numpy(data, offset, npts):
+    if numpy is None:
+        raise errors.ThrumError("numpy is not installed")
+    if npts < 0 or offset + 16 * npts > len(data):
+        raise ValueError("Bad point count %s" % (npts,))
+    # astype() copies, so the result doesn't refer to the message buffer
+    points = numpy.frombuffer(data, '>f8', 2 * npts, offset)
+    return points.astype(float).reshape(npts, 2)
+
+
+def path_recv(data, offset=0, length=None):
+    closed, npts = Bi_unpack(data, offset)
+    return (bool(closed), _points(data, offset + 5, npts))
+
+
+def path_recv_numpy(data, offset=0, length=None):
+    closed, npts = Bi_unpack(data, offset)
+    return (bool(closed), _points_numpy(data, offset + 5, npts))
+
+
+def polygon_recv(data, offset=0, length=None):
+    return _points(data, offset + 4, i_unpack(data, offset)[0])
+
+
+def polygon_recv_numpy(data, offset=0, length=None):
+    return _points_numpy(data, offset + 4, i_unpack(data, offset)[0])
+
+
+def _points_bytes(points):
+    """
+    Return (npts, big-endian float8 coordinates) for 'points'
+    """
+    if numpy is not None and isinstance(points, numpy.ndarray):
+        flat = points.reshape(-1)
+        if len(flat) % 2:
+            raise ValueError("Odd number of coordinates")
+        return len(flat) // 2, flat.astype('>f8').tobytes()
+
+    if isinstance(points, array.array):
+        flat = array.array('d', points)
+        if len(flat) % 2:
+            raise ValueError("Odd number of coordinates")
+    else:
+        flat = array.array('d')
+        append = flat.append
+        for x, y in points:
+            append(x)
+            append(y)
+    if _swap:
+        flat.byteswap()
+    return len(flat) // 2, binary.array_tobytes(flat)
+
+
+def path_send(value):
+    """
+    Encode (closed, points)
+    """
+    closed, points = value
+    npts, data = _points_bytes(points)
+    return Bi_pack(1 if closed else 0, npts) + data
+
+
+def polygon_send(value):
+    npts, data = _points_bytes(value)
+    return i_pack(npts) + data
@@ -0,0 +1,107 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+A small size-bounded least-recently-used mapping with hit/miss/eviction
+counters, for caching things that are expensive to build and are looked up on
+hot paths (compiled structs, row decoders, prepared statements)
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''
+    Mapping that holds at most 'maxsize' items, discarding the least recently
+    used item when a new one is added to a full cache, e.g.:
+
+    cache = LRUCache(maxsize=2)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache.get('a')  # 'a' is now the most recently used item
+    cache['c'] = 3  # evicts 'b'
+
+    If 'on_evict' is supplied it is called with (key, value) for every item
+    that is evicted to make room for another.
+    '''
+
+    def __init__(self, maxsize=128, on_evict=None):
+        if maxsize < 1:
+            raise ValueError("LRUCache maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Return the value for 'key' and mark it as most recently used, or
+        return 'default' if it is not cached
+        """
+        data = self._data
+        try:
+            value = data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        data[key] = value
+        self.hits += 1
+        return value
+
+    def peek(self, key, default=None):
+        """
+        Return the value for 'key' without marking it as used or counting
+        the lookup
+        """
+        return self._data.get(key, default)
+
+    def __setitem__(self, key, value):
+        data = self._data
+        if key in data:
+            del data[key]
+        elif len(data) >= self.maxsize:
+            old_key, old_value = data.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(old_key, old_value)
+        data[key] = value
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return self.hits / float(lookups)
+
+    def stats(self):
+        return {'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hit_rate}
@@ -0,0 +1,201 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Assemble frontend messages into a single buffer so that a whole batch of them
+goes to the backend with one transport write, e.g.:
+
+writer = MessageWriter()
+writer.parse(b'', u'SELECT $1::int4', (constants.INT4OID,))
+writer.bind(b'', b'', encode_row((1,)))
+writer.describe(constants.PORTAL, b'')
+writer.execute(b'')
+writer.sync()
+writer.write_to(transport)
+
+Each message is a 1 byte code and an int32 length, which counts itself but not
+the code, followed by the payload. The length of each message is worked out
+from the sizes of its parts before any of them are appended, so nothing has
+to be backpatched and nothing is concatenated except inside the builder.
+
+Names and SQL may be given as bytes or as text, which is encoded in the
+client encoding of the writer's textcodec.TextCodec, or as UTF-8 without one.
+The startup and password messages, which precede the backend's
+client_encoding, are always UTF-8.
+Bind parameters are given already encoded, as rows.get_row_encoder produces
+them: an int16 count followed by an int32 length, or -1 for NULL, and the
+bytes of each value.
+"""
+
+from . import binary
+from . import constants
+from . import pypy
+
+ci_pack = binary.ci_pack
+h_pack = binary.h_pack
+i_pack = binary.i_pack
+Cache = binary.Cache
+
+NUL = b'\x00'
+
+# The format code lists for 'everything in text' and 'everything in binary'
+_no_formats = h_pack(0)
+_all_binary = Cache.pack_shorts[2](1, constants.FC_BINARY)
+_all_text = _no_formats
+_no_params = h_pack(0)
+
+
+def _encode_utf8(text):
+    return text.encode('utf-8')
+
+
+def _cstring(value, encode=_encode_utf8):
+    if not isinstance(value, bytes):
+        value = encode(value)
+    return value + NUL
+
+
+def _format_codes(formats):
+    """
+    Return the int16 count and int16 codes for 'formats', which may be a
+    single format code that applies to every column or a sequence of them
+    """
+    if formats is None:
+        return _no_formats
+    if formats == constants.FC_BINARY:
+        return _all_binary
+    if formats == constants.FC_TEXT:
+        return _all_text
+    count = len(formats)
+    return Cache.get_pack_shorts_for_index(count + 1)(count, *formats)
+
+
+class MessageWriter(object):
+    '''
+    Append frontend messages to a pypy.BytesBuilder and hand the whole batch
+    to a transport in one write
+    '''
+
+    def __init__(self, size_hint=4096, codec=None):
+        self.size_hint = size_hint
+        self.builder = pypy.BytesBuilder(size_hint)
+        self.size = 0
+        self.encode = _encode_utf8 if codec is None else codec.encode
+
+    def __len__(self):
+        return self.size
+
+    def _message(self, code, *parts):
+        length = 4
+        for part in parts:
+            length += len(part)
+        append = self.builder.append
+        append(ci_pack(code, length))
+        for part in parts:
+            append(part)
+        self.size += 1 + length
+
+    def append(self, data):
+        """
+        Append complete messages, e.g. constants.SYNC_MSG
+        """
+        self.builder.append(data)
+        self.size += len(data)
+
+    def startup(self, parameters,
+                protocol=constants.DEFAULT_PROTOCOL_VERSION):
+        """
+        Append a StartupMessage, which has no message code, with the
+        parameters (e.g. user, database) from the dict 'parameters'
+        """
+        parts = [i_pack(protocol)]
+        for key, value in sorted(parameters.items()):
+            parts.append(_cstring(key))
+            parts.append(_cstring(value))
+        parts.append(NUL)
+        length = 4
+        for part in parts:
+            length += len(part)
+        self.append(i_pack(length))
+        for part in parts:
+            self.append(part)
+
+    def password(self, password):
+        """
+        Append a PasswordMessage with a cleartext or md5 password
+        """
+        self._message(constants.PASSWORD, _cstring(password))
+
+    def sasl_initial_response(self, mechanism, data):
+        self._message(constants.PASSWORD, _cstring(mechanism),
+                      i_pack(len(data)), data)
+
+    def sasl_response(self, data):
+        self._message(constants.PASSWORD, data)
+
+    def terminate(self):
+        self.append(constants.TERMINATE_MSG)
+
+    def query(self, sql):
+        self._message(constants.QUERY, _cstring(sql, self.encode))
+
+    def parse(self, statement, sql, type_oids=()):
+        count = len(type_oids)
+        oids = binary.structs.get_pack('h' + 'I' * count)(count, *type_oids)
+        encode = self.encode
+        self._message(constants.PARSE, _cstring(statement, encode),
+                      _cstring(sql, encode), oids)
+
+    def bind(self, portal, statement, params=_no_params,
+             param_formats=constants.FC_BINARY,
+             result_formats=constants.FC_BINARY):
+        """
+        Bind the encoded parameters 'params' to 'statement'. The format
+        codes may be FC_TEXT or FC_BINARY, to use one format for every
+        parameter or result column, or a sequence with one per column.
+        """
+        encode = self.encode
+        self._message(constants.BIND, _cstring(portal, encode),
+                      _cstring(statement, encode),
+                      _format_codes(param_formats), params,
+                      _format_codes(result_formats))
+
+    def describe(self, kind, name):
+        """
+        Describe a constants.STATEMENT or a constants.PORTAL
+        """
+        self._message(constants.DESCRIBE, kind, _cstring(name, self.encode))
+
+    def execute(self, portal, max_rows=0):
+        self._message(constants.EXECUTE, _cstring(portal, self.encode),
+                      i_pack(max_rows))
+
+    def close(self, kind, name):
+        """
+        Close a constants.STATEMENT or a constants.PORTAL
+        """
+        self._message(constants.CLOSE, kind, _cstring(name, self.encode))
+
+    def sync(self):
+        self.append(constants.SYNC_MSG)
+
+    def flush(self):
+        self.append(constants.FLUSH_MSG)
+
+    def build(self):
+        """
+        Return the messages appended so far and start a new batch
+        """
+        data = self.builder.build()
+        self.builder = pypy.BytesBuilder(self.size_hint)
+        self.size = 0
+        return data
+
+    def write_to(self, transport):
+        """
+        Write the messages appended so far to 'transport' in one call
+        """
+        if self.size:
+            transport.write(self.build())
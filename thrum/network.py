@@ -0,0 +1,163 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Convert between the ipaddress module and the binary formats of the Postgres
+network address types:
+
+inet/cidr   uint8 family (PGSQL_AF_INET or PGSQL_AF_INET6), uint8 prefix
+            length, uint8 is_cidr, uint8 address length, then the address
+macaddr     6 bytes
+macaddr8    8 bytes
+
+inet values are returned as IPv4Address/IPv6Address when the prefix covers
+the whole address (the common case, and much the cheapest to build) or as
+IPv4Interface/IPv6Interface otherwise. cidr values are returned as
+IPv4Network/IPv6Network and MAC addresses as lowercase colon-separated
+strings.
+
+The *_recv_raw functions return integers and skip building objects at all.
+To use them for every result, register them in place of the defaults, e.g.:
+
+rows.register_binary_decoder(constants.INETOID, network.inet_recv_raw)
+"""
+
+import ipaddress
+import numbers
+
+from . import binary
+from . import constants
+
+PGSQL_AF_INET = constants.PGSQL_AF_INET
+PGSQL_AF_INET6 = constants.PGSQL_AF_INET6
+
+IPv4Address = ipaddress.IPv4Address
+IPv6Address = ipaddress.IPv6Address
+IPv4Interface = ipaddress.IPv4Interface
+IPv6Interface = ipaddress.IPv6Interface
+IPv4Network = ipaddress.IPv4Network
+IPv6Network = ipaddress.IPv6Network
+
+B_unpack = binary.B_unpack
+BBBB_pack = binary.BBBB_pack
+BBBBBB_unpack = binary.BBBBBB_unpack
+_v4_unpack = binary.structs.get_unpack('BBBBI')
+_v6_unpack = binary.structs.get_unpack('BBBBQQ')
+_mac_unpack = binary.structs.get_unpack('HI')
+_mac8_unpack = binary.structs.get_unpack('Q')
+_mac8_bytes_unpack = binary.structs.get_unpack('BBBBBBBB')
+
+_MAC_FORMAT = ':'.join(['%02x'] * 6)
+_MAC8_FORMAT = ':'.join(['%02x'] * 8)
+
+
+def _inet_unpack(data, offset):
+    family = B_unpack(data, offset)[0]
+    if family == PGSQL_AF_INET:
+        family, bits, is_cidr, size, address = _v4_unpack(data, offset)
+    elif family == PGSQL_AF_INET6:
+        family, bits, is_cidr, size, high, low = _v6_unpack(data, offset)
+        address = high << 64 | low
+    else:
+        raise ValueError("Unknown address family %r" % (family,))
+    return family, bits, address
+
+
+def inet_recv_raw(data, offset=0, length=None):
+    """
+    Return (family, prefix length, address as an int)
+    """
+    return _inet_unpack(data, offset)
+
+
+def inet_recv(data, offset=0, length=None):
+    family, bits, address = _inet_unpack(data, offset)
+    if family == PGSQL_AF_INET:
+        if bits == 32:
+            return IPv4Address(address)
+        return IPv4Interface((address, bits))
+    if bits == 128:
+        return IPv6Address(address)
+    return IPv6Interface((address, bits))
+
+
+def cidr_recv(data, offset=0, length=None):
+    family, bits, address = _inet_unpack(data, offset)
+    if family == PGSQL_AF_INET:
+        return IPv4Network((address, bits))
+    return IPv6Network((address, bits))
+
+
+cidr_recv_raw = inet_recv_raw
+
+
+def _inet_pack(address, bits, is_cidr):
+    if address.version == 4:
+        return BBBB_pack(PGSQL_AF_INET, bits, is_cidr, 4) + address.packed
+    return BBBB_pack(PGSQL_AF_INET6, bits, is_cidr, 16) + address.packed
+
+
+def inet_send(value):
+    """
+    Encode an address, interface or network from ipaddress, or a string
+    """
+    # Interfaces are subclasses of addresses, so check for them first
+    if isinstance(value, (IPv4Interface, IPv6Interface)):
+        return _inet_pack(value.ip, value.network.prefixlen, 0)
+    if isinstance(value, (IPv4Address, IPv6Address)):
+        return _inet_pack(value, value.max_prefixlen, 0)
+    if isinstance(value, (IPv4Network, IPv6Network)):
+        return _inet_pack(value.network_address, value.prefixlen, 0)
+    return inet_send(ipaddress.ip_interface(value))
+
+
+def cidr_send(value):
+    """
+    Encode a network from ipaddress, or a string
+    """
+    if not isinstance(value, (IPv4Network, IPv6Network)):
+        value = ipaddress.ip_network(value)
+    return _inet_pack(value.network_address, value.prefixlen, 1)
+
+
+def macaddr_recv_raw(data, offset=0, length=None):
+    high, low = _mac_unpack(data, offset)
+    return high << 32 | low
+
+
+def macaddr_recv(data, offset=0, length=None):
+    return _MAC_FORMAT % BBBBBB_unpack(data, offset)
+
+
+def macaddr8_recv_raw(data, offset=0, length=None):
+    return _mac8_unpack(data, offset)[0]
+
+
+def macaddr8_recv(data, offset=0, length=None):
+    return _MAC8_FORMAT % _mac8_bytes_unpack(data, offset)
+
+
+def _mac_bytes(value, size):
+    if isinstance(value, numbers.Integral):
+        if value < 0 or value >> (8 * size):
+            raise ValueError("Bad MAC address %r" % (value,))
+        return binary.Q_pack(value)[8 - size:]
+    digits = value
+    for separator in (':', '-', '.'):
+        digits = digits.replace(separator, '')
+    if len(digits) != size * 2:
+        raise ValueError("Bad MAC address %r" % (value,))
+    return bytes(bytearray.fromhex(digits))
+
+
+def macaddr_send(value):
+    """
+    Encode a MAC address given as a string or an int
+    """
+    return _mac_bytes(value, 6)
+
+
+def macaddr8_send(value):
+    return _mac_bytes(value, 8)
@@ -0,0 +1,185 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Collect the backend's NoticeResponses and hand them to handlers in batches,
+e.g.:
+
+sink = NoticeSink(interval=1.0, call_later=reactor.callLater)
+sink.handlers.append(log_notices)   # log_notices(list of Notice)
+sink.attach(protocol.connection)    # a connection.Connection
+
+A bulk load or a RAISE NOTICE loop can produce tens of thousands of notices,
+so rather than an event per notice the sink keeps them in a buffer of at
+most 'maxsize', discarding the oldest when it is full, and counts repeats
+of a notice (the same SQLSTATE and message) on the first instance of it
+instead of buffering them again. Everything buffered is delivered as one
+batch at most once every 'interval' seconds, or as soon as 'batch_size'
+different notices are waiting, if that is set.
+
+With 'call_later' (e.g. reactor.callLater or loop.call_later) a notice waits
+at most until the next delivery is due. Without it, deliveries only happen
+as notices arrive, and whatever remains is delivered by flush().
+
+An exception from a handler is logged and counted in 'failed', and the
+other handlers still get the batch.
+
+A Notice keeps the payload of its NoticeResponse and, like
+errors.PostgresError, only parses its fields when one of them is read.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+
+from . import errors
+
+log = logging.getLogger(__name__)
+
+
+class Notice(object):
+    '''
+    One NoticeResponse, with the attributes of errors.PostgresError.keys.
+    'count' is the number of times it arrived before it was delivered.
+    '''
+
+    __slots__ = ('payload', 'count', '_fields')
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.count = 1
+        self._fields = None
+
+    @property
+    def fields(self):
+        """
+        The dict of fields, parsed from the payload on first use
+        """
+        fields = self._fields
+        if fields is None:
+            fields = self._fields = errors.parse_fields(self.payload)
+        return fields
+
+    def key(self):
+        """
+        The undecoded SQLSTATE and message, which duplicates share
+        """
+        payload = self.payload
+        return (errors.find_field(payload, b'C'),
+                errors.find_field(payload, b'M'))
+
+    def __repr__(self):
+        return '<Notice %s: %s (x%d)>' % (self.sqlstate_code,
+                                          self.message, self.count)
+
+
+for _key, _name in errors.PostgresError.keys.items():
+    setattr(Notice, _name, errors.field_property(_key))
+
+
+class NoticeSink(object):
+    '''
+    Buffer, coalesce and deliver notices. 'received' counts every notice,
+    'coalesced' those counted on an earlier duplicate, 'dropped' those
+    discarded from a full buffer and 'delivered' those handed to handlers.
+    'failed' counts the handler calls that raised an exception.
+    '''
+
+    def __init__(self, maxsize=1000, interval=1.0, batch_size=None,
+                 call_later=None, clock=time.time):
+        if maxsize < 1:
+            raise ValueError("Bad buffer size %s" % (maxsize,))
+        self.maxsize = maxsize
+        self.interval = interval
+        self.batch_size = batch_size
+        self.call_later = call_later
+        self.clock = clock
+        # Each called with a list of Notice
+        self.handlers = []
+
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.failed = 0
+
+        self._buffer = OrderedDict()
+        self._last = None
+        self._timer = None
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def __call__(self, notice):
+        """
+        Take a Notice, as a notice callback of connection.Connection
+        """
+        self.received += 1
+        buffer = self._buffer
+        key = notice.key()
+        existing = buffer.get(key)
+        if existing is not None:
+            existing.count += 1
+            self.coalesced += 1
+        else:
+            if len(buffer) >= self.maxsize:
+                buffer.popitem(last=False)
+                self.dropped += 1
+            buffer[key] = notice
+
+        if self.batch_size is not None and len(buffer) >= self.batch_size:
+            self.flush()
+            return
+        wait = self._wait()
+        if wait <= 0:
+            self.flush()
+        elif self._timer is None and self.call_later is not None:
+            self._timer = self.call_later(wait, self._fire)
+
+    def attach(self, connection):
+        connection.notice_callbacks.append(self)
+
+    def detach(self, connection):
+        connection.notice_callbacks.remove(self)
+
+    def _wait(self):
+        if self._last is None:
+            return 0
+        return self._last + self.interval - self.clock()
+
+    def _fire(self):
+        self._timer = None
+        self.flush()
+
+    def flush(self):
+        """
+        Deliver everything buffered now
+        """
+        if self._timer is not None:
+            timer = self._timer
+            self._timer = None
+            timer.cancel()
+        buffer = self._buffer
+        if not buffer:
+            return
+        batch = list(buffer.values())
+        buffer.clear()
+        self._last = self.clock()
+        self.delivered += len(batch)
+        for handler in self.handlers:
+            try:
+                handler(batch)
+            except Exception:
+                self.failed += 1
+                log.exception("Error delivering %d notices to %r",
+                              len(batch), handler)
+
+    def stats(self):
+        return {'buffered': len(self._buffer),
+                'received': self.received,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'delivered': self.delivered,
+                'failed': self.failed}
@@ -0,0 +1,218 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Fan NOTIFY messages out to subscribers by channel, e.g.:
+
+dispatcher = Dispatcher(listen=send_listen, unlisten=send_unlisten)
+dispatcher.attach(connection)     # a connection.Connection
+dispatcher.subscribe(u'invalidate', callback=on_invalidate)
+sub = dispatcher.subscribe(u'jobs', maxsize=100, policy=DROP_NEWEST)
+sub.request(on_job)     # on_job(notification) with the next one queued
+
+The connection parses each NotificationResponse as soon as it arrives, even
+between the responses to a query, and the dispatcher finds the channel's
+subscribers with one dict lookup. The subscribers of a channel are kept in a
+tuple that is replaced when they change, so delivery is a plain loop and a
+subscriber may unsubscribe from inside its callback.
+
+A subscriber either has a callback, which is called with each Notification,
+or a queue of at most 'maxsize' that it takes Notifications from with
+request(). When a queue is full its policy decides what is lost:
+DROP_OLDEST discards the oldest queued notification, DROP_NEWEST the one
+arriving, and RESET discards the whole queue and queues OVERFLOW, so a
+consumer such as a cache knows to invalidate everything.
+
+An exception from a subscriber's callback is logged and counted in
+'failed', and doesn't stop the other subscribers getting the notification
+or reach the connection.
+
+'listen' and 'unlisten' are called with a channel when its first subscriber
+arrives and its last one leaves, to send LISTEN and UNLISTEN. The Twisted and
+asyncio protocols each have a Dispatcher wired up this way, as 'dispatcher',
+so one dedicated listening connection can serve any number of subscribers.
+"""
+
+import logging
+from collections import deque
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+Notification = namedtuple('Notification', ('pid', 'channel', 'payload'))
+
+# Queued in place of the notifications that a RESET subscriber lost
+OVERFLOW = Notification(None, None, None)
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+RESET = 'reset'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, RESET)
+
+
+def quote_ident(name):
+    """
+    Quote a channel name for LISTEN, UNLISTEN or NOTIFY
+    """
+    return u'"' + name.replace(u'"', u'""') + u'"'
+
+
+class Subscription(object):
+    '''
+    One subscriber to one channel. 'received' counts the notifications
+    delivered to it and 'dropped' those that its queue had no room for.
+    '''
+
+    def __init__(self, dispatcher, channel, callback=None, maxsize=1000,
+                 policy=DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError("Unknown policy %r" % (policy,))
+        if maxsize < 1:
+            raise ValueError("Bad queue size %s" % (maxsize,))
+        self.dispatcher = dispatcher
+        self.channel = channel
+        self.callback = callback
+        self.maxsize = maxsize
+        self.policy = policy
+        self.queue = deque()
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+        self._waiter = None
+
+    def __len__(self):
+        return len(self.queue)
+
+    def deliver(self, notification):
+        self.received += 1
+        if self.callback is not None:
+            self.callback(notification)
+            return
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            waiter(notification)
+            return
+        queue = self.queue
+        if len(queue) < self.maxsize:
+            queue.append(notification)
+        elif self.policy == DROP_OLDEST:
+            queue.popleft()
+            queue.append(notification)
+            self.dropped += 1
+        elif self.policy == DROP_NEWEST:
+            self.dropped += 1
+        else:
+            self.dropped += len(queue) + 1
+            if queue[0] is OVERFLOW:
+                self.dropped -= 1
+            queue.clear()
+            queue.append(OVERFLOW)
+
+    def request(self, callback):
+        """
+        Call callback(notification) with the next queued Notification,
+        which may be at once, or with None once the subscription is closed
+        """
+        if self._waiter is not None:
+            raise ValueError("A notification has already been requested")
+        if self.queue:
+            callback(self.queue.popleft())
+        elif self.closed:
+            callback(None)
+        else:
+            self._waiter = callback
+
+    def close(self):
+        """
+        Unsubscribe. Queued notifications can still be requested.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.dispatcher._remove(self)
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            waiter(None)
+
+
+class Dispatcher(object):
+    '''
+    Route notifications to the Subscriptions for their channels. A
+    Dispatcher is a notification callback for connection.Connection.
+    '''
+
+    def __init__(self, listen=None, unlisten=None):
+        self.listen = listen
+        self.unlisten = unlisten
+        self.channels = {}
+        self.unrouted = 0
+        self.failed = 0
+
+    def __len__(self):
+        """
+        The number of subscribers
+        """
+        return sum(len(subs) for subs in self.channels.values())
+
+    def __call__(self, pid, channel, payload):
+        subs = self.channels.get(channel)
+        if subs is None:
+            self.unrouted += 1
+            return
+        notification = Notification(pid, channel, payload)
+        for sub in subs:
+            try:
+                sub.deliver(notification)
+            except Exception:
+                self.failed += 1
+                log.exception("Error delivering a notification on %r",
+                              channel)
+
+    def attach(self, connection):
+        connection.notification_callbacks.append(self)
+
+    def detach(self, connection):
+        connection.notification_callbacks.remove(self)
+
+    def subscribe(self, channel, callback=None, maxsize=1000,
+                  policy=DROP_OLDEST):
+        """
+        Return a new Subscription to 'channel'
+        """
+        sub = Subscription(self, channel, callback, maxsize, policy)
+        subs = self.channels.get(channel)
+        if subs is None:
+            self.channels[channel] = (sub,)
+            if self.listen is not None:
+                self.listen(channel)
+        else:
+            self.channels[channel] = subs + (sub,)
+        return sub
+
+    def unsubscribe(self, sub):
+        sub.close()
+
+    def _remove(self, sub):
+        subs = self.channels.get(sub.channel, ())
+        if sub not in subs:
+            return
+        subs = tuple(other for other in subs if other is not sub)
+        if subs:
+            self.channels[sub.channel] = subs
+            return
+        del self.channels[sub.channel]
+        if self.unlisten is not None:
+            self.unlisten(sub.channel)
+
+    def stats(self):
+        return {'channels': len(self.channels),
+                'subscribers': len(self),
+                'unrouted': self.unrouted,
+                'failed': self.failed,
+                'dropped': sum(sub.dropped
+                               for subs in self.channels.values()
+                               for sub in subs)}
@@ -0,0 +1,145 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Convert between decimal.Decimal and the binary format of the Postgres NUMERIC
+type, which is:
+
+int16 ndigits, int16 weight, uint16 sign, int16 dscale,
+then ndigits x int16 base-10000 digits, most significant first
+
+The value is sum(digit[i] * 10000 ** (weight - i)) and dscale is the number
+of decimal places to display. The conversion is done with integer arithmetic
+on the coefficient rather than by formatting and parsing strings, and the
+digits are packed and unpacked with a single struct call.
+"""
+
+import decimal
+
+from . import binary
+from . import constants
+
+Decimal = decimal.Decimal
+
+Cache = binary.Cache
+hhHh_pack = binary.hhHh_pack
+hhHh_unpack = binary.hhHh_unpack
+h_unpack = binary.h_unpack
+
+NUMERIC_POS = constants.NUMERIC_POS
+NUMERIC_NEG = constants.NUMERIC_NEG
+NUMERIC_NAN = constants.NUMERIC_NAN
+NUMERIC_PINF = constants.NUMERIC_PINF
+NUMERIC_NINF = constants.NUMERIC_NINF
+
+# Changing the exponent of a Decimal in this context never rounds it. The
+# limits are only named on Python 3; these are their 64-bit values.
+_exact = decimal.Context(
+    prec=getattr(decimal, 'MAX_PREC', 999999999999999999),
+    Emax=getattr(decimal, 'MAX_EMAX', 999999999999999999),
+    Emin=getattr(decimal, 'MIN_EMIN', -999999999999999999))
+
+_powers = [10 ** index for index in range(8)]
+
+# Unpack the header and the digits together, for the common digit counts
+_unpackers = [binary.structs.get_unpack('hhHh' + 'h' * ndigits)
+              for ndigits in range(17)]
+
+_special = {NUMERIC_NAN: Decimal('NaN'),
+            NUMERIC_PINF: Decimal('Infinity'),
+            NUMERIC_NINF: Decimal('-Infinity')}
+
+NAN_DATA = hhHh_pack(0, 0, NUMERIC_NAN, 0)
+PINF_DATA = hhHh_pack(0, 0, NUMERIC_PINF, 0)
+NINF_DATA = hhHh_pack(0, 0, NUMERIC_NINF, 0)
+
+
+def numeric_recv(data, offset=0, length=None):
+    """
+    Return the Decimal encoded at 'offset' in 'data'
+    """
+    ndigits = h_unpack(data, offset)[0]
+    if ndigits < 17:
+        values = _unpackers[ndigits](data, offset)
+        weight, sign, dscale = values[1:4]
+        digits = values[4:]
+    else:
+        weight, sign, dscale = hhHh_unpack(data, offset)[1:]
+        digits = Cache.get_unpack_shorts_for_index(ndigits)(data, offset + 8)
+
+    if sign != NUMERIC_POS and sign != NUMERIC_NEG:
+        try:
+            return _special[sign]
+        except KeyError:
+            raise ValueError("Bad sign 0x%04x for numeric" % (sign,))
+
+    coefficient = 0
+    if ndigits:
+        for digit in digits:
+            coefficient = coefficient * 10000 + digit
+
+        # 'coefficient' is in units of 10000 ** (weight - ndigits + 1) and we
+        # want it in units of 10 ** -dscale
+        shift = 4 * (weight - ndigits + 1) + dscale
+        if shift > 0:
+            coefficient *= 10 ** shift
+        elif shift < 0:
+            coefficient //= 10 ** -shift
+        if sign == NUMERIC_NEG:
+            coefficient = -coefficient
+
+    if dscale:
+        return Decimal(coefficient).scaleb(-dscale, _exact)
+    return Decimal(coefficient)
+
+
+def numeric_send(value):
+    """
+    Return the binary encoding of 'value', which may be a Decimal, an int or
+    a float
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        sign = NUMERIC_NEG if value < 0 else NUMERIC_POS
+        coefficient = -value if value < 0 else value
+        exponent = 0
+    else:
+        if not isinstance(value, Decimal):
+            if isinstance(value, float):
+                # The shortest repr, rather than the exact binary fraction
+                value = Decimal(repr(value))
+            else:
+                value = Decimal(value)
+        if not value.is_finite():
+            if value.is_nan():
+                return NAN_DATA
+            return NINF_DATA if value.is_signed() else PINF_DATA
+        exponent = value.as_tuple()[2]
+        coefficient = int(value.scaleb(-exponent, _exact))
+        sign = NUMERIC_NEG if coefficient < 0 else NUMERIC_POS
+        if coefficient < 0:
+            coefficient = -coefficient
+
+    dscale = -exponent if exponent < 0 else 0
+
+    # Line the digit groups up with the decimal point
+    pad = exponent % 4
+    if pad:
+        coefficient *= _powers[pad]
+        exponent -= pad
+
+    digits = []
+    while coefficient:
+        coefficient, digit = divmod(coefficient, 10000)
+        if digit or digits:
+            digits.append(digit)
+        else:
+            # Trailing zero groups are implied by the weight
+            exponent += 4
+    digits.reverse()
+
+    ndigits = len(digits)
+    weight = ndigits - 1 + exponent // 4 if ndigits else 0
+    return Cache.get_pack_shorts_for_index(4 + ndigits)(
+        ndigits, weight, sign, dscale, *digits)
@@ -0,0 +1,327 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Bulk load and export rows with COPY ... FROM STDIN / TO STDOUT (FORMAT binary)
+
+The PGCOPY binary format is an 11 byte signature, an int32 flags field and an
+int32 header extension length, followed by each tuple (an int16 field count,
+then an int32 length, or -1 for NULL, and the bytes of each field) and an
+int16 -1 trailer. e.g. once the backend has sent CopyInResponse:
+
+for message in copy_in_messages(rows, (constants.INT4OID, constants.TEXTOID)):
+    transport.write(message)
+
+The stream is produced lazily in CopyData messages of about 'chunk_size'
+bytes, so memory use doesn't depend on the number of rows.
+
+To export, feed the payload of each CopyData message that follows
+CopyOutResponse to a CopyOutDecoder, which builds one output per column
+rather than one tuple per row, e.g.:
+
+decoder = CopyOutDecoder((constants.INT8OID, constants.TEXTOID))
+for payload in copy_data_payloads:
+    decoder.feed(payload)
+ids, names = decoder.columns()
+"""
+
+import array
+import sys
+
+from . import binary
+from . import constants
+from . import errors
+from . import pypy
+from . import rows as _rows
+
+SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+HEADER = SIGNATURE + binary.ii_pack(0, 0)
+TRAILER = binary.h_pack(-1)
+
+DEFAULT_CHUNK_SIZE = 65536
+
+_zeros = dict((size, b'\x00' * size) for size in (1, 2, 4, 8))
+
+
+def copy_data_message(payload):
+    return binary.ci_pack(constants.COPY_DATA, len(payload) + 4) + payload
+
+
+def copy_in_chunks(rows, type_oids, chunk_size=DEFAULT_CHUNK_SIZE,
+                   codec=None):
+    """
+    Yield the PGCOPY binary encoding of 'rows' (an iterable of sequences of
+    Python values of the types in 'type_oids') in chunks of at least
+    'chunk_size' bytes (except the last one), with text in the client
+    encoding of 'codec', a textcodec.TextCodec, or UTF-8
+    """
+    encode_row = _rows.get_row_encoder(tuple(type_oids), codec)
+    builder = pypy.BytesBuilder(chunk_size)
+    builder.append(HEADER)
+    size = len(HEADER)
+
+    for row in rows:
+        data = encode_row(row)
+        builder.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield builder.build()
+            builder = pypy.BytesBuilder(chunk_size)
+            size = 0
+
+    builder.append(TRAILER)
+    yield builder.build()
+
+
+def copy_in_messages(rows, type_oids, chunk_size=DEFAULT_CHUNK_SIZE,
+                     codec=None):
+    """
+    Yield CopyData messages for 'rows', followed by CopyDone
+    """
+    for chunk in copy_in_chunks(rows, type_oids, chunk_size, codec):
+        yield copy_data_message(chunk)
+    yield constants.COPY_DONE_MSG
+
+
+def _fixed_decoder(struc):
+    unpack_from = struc.unpack_from
+
+    def decode(data, pos, length):
+        return unpack_from(data, pos)[0]
+    return decode
+
+
+class CopyOutDecoder(object):
+    '''
+    Decode a PGCOPY binary stream into columns: an array.array for each
+    fixed-width column and a list for each other column. Fixed-width NULLs
+    are stored as zero and the row numbers of the NULLs in each column are
+    listed in nulls[column]; other columns hold None. A fixed-width type
+    with no array.array typecode (int8 on Python 2) gets a list.
+
+    Tuples may span CopyData messages. When every column is fixed-width and
+    a message holds no NULLs, all of its complete tuples are gathered with a
+    number of calls that depends on the number of columns, not rows.
+    '''
+
+    _swap = sys.byteorder == 'little'
+
+    def __init__(self, type_oids):
+        self.type_oids = tuple(type_oids)
+        self.row_count = 0
+        self.done = False
+        self.nulls = [[] for _ in self.type_oids]
+
+        # Bytes of an incomplete tuple, from _offset on
+        self._buffer = bytearray()
+        self._offset = 0
+        self._header = False
+        self._fields = []
+        self._raw = []
+        self._values = []
+        for type_oid in self.type_oids:
+            struc = _rows.fixed_width.get(type_oid)
+            typecode = None
+            if struc is not None:
+                typecode = binary.array_typecode(
+                    struc.format[-1].replace('?', 'B'), struc.size)
+            if typecode is not None:
+                self._fields.append((typecode, struc.size, None))
+                self._raw.append(bytearray())
+                self._values.append(None)
+            else:
+                decoder = _rows.binary_decoders.get(type_oid)
+                if decoder is None and struc is not None:
+                    decoder = _fixed_decoder(struc)
+                self._fields.append((None, None, decoder))
+                self._raw.append(None)
+                self._values.append([])
+
+        self._stride = None
+        if self.type_oids and all(raw is not None for raw in self._raw):
+            template = [binary.h_pack(len(self.type_oids))]
+            offsets = []
+            stride = 2
+            for typecode, size, decoder in self._fields:
+                template.append(binary.i_pack(size))
+                offsets.append(stride + 4)
+                stride += 4 + size
+            self._stride = stride
+            self._offsets = offsets
+            template = b''.join(template)
+            positions = [0, 1]
+            for offset in offsets:
+                positions.extend(range(offset - 4, offset))
+            self._template = [(position, template[index:index + 1])
+                              for index, position in enumerate(positions)]
+
+    def feed(self, data):
+        """
+        Consume the payload of a CopyData message
+        """
+        if self.done:
+            raise errors.ThrumError("COPY data received after the trailer")
+        if not binary.strided_views and isinstance(data, memoryview):
+            # _parse_fixed slices the data with a step
+            data = data.tobytes()
+        buf = self._buffer
+        if self._offset < len(buf):
+            buf += data
+            data = buf
+            pos = self._offset
+        else:
+            pos = 0
+        if not self._header:
+            pos = self._parse_header(data)
+            if pos is None:
+                if data is not buf:
+                    buf += data
+                return
+        if self._stride is None:
+            pos = self._parse_tuples(data, pos)
+        else:
+            # Gather runs of tuples without NULLs in bulk, stepping over the
+            # tuples that break them up one at a time. If NULLs are so common
+            # that there are no runs, step over more tuples before trying
+            # again.
+            limit = 16
+            while not self.done:
+                following = self._parse_fixed(data, pos)
+                if following == pos:
+                    limit *= 2
+                else:
+                    limit = 16
+                pos = self._parse_tuples(data, following, limit)
+                if pos == following:
+                    break
+        self._keep(data, pos)
+
+    def _keep(self, data, pos):
+        """
+        Keep what follows 'pos' in 'data' for the next message. A tuple that
+        spans many messages is appended to one buffer, which is only
+        compacted once more than half of it has been consumed, so the cost
+        stays linear in its size.
+        """
+        buf = self._buffer
+        if data is not buf:
+            del buf[:]
+            buf += data[pos:]
+            self._offset = 0
+        elif pos >= len(buf):
+            del buf[:]
+            self._offset = 0
+        elif pos > len(buf) // 2:
+            del buf[:pos]
+            self._offset = 0
+        else:
+            self._offset = pos
+
+    def _parse_header(self, data):
+        if len(data) < 19:
+            return None
+        if binary.to_bytes(data[:11]) != SIGNATURE:
+            raise errors.ThrumError("COPY data is not in the binary format")
+        flags, extension = binary.ii_unpack(data, 11)
+        if len(data) < 19 + extension:
+            return None
+        self._header = True
+        return 19 + extension
+
+    def _parse_fixed(self, data, pos):
+        stride = self._stride
+        count = (len(data) - pos) // stride
+        while count >= 16:
+            end = pos + count * stride
+            for position, expected in self._template:
+                if data[pos + position:end:stride] != expected * count:
+                    break
+            else:
+                break
+            # Something (a NULL or the trailer) breaks up the run of tuples,
+            # so try a shorter one
+            count //= 2
+        else:
+            return pos
+
+        for (typecode, size, decoder), offset, raw in zip(self._fields,
+                                                          self._offsets,
+                                                          self._raw):
+            column = bytearray(count * size)
+            start = pos + offset
+            for index in range(size):
+                column[index::size] = data[start + index:end:stride]
+            raw += column
+        self.row_count += count
+        return end
+
+    def _parse_tuples(self, data, pos, limit=None):
+        i_unpack = binary.i_unpack
+        end = len(data)
+        fields = self._fields
+        raw = self._raw
+        values = self._values
+        nulls = self.nulls
+        width = len(fields)
+        zeros = _zeros
+
+        while end - pos >= 2 and limit != 0:
+            count = binary.h_unpack(data, pos)[0]
+            if count == -1:
+                self.done = True
+                return pos + 2
+            if count != width:
+                msg = "COPY tuple has %s fields, expected %s"
+                raise errors.ThrumError(msg % (count, width))
+
+            following = pos + 2
+            for _ in range(count):
+                if end - following < 4:
+                    return pos
+                following += 4 + max(i_unpack(data, following)[0], 0)
+            if following > end:
+                return pos
+
+            row = self.row_count
+            pos += 2
+            for column, (typecode, size, decoder) in enumerate(fields):
+                length = i_unpack(data, pos)[0]
+                pos += 4
+                if length < 0:
+                    nulls[column].append(row)
+                    if typecode is None:
+                        values[column].append(None)
+                    else:
+                        raw[column] += zeros[size]
+                    continue
+                if typecode is not None:
+                    raw[column] += data[pos:pos + length]
+                elif decoder is not None:
+                    values[column].append(decoder(data, pos, length))
+                else:
+                    values[column].append(
+                        binary.to_bytes(data[pos:pos + length]))
+                pos += length
+            self.row_count = row + 1
+            if limit is not None:
+                limit -= 1
+        return pos
+
+    def columns(self):
+        """
+        Return the decoded columns
+        """
+        rval = []
+        columns = zip(self._fields, self._raw, self._values)
+        for (typecode, size, decoder), raw, values in columns:
+            if typecode is None:
+                rval.append(values)
+                continue
+            column = array.array(typecode)
+            binary.array_frombytes(column, raw)
+            if self._swap and size > 1:
+                column.byteswap()
+            rval.append(column)
+        return rval
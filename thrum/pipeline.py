@@ -0,0 +1,375 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Send many extended query protocol statements in one write, terminated by a
+single Sync, and match the backend's responses back to each statement, e.g.:
+
+pipeline = Pipeline()
+insert = pipeline.executemany(u'INSERT INTO t VALUES ($1, $2)',
+                              [(1, u'one'), (2, u'two')],
+                              (constants.INT4OID, constants.TEXTOID))
+select = pipeline.execute(u'SELECT count(*) FROM t')
+pipeline.write_to(transport)
+...
+framer.dispatch(pipeline.handlers)    # as data arrives, until pipeline.done
+select.raise_error()
+count, = select.rows[0]
+
+This turns N round trips into one. A Parse is only sent when the SQL or the
+parameter types differ from the previous statement's, since the unnamed
+prepared statement lasts until the next Parse, and the rows of repeated
+executions are decoded with the layout described for the first of them.
+
+Between Syncs the backend runs every statement in one implicit transaction,
+unless the pipeline itself begins one. If a statement fails, the backend
+skips the rest of the pipeline and rolls back what came before it: the
+statement that failed gets the PostgresError and those that followed get
+errors.PipelineAborted.
+
+To keep named prepared statements on the backend and skip Parse and Describe
+for statements that have been seen before, give the pipeline a
+statements.StatementCache that lasts as long as the connection.
+
+Parameters are sent and results are requested in the binary format, so the
+parameter types must be given. SQL and text parameters are encoded with
+'codec', the textcodec.TextCodec for the connection's client_encoding, or as
+UTF-8 without one. Columns of types without a binary decoder are returned as
+bytes, as they are by rows.get_row_decoder, unless 'decode_text' is set:
+then the text columns of each statement's rows are decoded once they have
+all arrived.
+
+A statement executed with 'columnar' set collects its DataRows into a
+columnar.NumpyColumns rather than decoding them into rows, and its
+StatementResult's 'arrays' holds the columns once it completes, e.g.:
+
+result = pipeline.execute(u'SELECT id, score FROM t', columnar=True)
+...
+ids, scores = result.arrays
+"""
+
+from collections import deque
+
+from . import binary
+from . import columnar as _columnar
+from . import constants
+from . import errors
+from . import messages
+from . import rows as _rows
+from . import textcodec
+
+# The responses we expect for each message that we send
+PARSE = 'parse'
+BIND = 'bind'
+DESCRIBE = 'describe'
+EXECUTE = 'execute'
+CLOSE = 'close'
+
+
+class StatementResult(object):
+    '''
+    The outcome of one statement in a pipeline: the columns described by its
+    RowDescription (None if it returns no rows), its rows, its command tag
+    (e.g. b'INSERT 0 1') and, if it failed or was skipped, its error. With
+    'columnar' set, 'rows' stays empty and 'arrays' holds the columns that
+    columnar.NumpyColumns collected instead.
+    '''
+
+    def __init__(self, sql, params=None, columnar=False):
+        self.sql = sql
+        self.params = params
+        self.columnar = columnar
+        self.columns = None
+        self.rows = []
+        self.arrays = None
+        self.collector = None
+        self.command_tag = None
+        self.error = None
+        self.done = False
+
+    def raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+
+class _Prepared(object):
+    '''
+    The unnamed statement's row layout, shared by the statements that reuse
+    its Parse
+    '''
+
+    def __init__(self):
+        self.columns = None
+        self.decode_row = None
+        self.parsed = False
+        self.described = False
+
+    def describe(self, columns, codec=None):
+        # The portal's RowDescription has the result formats we asked for
+        self.columns = columns
+        self.decode_row = _rows.get_row_decoder(_rows.row_key(columns), codec)
+        self.described = True
+
+    def no_data(self):
+        self.described = True
+
+
+class Pipeline(object):
+    '''
+    Queue statements, write them with one Sync and consume the responses,
+    which are dispatched to 'handlers'. 'done' is set, and each function in
+    'callbacks' is called with the pipeline, when ReadyForQuery arrives.
+    '''
+
+    exclusive = False
+
+    def __init__(self, writer=None, statements=None, codec=None,
+                 decode_text=False):
+        if codec is None:
+            codec = textcodec.get_codec(u'UTF8')
+        self.writer = writer if writer is not None else \
+            messages.MessageWriter(codec=codec)
+        self.statements = statements
+        self.codec = codec
+        self.decode_text = decode_text
+        self.results = []
+        self.done = False
+        self.sent = False
+        self.transaction_status = None
+        self.error = None
+        self.callbacks = []
+
+        self._steps = deque()
+        self._last_parse = None
+        self._prepared = None
+
+        self.handlers = {
+            constants.PARSE_COMPLETE: self.parse_complete,
+            constants.BIND_COMPLETE: self.bind_complete,
+            constants.CLOSE_COMPLETE: self.close_complete,
+            constants.PARAMETER_DESCRIPTION: self.parameter_description,
+            constants.ROW_DESCRIPTION: self.row_description,
+            constants.NO_DATA: self.no_data,
+            constants.DATA_ROW: self.data_row,
+            constants.COMMAND_COMPLETE: self.command_complete,
+            constants.EMPTY_QUERY_RESPONSE: self.empty_query_response,
+            constants.ERROR_RESPONSE: self.error_response,
+            constants.READY_FOR_QUERY: self.ready_for_query,
+        }
+
+    def __len__(self):
+        return len(self.results)
+
+    def execute(self, sql, params=(), type_oids=(), columnar=False):
+        """
+        Queue 'sql' with the parameters 'params' of the types 'type_oids' and
+        return its StatementResult, whose rows are collected into numpy
+        arrays if 'columnar' is set
+        """
+        if self.sent:
+            raise errors.ThrumError("Pipeline has already been sent")
+        if columnar and _columnar.numpy is None:
+            raise errors.ThrumError("numpy is not installed")
+        type_oids = tuple(type_oids)
+        if len(params) != len(type_oids):
+            msg = "%s parameters given for %s types"
+            raise errors.ThrumError(msg % (len(params), len(type_oids)))
+
+        writer = self.writer
+        steps = self._steps
+        result = StatementResult(sql, params, columnar)
+        describe = False
+        if self.statements is not None:
+            prepared = self._prepare(sql, type_oids, result)
+            name = prepared.name
+        else:
+            if (sql, type_oids) != self._last_parse:
+                self._prepared = _Prepared()
+                writer.parse(b'', sql, type_oids)
+                steps.append((PARSE, result, self._prepared))
+                self._last_parse = (sql, type_oids)
+                describe = True
+            prepared = self._prepared
+            name = b''
+
+        encode_row = _rows.get_row_encoder(type_oids, self.codec)
+        writer.bind(b'', name, encode_row(params))
+        steps.append((BIND, result, prepared))
+        if describe:
+            writer.describe(constants.PORTAL, b'')
+            steps.append((DESCRIBE, result, prepared))
+        writer.execute(b'')
+        steps.append((EXECUTE, result, prepared))
+        self.results.append(result)
+        return result
+
+    def _prepare(self, sql, type_oids, result):
+        """
+        Return the cached PreparedStatement for 'sql', first queueing the
+        Parse and Describe for it if it isn't cached, and the Close for any
+        statement that it evicts
+        """
+        statements = self.statements
+        statement = statements.get(sql, type_oids)
+        if statement is not None:
+            return statement
+
+        writer = self.writer
+        steps = self._steps
+        statement = statements.add(sql, type_oids)
+        writer.parse(statement.name, sql, type_oids)
+        steps.append((PARSE, result, statement))
+        writer.describe(constants.STATEMENT, statement.name)
+        steps.append((DESCRIBE, result, statement))
+        for name in statements.take_closing():
+            writer.close(constants.STATEMENT, name)
+            steps.append((CLOSE, result, name))
+        return statement
+
+    def executemany(self, sql, params_seq, type_oids=(), columnar=False):
+        """
+        Queue 'sql' once for each sequence of parameters in 'params_seq' and
+        return the list of their StatementResults
+        """
+        return [self.execute(sql, params, type_oids, columnar)
+                for params in params_seq]
+
+    def build(self):
+        """
+        Return the queued messages and the terminating Sync as one buffer
+        """
+        if self.sent:
+            raise errors.ThrumError("Pipeline has already been sent")
+        self.writer.sync()
+        self.sent = True
+        return self.writer.build()
+
+    def write_to(self, transport):
+        transport.write(self.build())
+
+    def _next(self, expected):
+        if not self._steps or self._steps[0][0] != expected:
+            raise errors.ThrumError("Unexpected %s response in pipeline" %
+                                    (expected,))
+        return self._steps.popleft()
+
+    def parse_complete(self, payload):
+        self._next(PARSE)[2].parsed = True
+
+    def bind_complete(self, payload):
+        self._next(BIND)
+
+    def close_complete(self, payload):
+        self._next(CLOSE)
+
+    def parameter_description(self, payload):
+        # This precedes the RowDescription or NoData for the same Describe
+        if not self._steps or self._steps[0][0] != DESCRIBE:
+            raise errors.ThrumError("Unexpected ParameterDescription in "
+                                    "pipeline")
+        count = binary.h_unpack(payload)[0]
+        self._steps[0][2].param_oids = \
+            binary.structs.get_unpack('I' * count)(payload, 2)
+
+    def row_description(self, payload):
+        kind, result, prepared = self._next(DESCRIBE)
+        prepared.describe(_rows.parse_row_description(payload), self.codec)
+
+    def no_data(self, payload):
+        self._next(DESCRIBE)[2].no_data()
+
+    def data_row(self, payload):
+        kind, result, prepared = self._steps[0]
+        if kind != EXECUTE or prepared.decode_row is None:
+            raise errors.ThrumError("Unexpected DataRow in pipeline")
+        if result.columnar:
+            if result.collector is None:
+                result.collector = _columnar.NumpyColumns(
+                    _rows.row_key(prepared.columns))
+            result.collector.feed(payload)
+            return
+        result.rows.append(prepared.decode_row(payload))
+
+    def command_complete(self, payload):
+        kind, result, prepared = self._next(EXECUTE)
+        result.columns = prepared.columns
+        if result.columnar and result.columns is not None:
+            collector = result.collector
+            if collector is None:
+                collector = _columnar.NumpyColumns(
+                    _rows.row_key(result.columns))
+            result.arrays = collector.columns()
+            result.collector = None
+        if self.decode_text and result.rows:
+            result.rows = self.codec.decode_rows(result.rows, result.columns)
+        result.command_tag = bytes(payload[:-1])
+        result.done = True
+
+    def empty_query_response(self, payload):
+        kind, result, prepared = self._next(EXECUTE)
+        result.done = True
+
+    def error_response(self, payload):
+        error = errors.from_payload(payload)
+        if self._steps:
+            result = self._steps[0][1]
+            result.error = error
+        if self.error is None:
+            self.error = error
+
+        # The backend discards everything up to the Sync
+        aborted = None
+        while self._steps:
+            kind, result, prepared = self._steps.popleft()
+            if self.statements is not None:
+                self._abandon(kind, prepared)
+            if result.error is None:
+                if aborted is None:
+                    aborted = errors.PipelineAborted(
+                        "Skipped after an earlier statement failed: %s" %
+                        (error,))
+                result.error = aborted
+
+    def _abandon(self, kind, prepared):
+        """
+        Keep the statement cache in step with the backend when a message is
+        discarded
+        """
+        statements = self.statements
+        if kind == CLOSE:
+            # The statement is still open, so try again next time
+            statements.closing.append(prepared)
+        elif kind in (PARSE, DESCRIBE) and not prepared.described:
+            if prepared.name in statements.closing:
+                return
+            statements.discard(prepared)
+            if prepared.parsed:
+                statements.closing.append(prepared.name)
+
+    def abort(self, error):
+        """
+        Fail every statement that hasn't completed, e.g. because the
+        connection was lost, and finish the pipeline
+        """
+        if self.done:
+            return
+        if self.error is None:
+            self.error = error
+        for result in self.results:
+            if not result.done and result.error is None:
+                result.error = error
+        self._steps.clear()
+        self.done = True
+        for callback in self.callbacks:
+            callback(self)
+
+    def ready_for_query(self, payload):
+        if self._steps:
+            raise errors.ThrumError("ReadyForQuery before the pipeline "
+                                    "completed")
+        self.transaction_status = bytes(payload[:1])
+        self.done = True
+        for callback in self.callbacks:
+            callback(self)
@@ -0,0 +1,222 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+A Twisted connection pool that only hands out connections that are truly
+idle: connected, with nothing in flight, and with IDLE as the transaction
+status of their latest ReadyForQuery, e.g.:
+
+pool = ConnectionPool(lambda: txconnection.connect(reactor, u'localhost',
+                                                   user=u'postgres'),
+                      min_size=2, max_size=10)
+yield pool.start()
+result = yield pool.run(lambda conn: conn.execute(u'SELECT 1'))
+
+Callers that acquire() a connection must release() it. A connection that comes
+back inside a transaction is rolled back before anyone else gets it, and one
+that fails to roll back, or still has operations in flight, is closed.
+Waiters are served in the order they asked, new connections are opened while
+there are waiters and fewer than 'max_size' connections, and connections left
+idle for more than 'idle_timeout' seconds are closed down to 'min_size'.
+"""
+
+from collections import deque
+
+from twisted.internet import defer
+from twisted.internet import task
+
+from . import constants
+from . import errors
+
+
+class ConnectionPool(object):
+    '''
+    Pool of connections made by connect(), which returns a Deferred that
+    fires with a txconnection.PostgresProtocol (or anything with the same
+    idle, connected, pending, transaction_status, closed, execute() and
+    close() members)
+    '''
+
+    def __init__(self, connect, min_size=1, max_size=10, idle_timeout=300.0,
+                 reap_interval=30.0, reactor=None):
+        if max_size < 1 or min_size > max_size:
+            msg = "Bad pool sizes %s and %s"
+            raise ValueError(msg % (min_size, max_size))
+        if reactor is None:
+            from twisted.internet import reactor
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.reactor = reactor
+
+        self.closed = False
+        self._idle = deque()
+        self._busy = set()
+        self._connecting = 0
+        self._waiters = deque()
+        self._reaper = None
+
+    def __len__(self):
+        return len(self._idle) + len(self._busy) + self._connecting
+
+    def stats(self):
+        return {'size': len(self),
+                'idle': len(self._idle),
+                'busy': len(self._busy),
+                'connecting': self._connecting,
+                'waiters': len(self._waiters)}
+
+    def start(self):
+        """
+        Open 'min_size' connections and start reaping idle ones. Return a
+        Deferred that fires when the connections are ready.
+        """
+        self._reaper = task.LoopingCall(self._reap)
+        self._reaper.clock = self.reactor
+        self._reaper.start(self.reap_interval, now=False)
+        opening = [self._open() for _ in range(self.min_size)]
+        return defer.gatherResults(opening, consumeErrors=True)
+
+    def acquire(self):
+        """
+        Return a Deferred that fires with an idle connection
+        """
+        if self.closed:
+            return defer.fail(errors.ThrumError("Pool is closed"))
+        while self._idle:
+            conn, since = self._idle.pop()
+            if conn.idle:
+                self._busy.add(conn)
+                return defer.succeed(conn)
+            self._discard(conn)
+        d = defer.Deferred(canceller=self._cancel_waiter)
+        self._waiters.append(d)
+        self._grow()
+        return d
+
+    def release(self, conn):
+        """
+        Return 'conn' to the pool, rolling back any transaction it's in
+        """
+        self._busy.discard(conn)
+        if self.closed or not conn.connected:
+            self._discard(conn)
+            return
+        if conn.idle:
+            self._available(conn)
+            return
+        if conn.transaction_status in (constants.IDLE_IN_TRANSACTION,
+                                       constants.IDLE_IN_FAILED_TRANSACTION) \
+                and not conn.pending:
+            self._busy.add(conn)
+            d = conn.execute(u'ROLLBACK')
+            d.addCallbacks(lambda _: self.release(conn),
+                           lambda _: self._discard(conn, busy=True))
+            return
+        self._discard(conn)
+
+    def run(self, func, *args, **kwargs):
+        """
+        Call func(conn, *args, **kwargs) with a connection from the pool and
+        release it when the Deferred that 'func' returns fires
+        """
+        def use(conn):
+            d = defer.maybeDeferred(func, conn, *args, **kwargs)
+
+            def done(result):
+                self.release(conn)
+                return result
+            return d.addBoth(done)
+        return self.acquire().addCallback(use)
+
+    def close(self):
+        """
+        Close every connection and fail the waiters
+        """
+        self.closed = True
+        if self._reaper is not None and self._reaper.running:
+            self._reaper.stop()
+        waiters = self._waiters
+        self._waiters = deque()
+        for d in waiters:
+            d.errback(errors.ThrumError("Pool is closed"))
+        conns = [conn for conn, since in self._idle] + list(self._busy)
+        self._idle.clear()
+        self._busy.clear()
+        return defer.DeferredList([conn.close() for conn in conns])
+
+    def _cancel_waiter(self, d):
+        try:
+            self._waiters.remove(d)
+        except ValueError:
+            pass
+
+    def _grow(self):
+        while (self._waiters and len(self._waiters) > self._connecting and
+               len(self) < self.max_size):
+            self._open().addErrback(lambda _: None)
+
+    def _open(self):
+        self._connecting += 1
+        d = defer.maybeDeferred(self.connect)
+        d.addCallbacks(self._opened, self._open_failed)
+        return d
+
+    def _opened(self, conn):
+        self._connecting -= 1
+        conn.closed.addCallback(self._lost)
+        self._available(conn)
+        return conn
+
+    def _open_failed(self, failure):
+        self._connecting -= 1
+        # Don't leave a waiter hanging if nothing else can serve it
+        if self._waiters and len(self._waiters) > self._connecting:
+            self._waiters.popleft().errback(failure)
+        return failure
+
+    def _available(self, conn):
+        if self.closed:
+            conn.close()
+        elif self._waiters:
+            self._busy.add(conn)
+            self._waiters.popleft().callback(conn)
+        else:
+            self._idle.append((conn, self.reactor.seconds()))
+
+    def _discard(self, conn, busy=False):
+        if busy:
+            self._busy.discard(conn)
+        if conn.connected:
+            conn.close()
+        self._grow()
+
+    def _lost(self, conn):
+        self._busy.discard(conn)
+        for item in self._idle:
+            if item[0] is conn:
+                self._idle.remove(item)
+                break
+        if not self.closed:
+            self._grow()
+        return conn
+
+    def _reap(self):
+        now = self.reactor.seconds()
+        excess = len(self) - self.min_size
+        idle = self._idle
+        self._idle = deque()
+        # The least recently used connections are at the left
+        for conn, since in idle:
+            if not conn.idle or (excess > 0 and
+                                 now - since > self.idle_timeout):
+                conn.close()
+                excess -= 1
+            else:
+                self._idle.append((conn, since))
+        for _ in range(self.min_size - len(self)):
+            self._open().addErrback(lambda _: None)
@@ -0,0 +1,359 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Decode RowDescription and DataRow messages, and encode rows of Python values
+in the same layout (an int16 field count followed by an int32 length, or -1
+for NULL, and the bytes of each field), which is shared by DataRow, Bind
+parameters and binary COPY tuples
+
+A query returns one RowDescription followed by any number of DataRows with the
+same column layout, so rather than dispatching on each column's type for every
+field of every row we generate a decoder function specialised for the layout
+(the column type OIDs and format codes) and cache it, e.g.:
+
+columns = parse_row_description(row_description_payload)
+decode_row = get_row_decoder(row_key(columns))
+for payload in data_row_payloads:
+    row = decode_row(payload)
+
+Fields in the binary format for which there is no registered decoder, and all
+fields in the text format, are returned as bytes.
+
+Row encoders are compiled and cached in the same way, keyed by the column type
+OIDs, e.g.:
+
+encode_row = get_row_encoder((constants.INT4OID, constants.TEXTOID))
+data = encode_row((1, u'one'))
+
+Values of types with no registered encoder must already be bytes.
+
+Text, and the lexemes of a tsvector, are in the connection's client
+encoding. Given a textcodec.TextCodec, get_row_encoder and get_row_decoder
+return functions that use it; without one, or for UTF8, they use UTF-8.
+"""
+
+from collections import namedtuple
+
+from . import binary
+from . import constants
+from . import datetimes
+from . import geometric
+from . import lru
+from . import network
+from . import numeric
+from . import tsvector
+
+
+Column = namedtuple('Column', ('name', 'table_oid', 'column_number',
+                               'type_oid', 'type_size', 'type_modifier',
+                               'format_code'))
+
+"""
+Fixed-width binary types, which are decoded inline in the generated code by
+calling the precompiled struct unpacker directly
+"""
+fixed_width = {
+    constants.BOOLOID: binary.structs.get_struct('?'),
+    constants.INT2OID: binary.structs.get_struct('h'),
+    constants.INT4OID: binary.structs.get_struct('i'),
+    constants.INT8OID: binary.structs.get_struct('q'),
+    constants.OIDOID: binary.structs.get_struct('I'),
+    constants.FLOAT4OID: binary.structs.get_struct('f'),
+    constants.FLOAT8OID: binary.structs.get_struct('d'),
+}
+
+"""
+Other binary types, which are decoded by calling func(data, offset, length)
+and encoded by calling func(value)
+"""
+binary_decoders = {}
+binary_encoders = {}
+
+"""
+Decoders and encoders whose binary format holds text in the client encoding,
+which are also passed the decode(data) or encode(text) of a non-UTF-8 codec
+"""
+_client_encoded = set()
+
+decoders = lru.LRUCache(maxsize=256)
+encoders = lru.LRUCache(maxsize=256)
+
+
+def register_binary_decoder(type_oid, func, client_encoded=False):
+    """
+    Decode binary fields of type 'type_oid' with func(data, offset, length),
+    where 'data' may be bytes or a memoryview. With 'client_encoded' set,
+    func(data, offset, length, decode) is called for non-UTF-8 connections.
+    """
+    binary_decoders[type_oid] = func
+    if client_encoded:
+        _client_encoded.add(func)
+    decoders.clear()
+
+
+def register_fixed_width(type_oid, fmt):
+    """
+    Decode and encode binary fields of type 'type_oid' with the struct
+    format 'fmt', e.g. to get raw integers rather than objects, as if it
+    were one of the built-in fixed-width types
+    """
+    fixed_width[type_oid] = binary.structs.get_struct(fmt)
+    decoders.clear()
+    encoders.clear()
+
+
+def register_binary_encoder(type_oid, func, client_encoded=False):
+    """
+    Encode values of type 'type_oid' in the binary format with func(value),
+    which returns bytes. With 'client_encoded' set, func(value, encode) is
+    called for non-UTF-8 connections.
+    """
+    binary_encoders[type_oid] = func
+    if client_encoded:
+        _client_encoded.add(func)
+    encoders.clear()
+
+
+def _decode_array(data, offset, length):
+    return binary.array_unpack(data, offset, length)[3]
+
+
+def _array_encoder(element_oid):
+    def encode_array(value):
+        return binary.array_pack(value, element_oid)
+    return encode_array
+
+
+def _encode_text(value, encode=None):
+    if isinstance(value, bytes):
+        return value
+    if encode is None:
+        return value.encode('utf-8')
+    return encode(value)
+
+
+for _oid, _element_oid in ((constants.INT2ARRAYOID, constants.INT2OID),
+                           (constants.INT4ARRAYOID, constants.INT4OID),
+                           (constants.INT8ARRAYOID, constants.INT8OID),
+                           (constants.FLOAT4ARRAYOID, constants.FLOAT4OID),
+                           (constants.FLOAT8ARRAYOID, constants.FLOAT8OID)):
+    register_binary_decoder(_oid, _decode_array)
+    register_binary_encoder(_oid, _array_encoder(_element_oid))
+
+for _oid in (constants.TEXTOID, constants.VARCHAROID, constants.BPCHAROID,
+             constants.NAMEOID):
+    register_binary_encoder(_oid, _encode_text, client_encoded=True)
+
+for _oid, _recv, _send in (
+        (constants.NUMERICOID, numeric.numeric_recv, numeric.numeric_send),
+        (constants.DATEOID, datetimes.date_recv, datetimes.date_send),
+        (constants.TIMEOID, datetimes.time_recv, datetimes.time_send),
+        (constants.TIMESTAMPOID, datetimes.timestamp_recv,
+         datetimes.timestamp_send),
+        (constants.TIMESTAMPTZOID, datetimes.timestamptz_recv,
+         datetimes.timestamptz_send),
+        (constants.INTERVALOID, datetimes.interval_recv,
+         datetimes.interval_send),
+        (constants.INETOID, network.inet_recv, network.inet_send),
+        (constants.CIDROID, network.cidr_recv, network.cidr_send),
+        (constants.MACADDROID, network.macaddr_recv, network.macaddr_send),
+        (constants.MACADDR8OID, network.macaddr8_recv,
+         network.macaddr8_send),
+        (constants.POINTOID, geometric.point_recv, geometric.point_send),
+        (constants.LSEGOID, geometric.lseg_recv, geometric.lseg_send),
+        (constants.BOXOID, geometric.box_recv, geometric.box_send),
+        (constants.CIRCLEOID, geometric.circle_recv, geometric.circle_send),
+        (constants.PATHOID, geometric.path_recv, geometric.path_send),
+        (constants.POLYGONOID, geometric.polygon_recv,
+         geometric.polygon_send)):
+    register_binary_decoder(_oid, _recv)
+    register_binary_encoder(_oid, _send)
+
+register_binary_decoder(constants.TSVECTOROID, tsvector.tsvector_recv,
+                        client_encoded=True)
+register_binary_encoder(constants.TSVECTOROID, tsvector.tsvector_send,
+                        client_encoded=True)
+
+
+def parse_row_description(data, offset=0):
+    """
+    Return a tuple of Column for the payload of a RowDescription message
+    """
+    if not isinstance(data, bytes):
+        data = binary.to_bytes(data)
+    count = binary.h_unpack(data, offset)[0]
+    pos = offset + 2
+    columns = []
+    for _ in range(count):
+        end = data.index(constants.NULL_BYTE, pos)
+        name = data[pos:end]
+        pos = end + 1
+        columns.append(Column(name, *binary.ihihih_unpack(data, pos)))
+        pos += 18
+    return tuple(columns)
+
+
+def row_key(columns):
+    """
+    Return the (type OID, format code) layout of 'columns', suitable for
+    get_row_decoder
+    """
+    return tuple((column.type_oid, column.format_code) for column in columns)
+
+
+def _codec_key(key, codec):
+    """
+    Return the cache key for 'key' in the encoding of 'codec', and the codec
+    to compile with, which is None for UTF-8
+    """
+    if codec is None or codec.encoding == 'utf-8':
+        return key, None
+    return (codec.name, key), codec
+
+
+def get_row_decoder(key, codec=None):
+    """
+    Return a function that decodes the payload of a DataRow message with the
+    layout 'key' (a tuple of (type OID, format code) pairs) into a tuple
+    """
+    cache_key, codec = _codec_key(key, codec)
+    decoder = decoders.get(cache_key)
+    if decoder is None:
+        decoder = compile_row_decoder(key, codec)
+        decoders[cache_key] = decoder
+    return decoder
+
+
+def compile_row_decoder(key, codec=None):
+    namespace = {'i_unpack': binary.i_unpack, 'to_bytes': binary.to_bytes}
+    lines = ['def decode_row(data):',
+             '    pos = 2']
+    names = []
+    fixed = True
+
+    for index, (type_oid, format_code) in enumerate(key):
+        name = 'c%d' % (index,)
+        names.append(name)
+        lines.extend(['    length = i_unpack(data, pos)[0]',
+                      '    pos += 4',
+                      '    if length < 0:',
+                      '        %s = None' % (name,),
+                      '    else:'])
+        if format_code == constants.FC_BINARY and type_oid in fixed_width:
+            namespace['u' + name] = fixed_width[type_oid].unpack_from
+            expr = 'u%s(data, pos)[0]' % (name,)
+        elif format_code == constants.FC_BINARY and \
+                type_oid in binary_decoders:
+            func = binary_decoders[type_oid]
+            namespace['f' + name] = func
+            expr = 'f%s(data, pos, length)' % (name,)
+            if codec is not None and func in _client_encoded:
+                namespace['decode'] = codec.decode
+                expr = 'f%s(data, pos, length, decode)' % (name,)
+            fixed = False
+        else:
+            expr = 'to_bytes(data[pos:pos + length])'
+            fixed = False
+        lines.extend(['        %s = %s' % (name, expr),
+                      '        pos += length'])
+
+    values = ', '.join(names) + (',' if len(names) == 1 else '')
+    lines.append('    return (%s)' % (values,))
+
+    if fixed and key:
+        # Every column is fixed-width, so unless there are NULLs (which make
+        # the row shorter) the whole row can be unpacked with a single call
+        lines[0] = 'def decode_row_nulls(data):'
+        fmt = ['h']
+        for type_oid, format_code in key:
+            fmt.append('i' + fixed_width[type_oid].format.lstrip('!><=@'))
+        row_struct = binary.structs.get_struct(''.join(fmt))
+        namespace['row_unpack'] = row_struct.unpack_from
+        unpacked = ', '.join('l%d, c%d' % (index, index)
+                             for index in range(len(key)))
+        lines.extend(['',
+                      'def decode_row(data):',
+                      '    if len(data) != %d:' % (row_struct.size,),
+                      '        return decode_row_nulls(data)',
+                      '    count, %s = row_unpack(data)' % (unpacked,),
+                      '    return (%s)' % (values,)])
+
+    source = '\n'.join(lines) + '\n'
+    exec(compile(source, '<thrum.rows %r>' % (key,), 'exec'), namespace)
+    decoder = namespace['decode_row']
+    decoder.source = source
+    return decoder
+
+
+def get_row_encoder(key, codec=None):
+    """
+    Return a function that encodes a sequence of Python values as fields of
+    the types in 'key' (a tuple of type OIDs), in the binary format
+    """
+    cache_key, codec = _codec_key(key, codec)
+    encoder = encoders.get(cache_key)
+    if encoder is None:
+        encoder = compile_row_encoder(key, codec)
+        encoders[cache_key] = encoder
+    return encoder
+
+
+def compile_row_encoder(key, codec=None):
+    namespace = {'i_pack': binary.i_pack,
+                 'NULL': constants.NULL,
+                 'count': binary.h_pack(len(key))}
+    names = ['c%d' % (index,) for index in range(len(key))]
+    unpacked = ', '.join(names) + (',' if len(names) == 1 else '')
+    lines = ['def encode_row(row):']
+    if key:
+        lines.append('    %s = row' % (unpacked,))
+
+    if key and all(type_oid in fixed_width for type_oid in key):
+        # Without NULLs, a row of fixed-width values packs with one call
+        fmt = ['h']
+        args = [str(len(key))]
+        for name, type_oid in zip(names, key):
+            struc = fixed_width[type_oid]
+            fmt.append('i' + struc.format.lstrip('!><=@'))
+            args.extend([str(struc.size), name])
+        namespace['row_pack'] = binary.structs.get_pack(''.join(fmt))
+        not_null = ' and '.join('%s is not None' % (name,) for name in names)
+        lines.extend(['    if %s:' % (not_null,),
+                      '        return row_pack(%s)' % (', '.join(args),)])
+
+    lines.extend(['    parts = [count]',
+                  '    append = parts.append'])
+    for name, type_oid in zip(names, key):
+        lines.extend(['    if %s is None:' % (name,),
+                      '        append(NULL)',
+                      '    else:'])
+        if type_oid in fixed_width:
+            struc = fixed_width[type_oid]
+            namespace['p' + name] = binary.structs.get_pack(
+                'i' + struc.format.lstrip('!><=@'))
+            lines.append('        append(p%s(%d, %s))' % (name, struc.size,
+                                                          name))
+            continue
+        if type_oid in binary_encoders:
+            func = binary_encoders[type_oid]
+            namespace['e' + name] = func
+            if codec is not None and func in _client_encoded:
+                namespace['encode'] = codec.encode
+                lines.append('        data = e%s(%s, encode)' % (name, name))
+            else:
+                lines.append('        data = e%s(%s)' % (name, name))
+        else:
+            lines.append('        data = %s' % (name,))
+        lines.extend(['        append(i_pack(len(data)))',
+                      '        append(data)'])
+    lines.append("    return b''.join(parts)")
+
+    source = '\n'.join(lines) + '\n'
+    exec(compile(source, '<thrum.rows encoder %r>' % (key,), 'exec'),
+         namespace)
+    encoder = namespace['encode_row']
+    encoder.source = source
+    return encoder
@@ -0,0 +1,124 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Cache named prepared statements for one connection, keyed by SQL and
+parameter types, along with what the backend's Describe said about them, so
+repeated statements skip both Parse and Describe, e.g.:
+
+cache = StatementCache(maxsize=256)
+pipe = pipeline.Pipeline(statements=cache)
+
+When the cache is full the least recently used statement is evicted and a
+Close for it goes out with the next batch of messages, which is after every
+earlier use of it, so the number of statements held open on the backend never
+exceeds 'maxsize'.
+"""
+
+from . import constants
+from . import lru
+from . import rows as _rows
+
+
+class PreparedStatement(object):
+    '''
+    A named statement on the backend. 'param_oids' and 'columns' come from
+    its ParameterDescription and RowDescription, and 'decode_row' decodes
+    its rows in the binary format. 'columns' is None for statements that
+    return no rows.
+    '''
+
+    def __init__(self, name, sql, type_oids):
+        self.name = name
+        self.sql = sql
+        self.type_oids = type_oids
+        self.param_oids = None
+        self.columns = None
+        self.decode_row = None
+        self.parsed = False
+        self.described = False
+
+    def describe(self, columns, codec=None):
+        """
+        Record the RowDescription that Describe returned. It doesn't know
+        the result formats yet, so it lists them all as text; we always
+        request binary results.
+        """
+        self.columns = [column._replace(format_code=constants.FC_BINARY)
+                        for column in columns]
+        self.decode_row = _rows.get_row_decoder(_rows.row_key(self.columns),
+                                                codec)
+        self.described = True
+
+    def no_data(self):
+        self.described = True
+
+
+class StatementCache(object):
+    '''
+    Size-bounded LRU cache of PreparedStatements with hit/miss statistics
+    '''
+
+    def __init__(self, maxsize=256, prefix=b'thrum_'):
+        self.prefix = prefix
+        self.statements = lru.LRUCache(maxsize, on_evict=self._evicted)
+        self.closing = []
+        self._count = 0
+
+    def __len__(self):
+        return len(self.statements)
+
+    def __contains__(self, key):
+        return key in self.statements
+
+    def get(self, sql, type_oids):
+        """
+        Return the PreparedStatement for 'sql' and 'type_oids', or None
+        """
+        return self.statements.get((sql, type_oids))
+
+    def add(self, sql, type_oids):
+        """
+        Return a new PreparedStatement with a unique name, to be sent in a
+        Parse, which may evict another statement
+        """
+        self._count += 1
+        name = self.prefix + str(self._count).encode('ascii')
+        statement = PreparedStatement(name, sql, type_oids)
+        self.statements[(sql, type_oids)] = statement
+        return statement
+
+    def discard(self, statement):
+        """
+        Forget 'statement' without closing it, e.g. because its Parse failed
+        """
+        key = (statement.sql, statement.type_oids)
+        if self.statements.peek(key) is statement:
+            self.statements.pop(key)
+
+    def _evicted(self, key, statement):
+        self.closing.append(statement.name)
+
+    def take_closing(self):
+        """
+        Return the names of evicted statements that should now be closed
+        """
+        closing = self.closing
+        self.closing = []
+        return closing
+
+    def clear(self):
+        """
+        Forget every statement, e.g. when the connection is lost
+        """
+        self.statements.clear()
+        self.closing = []
+
+    @property
+    def hit_rate(self):
+        return self.statements.hit_rate
+
+    def stats(self):
+        return self.statements.stats()
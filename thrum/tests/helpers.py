@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+helpers
+----------------------------------
+
+Backend messages, a fake transport and a log capture shared by the tests.
+"""
+
+from __future__ import division, absolute_import
+
+import logging
+import struct
+
+from thrum import constants
+from thrum import framing
+from thrum import rows
+
+
+class FakeTransport(object):
+
+    def __init__(self):
+        self.data = b''
+        self.writes = []
+
+    def write(self, data):
+        self.data += data
+        self.writes.append(data)
+
+    def take(self):
+        data = self.data
+        self.data = b''
+        return data
+
+
+class LogCapture(logging.Handler):
+    '''
+    Collect the records logged by thrum while it's in use as a context
+    manager, and keep them from the root logger
+    '''
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def __enter__(self):
+        logger = logging.getLogger('thrum')
+        self.propagate = logger.propagate
+        logger.propagate = False
+        logger.addHandler(self)
+        return self.records
+
+    def __exit__(self, *exc_info):
+        logger = logging.getLogger('thrum')
+        logger.removeHandler(self)
+        logger.propagate = self.propagate
+
+
+def message(code, payload=b''):
+    return code + struct.pack('!i', len(payload) + 4) + payload
+
+
+def sent(data):
+    framer = framing.MessageFramer()
+    framer.feed(data)
+    return [(code, bytes(payload)) for code, payload in framer]
+
+
+def codes(data):
+    framer = framing.MessageFramer()
+    framer.feed(data)
+    return b''.join(code for code, payload in framer)
+
+
+def respond(pipe, *responses):
+    framer = framing.MessageFramer()
+    framer.feed(b''.join(responses))
+    framer.dispatch(pipe.handlers)
+
+
+def auth_request(kind, data=b''):
+    return message(constants.AUTHENTICATION_REQUEST,
+                   struct.pack('!i', kind) + data)
+
+
+def parameter_status(name, value):
+    return message(constants.PARAMETER_STATUS,
+                   name + b'\x00' + value + b'\x00')
+
+
+def ready(status=constants.IDLE):
+    return message(constants.READY_FOR_QUERY, status)
+
+
+def row_description(*type_oids):
+    parts = [struct.pack('!h', len(type_oids))]
+    for index, type_oid in enumerate(type_oids):
+        parts.append(b'col%d\x00' % (index,))
+        parts.append(struct.pack('!ihihih', 0, 0, type_oid, -1, -1,
+                                 constants.FC_BINARY))
+    return message(constants.ROW_DESCRIPTION, b''.join(parts))
+
+
+def data_row(type_oids, values):
+    return message(constants.DATA_ROW, rows.get_row_encoder(type_oids)(values))
+
+
+def int_rows(*values):
+    return b''.join(data_row((constants.INT4OID,), (value,))
+                    for value in values)
+
+
+def command_complete(tag):
+    return message(constants.COMMAND_COMPLETE, tag + b'\x00')
+
+
+def error_response(code, text):
+    return message(constants.ERROR_RESPONSE,
+                   b'SERROR\x00C' + code + b'\x00M' + text + b'\x00\x00')
+
+
+def notification(pid, channel, payload):
+    return message(constants.NOTIFICATION_RESPONSE,
+                   struct.pack('!i', pid) + channel + b'\x00' + payload +
+                   b'\x00')
+
+
+AUTH_OK = auth_request(constants.AUTH_OK)
+STARTED = (AUTH_OK + parameter_status(b'client_encoding', b'UTF8') +
+           message(constants.BACKEND_KEY_DATA, struct.pack('!ii', 42, 99)) +
+           ready())
+PARSE_COMPLETE = message(constants.PARSE_COMPLETE)
+BIND_COMPLETE = message(constants.BIND_COMPLETE)
+CLOSE_COMPLETE = message(constants.CLOSE_COMPLETE)
+PORTAL_SUSPENDED = message(constants.PORTAL_SUSPENDED)
+NO_DATA = message(constants.NO_DATA)
+READY = ready()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_aioconnection
+----------------------------------
+
+Tests for `aioconnection` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial import unittest
+
+from thrum import constants
+from thrum import errors
+from thrum import notify
+from thrum.tests.helpers import (
+    BIND_COMPLETE, FakeTransport, NO_DATA, PARSE_COMPLETE, PORTAL_SUSPENDED,
+    STARTED, command_complete, data_row, error_response, int_rows,
+    notification, ready, row_description)
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+else:
+    from thrum import aioconnection
+
+
+class Transport(FakeTransport):
+
+    def __init__(self):
+        FakeTransport.__init__(self)
+        self.closing = False
+        self.aborted = False
+
+    def close(self):
+        self.closing = True
+
+    def abort(self):
+        self.aborted = True
+
+
+class PostgresProtocolTests(unittest.TestCase):
+
+    if asyncio is None:
+        skip = "asyncio is not available"
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.proto = aioconnection.PostgresProtocol(u'alice', u'db',
+                                                    loop=self.loop)
+        self.transport = Transport()
+        self.proto.connection_made(self.transport)
+
+    def start(self):
+        self.proto.data_received(STARTED)
+        self.transport.take()
+
+    def test_ready(self):
+        self.assertTrue(self.transport.data.endswith(b'alice\x00\x00'))
+        self.assertFalse(self.proto.ready.done())
+        self.start()
+        self.assertIs(self.proto.ready.result(), self.proto)
+        self.assertTrue(self.proto.idle)
+        self.assertEqual(self.proto.transaction_status, constants.IDLE)
+
+    def test_startup_error(self):
+        self.proto.data_received(error_response(b'28P01', b'bad password'))
+        self.assertRaises(errors.PostgresError, self.proto.ready.result)
+        self.assertTrue(self.transport.closing)
+
+    def test_execute(self):
+        self.start()
+        future = self.proto.execute(u'SELECT $1', (5,), (constants.INT4OID,))
+        self.assertFalse(future.done())
+        key = (constants.INT4OID,)
+        self.proto.data_received(PARSE_COMPLETE + row_description(*key) +
+                                 BIND_COMPLETE + data_row(key, (5,)) +
+                                 command_complete(b'SELECT 1') + ready())
+        self.assertEqual(future.result().rows, [(5,)])
+
+    def test_execute_error(self):
+        self.start()
+        future = self.proto.execute(u'SELECT 1/0')
+        self.proto.data_received(PARSE_COMPLETE + NO_DATA + BIND_COMPLETE +
+                                 error_response(b'22012', b'division') +
+                                 ready())
+        error = future.exception()
+        self.assertIsInstance(error, errors.PostgresError)
+        self.assertEqual(error.sqlstate_code, u'22012')
+
+    def test_executemany(self):
+        self.start()
+        future = self.proto.executemany(u'INSERT', [(1,), (2,)],
+                                        (constants.INT4OID,))
+        self.proto.data_received(PARSE_COMPLETE + NO_DATA +
+                                 (BIND_COMPLETE +
+                                  command_complete(b'INSERT 0 1')) * 2 +
+                                 ready())
+        self.assertEqual([result.command_tag for result in future.result()],
+                         [b'INSERT 0 1'] * 2)
+
+    def test_run_pipeline(self):
+        self.start()
+        pipe = self.proto.pipeline()
+        result = pipe.execute(u'SELECT 1/0')
+        future = self.proto.run_pipeline(pipe)
+        self.proto.data_received(PARSE_COMPLETE + NO_DATA + BIND_COMPLETE +
+                                 error_response(b'22012', b'division') +
+                                 ready())
+        self.assertIs(future.result(), pipe)
+        self.assertIsInstance(result.error, errors.PostgresError)
+
+    def test_cursor(self):
+        self.start()
+        cur = self.proto.cursor(u'SELECT n FROM t', fetch_size=2)
+        first = cur.fetch()
+        self.proto.data_received(PARSE_COMPLETE + BIND_COMPLETE +
+                                 row_description(constants.INT4OID) +
+                                 int_rows(1, 2) + PORTAL_SUSPENDED)
+        self.assertEqual(first.result(), [(1,), (2,)])
+        second = cur.fetch()
+        self.assertFalse(second.done())
+        self.proto.data_received(int_rows(3) +
+                                 command_complete(b'SELECT 3'))
+        self.assertEqual(second.result(), [(3,)])
+        closed = cur.close()
+        self.assertFalse(closed.done())
+        self.proto.data_received(ready())
+        self.assertTrue(closed.done())
+        self.assertTrue(self.proto.idle)
+
+    def test_cursor_iteration(self):
+        self.start()
+        cur = self.proto.cursor(u'SELECT n FROM t', fetch_size=2)
+        self.proto.data_received(PARSE_COMPLETE + BIND_COMPLETE +
+                                 row_description(constants.INT4OID) +
+                                 int_rows(1, 2) + PORTAL_SUSPENDED)
+        batches = []
+
+        def consume():
+            # Equivalent to: async for rows in cur
+            iterator = cur.__aiter__()
+            while True:
+                future = iterator.__anext__()
+                if not future.done():
+                    self.proto.data_received(
+                        int_rows(3) + command_complete(b'SELECT 3') +
+                        ready())
+                try:
+                    batches.append(future.result())
+                except StopAsyncIteration:
+                    return
+        consume()
+        self.assertEqual(batches, [[(1,), (2,)], [(3,)]])
+
+    def test_subscribe(self):
+        self.start()
+        notifications = self.proto.subscribe(u'cache')
+        self.assertIn(b'LISTEN "cache"', self.transport.take())
+        future = notifications.__anext__()
+        self.proto.data_received(notification(5, b'cache', b'key'))
+        self.assertEqual(future.result(),
+                         notify.Notification(5, u'cache', u'key'))
+        future = notifications.__anext__()
+        notifications.close()
+        self.assertRaises(StopAsyncIteration, future.result)
+        self.assertIn(b'UNLISTEN "cache"', self.transport.take())
+        self.assertIs(notifications.get().result(), None)
+
+    def test_connection_lost(self):
+        self.start()
+        future = self.proto.execute(u'SELECT 1')
+        self.proto.connection_lost(None)
+        self.assertIsInstance(future.exception(), errors.ThrumError)
+        self.assertFalse(self.proto.connected)
+        self.assertIs(self.proto.closed.result(), self.proto)
+
+    def test_bad_data(self):
+        self.start()
+        self.proto.data_received(b'?\x00\x00\x00\x04')
+        self.assertFalse(self.proto.connected)
+        self.assertTrue(self.transport.aborted)
+
+    def test_close(self):
+        self.start()
+        self.proto.close()
+        self.assertEqual(self.transport.data, constants.TERMINATE_MSG)
+        self.assertTrue(self.transport.closing)
+
+
+class Backend(object):
+    '''
+    Just enough of a server to accept a startup message
+    '''
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.started = False
+
+    def data_received(self, data):
+        if not self.started:
+            self.started = True
+            self.transport.write(STARTED)
+
+    def connection_lost(self, exc):
+        pass
+
+    def eof_received(self):
+        pass
+
+
+class ConnectTests(unittest.TestCase):
+
+    if asyncio is None:
+        skip = "asyncio is not available"
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def test_connect(self):
+        server = self.loop.run_until_complete(
+            self.loop.create_server(Backend, u'127.0.0.1', 0))
+        port = server.sockets[0].getsockname()[1]
+        try:
+            proto = self.loop.run_until_complete(aioconnection.connect(
+                u'127.0.0.1', port, user=u'alice', loop=self.loop))
+            self.assertTrue(proto.idle)
+            self.assertEqual(proto.connection.backend_pid, 42)
+            self.loop.run_until_complete(proto.close())
+        finally:
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+
+    def test_connect_refused(self):
+        server = self.loop.run_until_complete(
+            self.loop.create_server(Backend, u'127.0.0.1', 0))
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        self.loop.run_until_complete(server.wait_closed())
+        self.assertRaises(OSError, self.loop.run_until_complete,
+                          aioconnection.connect(u'127.0.0.1', port,
+                                                user=u'alice',
+                                                loop=self.loop))
+
+    def test_no_user(self):
+        self.assertRaises(errors.ThrumError, aioconnection.connect,
+                          u'127.0.0.1', loop=self.loop)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_auth
+----------------------------------
+
+Tests for `auth` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial import unittest
+
+from thrum import auth
+from thrum import errors
+
+# From RFC 7677
+NONCE = b'rOprNGfwEbeRWgbNEkqO'
+SERVER_FIRST = (b'r=rOprNGfwEbeRWgbNEkqO%hvYDpWUa2RaTCAfuxFIlj)hNlF$k0,'
+                b's=W22ZaJ0SNY7soEsUEjb6gQ==,i=4096')
+CLIENT_FINAL = (b'c=biws,r=rOprNGfwEbeRWgbNEkqO%hvYDpWUa2RaTCAfuxFIlj)hNlF$k0,'
+                b'p=dHzbZapWIk4jUhN+Ute9ytag9zjfMHgsqmmiz7AndVQ=')
+SERVER_FINAL = b'v=6rriTRBi23WpRR/wtup+mMhUZUn/dB5nLTJRsjl95G4='
+
+
+class AuthTests(unittest.TestCase):
+
+    def test_md5(self):
+        # SELECT 'md5' || md5(md5('secretpostgres') || 'salt')
+        self.assertEqual(auth.md5_password(u'postgres', u'secret', b'salt'),
+                         b'md584c038d2ecb3d1025e697333e1660011')
+        self.assertEqual(auth.md5_password(b'postgres', b'secret', b'salt'),
+                         b'md584c038d2ecb3d1025e697333e1660011')
+
+    def test_scram(self):
+        scram = auth.ScramSHA256(u'pencil', NONCE, u'user')
+        self.assertEqual(scram.client_first(), b'n,,n=user,r=' + NONCE)
+        self.assertEqual(scram.client_final(memoryview(SERVER_FIRST)),
+                         CLIENT_FINAL)
+        scram.verify(SERVER_FINAL)
+
+    def test_scram_bad_signature(self):
+        scram = auth.ScramSHA256(u'pencil', NONCE, u'user')
+        scram.client_final(SERVER_FIRST)
+        with self.assertRaises(errors.ThrumError):
+            scram.verify(b'v=AAAA')
+
+    def test_scram_bad_nonce(self):
+        scram = auth.ScramSHA256(u'pencil', b'other')
+        with self.assertRaises(errors.ThrumError):
+            scram.client_final(SERVER_FIRST)
+
+    def test_scram_random_nonce(self):
+        self.assertNotEqual(auth.ScramSHA256(u'x').nonce,
+                            auth.ScramSHA256(u'x').nonce)
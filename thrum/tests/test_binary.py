@@ -13,6 +13,7 @@ Tests for `binary` module.
 from __future__ import division, absolute_import
 
 import six
+import array
 import struct
 
 try:
@@ -43,6 +44,45 @@ class BinaryTests(unittest.TestCase):
         two = 2
         self.assertEqual(cached_pack_short(two), pack_short(two))
 
+    def test_get_unpack_ints_for_uncached_index(self):
+        index = binary.Cache._limit_ints + 5
+        candidate = tuple(range(index))
+        data = struct.Struct('!' + 'i' * index).pack(*candidate)
+
+        unpacker = binary.Cache.get_unpack_ints_for_index(index)
+        self.assertEqual(unpacker(data), candidate)
+
+        misses = binary.structs.misses
+        again = binary.Cache.get_unpack_ints_for_index(index)
+        self.assertEqual(again(data), candidate)
+        self.assertEqual(binary.structs.misses, misses)
+
+    def test_get_pack_shorts_for_uncached_index(self):
+        index = binary.Cache._limit_shorts + 5
+        candidate = tuple(range(index))
+        packer = binary.Cache.get_pack_shorts_for_index(index)
+        self.assertEqual(packer(*candidate),
+                         struct.Struct('!' + 'h' * index).pack(*candidate))
+
+    def test_struct_cache_mixed_format(self):
+        cache = binary.StructCache(maxsize=2)
+        struc = cache.get_struct('ihq')
+        self.assertEqual(struc.format, '!ihq')
+        self.assertIs(cache.get_struct('ihq'), struc)
+        self.assertEqual(cache.get_unpack('ihq')(cache.get_pack('ihq')(1, 2, 3)),
+                         (1, 2, 3))
+        self.assertEqual(cache.get_struct('<h').pack(1), b'\x01\x00')
+
+    def test_struct_cache_bounded(self):
+        cache = binary.StructCache(maxsize=2)
+        cache.get_struct('i')
+        cache.get_struct('h')
+        cache.get_struct('q')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.misses, 3)
+        self.assertNotIn('i', cache)
+
     def test_h_pack(self):
         # signed short
 
@@ -405,3 +445,97 @@ class BinaryTests(unittest.TestCase):
 
         with self.assertRaises(KeyError):
             binary.Cache.pack_shorts[binary.Cache._limit_shorts]
+
+
+class ArrayTests(unittest.TestCase):
+
+    def test_pack_int4(self):
+        self.assertEqual(
+            binary.array_pack([1, 2], constants.INT4OID),
+            b'\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x17'
+            b'\x00\x00\x00\x02\x00\x00\x00\x01'
+            b'\x00\x00\x00\x04\x00\x00\x00\x01'
+            b'\x00\x00\x00\x04\x00\x00\x00\x02')
+
+    def test_fast_path_matches_element_path(self):
+        for oid, values in ((constants.INT2OID, [constants.MIN_INT2, 0, constants.MAX_INT2]),
+                            (constants.INT4OID, [constants.MIN_INT4, 0, constants.MAX_INT4]),
+                            (constants.INT8OID, [constants.MIN_INT8, 0, constants.MAX_INT8]),
+                            (constants.FLOAT4OID, [-1.5, 0.0, 2.25]),
+                            (constants.FLOAT8OID, [-1e-307, 0.0, 1e307])):
+            layout = binary.Arrays.layouts[oid]
+            if layout[0] is None:
+                continue
+            fixed = binary.Arrays._pack_fixed(values, layout)
+            self.assertEqual(fixed, binary.Arrays._pack_elements(values, layout))
+
+            data = binary.array_pack(values, oid)
+            element_oid, dims, lower_bounds, result = binary.array_unpack(data)
+            self.assertEqual(element_oid, oid)
+            self.assertEqual(dims, (3,))
+            self.assertEqual(lower_bounds, (1,))
+            self.assertIsInstance(result, array.array)
+            self.assertEqual(list(result), values)
+
+    def test_large_int8(self):
+        values = list(range(-50000, 50000))
+        if binary.array_typecode('q', 8):
+            values = array.array('q', values)
+        data = binary.array_pack(values, constants.INT8OID)
+        self.assertEqual(len(data), 20 + 12 * len(values))
+        self.assertEqual(binary.array_unpack(data)[3], values)
+
+    def test_nulls(self):
+        data = binary.array_pack([1, None, 3], constants.INT8OID)
+        self.assertIn(constants.NULL, data)
+        self.assertEqual(binary.array_unpack(data),
+                         (constants.INT8OID, (3,), (1,), [1, None, 3]))
+
+    def test_empty(self):
+        data = binary.array_pack([], constants.FLOAT8OID)
+        self.assertEqual(len(data), 12)
+        element_oid, dims, lower_bounds, values = binary.array_unpack(data)
+        self.assertEqual((dims, lower_bounds, list(values)), ((), (), []))
+
+    def test_dimensions(self):
+        data = binary.array_pack(list(range(6)), constants.INT4OID,
+                                 dims=(2, 3), lower_bounds=(0, 5))
+        element_oid, dims, lower_bounds, values = binary.array_unpack(data)
+        self.assertEqual(dims, (2, 3))
+        self.assertEqual(lower_bounds, (0, 5))
+        self.assertEqual(list(values), list(range(6)))
+
+        with self.assertRaises(ValueError):
+            binary.array_pack(list(range(5)), constants.INT4OID, dims=(2, 3))
+
+    def test_other_element_type(self):
+        data = binary.array_pack([b'abc', None, b''], 25)
+        self.assertEqual(binary.array_unpack(data),
+                         (25, (3,), (1,), [b'abc', None, b'']))
+        self.assertEqual(binary.array_unpack(memoryview(data))[3],
+                         [b'abc', None, b''])
+
+    def test_offset_and_length(self):
+        data = binary.array_pack([1.5, 2.5], constants.FLOAT8OID)
+        framed = b'junk' + data + b'more junk'
+        result = binary.array_unpack(memoryview(framed), 4, len(data))
+        self.assertEqual(list(result[3]), [1.5, 2.5])
+
+        with self.assertRaises(binary.error):
+            binary.array_unpack(framed, 4, len(data) + 1)
+
+    def test_typecode(self):
+        self.assertEqual(binary.array_typecode('i', 4), 'i')
+        self.assertEqual(binary.array_typecode('i', 3), None)
+        self.assertEqual(binary.array_typecode('Z', 8), None)
+
+    def test_without_typecode(self):
+        # As on Python 2, where array.array has no 'q'
+        binary.Arrays.init()
+        layouts = binary.Arrays.layouts
+        saved = layouts[constants.INT8OID]
+        layouts[constants.INT8OID] = (None,) + saved[1:]
+        self.addCleanup(layouts.__setitem__, constants.INT8OID, saved)
+        data = binary.array_pack([1, -2 ** 40], constants.INT8OID)
+        layouts[constants.INT8OID] = saved
+        self.assertEqual(list(binary.array_unpack(data)[3]), [1, -2 ** 40])
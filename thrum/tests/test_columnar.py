@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_columnar
+----------------------------------
+
+Tests for `columnar` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial import unittest
+
+from thrum import connection
+from thrum import constants
+from thrum import errors
+from thrum import fakeserver
+from thrum import rows
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+else:
+    from thrum import columnar
+
+
+def binary_key(*type_oids):
+    return tuple((type_oid, constants.FC_BINARY) for type_oid in type_oids)
+
+
+class NumpyColumnsTests(unittest.TestCase):
+
+    if numpy is None:
+        skip = "numpy is not installed"
+
+    def feed(self, result, key, values):
+        encode_row = rows.get_row_encoder(tuple(oid for oid, fc in key))
+        for row in values:
+            result.feed(memoryview(encode_row(row)))
+
+    def test_fixed(self):
+        key = binary_key(constants.INT2OID, constants.INT8OID,
+                         constants.FLOAT8OID, constants.BOOLOID)
+        values = [(index, index * 2 ** 40, index / 4, bool(index % 2))
+                  for index in range(100)]
+        result = columnar.NumpyColumns(key, batch_size=32)
+        self.feed(result, key, values)
+        shorts, longs, doubles, bools = result.columns()
+        self.assertEqual(result.row_count, 100)
+        self.assertEqual(shorts.dtype, numpy.dtype('int16'))
+        self.assertEqual(longs.dtype, numpy.dtype('int64'))
+        self.assertTrue(longs.dtype.isnative)
+        self.assertIs(shorts.mask, numpy.ma.nomask)
+        self.assertEqual(longs.tolist(), [row[1] for row in values])
+        self.assertEqual(doubles.tolist(), [row[2] for row in values])
+        self.assertEqual(bools.tolist(), [row[3] for row in values])
+
+    def test_fixed_nulls(self):
+        key = binary_key(constants.INT4OID, constants.FLOAT4OID)
+        values = [(1, 1.5), (None, 2.5), (3, None), (4, 4.5)]
+        result = columnar.NumpyColumns(key)
+        self.feed(result, key, values)
+        ints, floats = result.columns()
+        self.assertEqual(ints.tolist(), [1, None, 3, 4])
+        self.assertEqual(floats.tolist(), [1.5, 2.5, None, 4.5])
+        self.assertEqual(result.nulls, [[1], [2]])
+
+    def test_mixed(self):
+        key = binary_key(constants.INT4OID, constants.TEXTOID) + (
+            (constants.INT8OID, constants.FC_TEXT),)
+        result = columnar.NumpyColumns(key)
+        encode_row = rows.get_row_encoder((constants.INT4OID,
+                                           constants.TEXTOID,
+                                           constants.BYTEAOID))
+        result.feed(encode_row((7, u'seven', b'7')))
+        result.feed(encode_row((None, None, b'8')))
+        ints, texts, raw = result.columns()
+        self.assertEqual(ints.tolist(), [7, None])
+        self.assertEqual(texts, [b'seven', None])
+        self.assertEqual(raw, [b'7', b'8'])
+
+    def test_empty(self):
+        result = columnar.NumpyColumns(binary_key(constants.INT4OID))
+        column, = result.columns()
+        self.assertEqual(len(column), 0)
+
+    def test_field_count(self):
+        key = binary_key(constants.INT4OID, constants.INT4OID)
+        result = columnar.NumpyColumns(key)
+        data = rows.get_row_encoder((constants.INT4OID,))((None,))
+        with self.assertRaises(errors.ThrumError):
+            result.feed(data)
+
+
+class ResultTests(unittest.TestCase):
+
+    if numpy is None:
+        skip = "numpy is not installed"
+
+    def setUp(self):
+        self.server = fakeserver.FakeServer()
+        self.server.script(u'SELECT * FROM t', fakeserver.Result(
+            [(u'id', constants.INT8OID), (u'score', constants.FLOAT8OID),
+             (u'name', constants.TEXTOID)],
+            [(1, 0.5, u'one'), (2, None, u'two'), (3, 1.5, None)]))
+        self.server.script(u'SELECT * FROM empty', fakeserver.Result(
+            [(u'id', constants.INT4OID)], []))
+        self.conn = connection.Connection(u'alice')
+        self.server.loopback(self.conn)
+
+    def test_pipeline(self):
+        pipe = self.conn.pipeline()
+        result = pipe.execute(u'SELECT * FROM t', columnar=True)
+        again = pipe.execute(u'SELECT * FROM t')
+        empty = pipe.execute(u'SELECT * FROM empty', columnar=True)
+        self.conn.send(pipe)
+        self.assertTrue(pipe.done)
+        ids, scores, names = result.arrays
+        self.assertEqual(result.rows, [])
+        self.assertEqual(ids.dtype, numpy.dtype('int64'))
+        self.assertEqual(ids.tolist(), [1, 2, 3])
+        self.assertEqual(scores.tolist(), [0.5, None, 1.5])
+        self.assertEqual(names, [b'one', b'two', None])
+        self.assertIsNone(again.arrays)
+        self.assertEqual(again.rows, [(1, 0.5, b'one'), (2, None, b'two'),
+                                      (3, 1.5, None)])
+        column, = empty.arrays
+        self.assertEqual(len(column), 0)
+
+    def test_cursor(self):
+        cur = self.conn.cursor(u'SELECT * FROM t', fetch_size=2,
+                               adaptive=False, columnar=True)
+        self.conn.send(cur)
+        batches = []
+        while not cur.finished:
+            cur.request(lambda cur, rows: batches.append(rows))
+        self.assertEqual([batch[0].tolist() for batch in batches],
+                         [[1, 2], [3]])
+        self.assertEqual(batches[1][2], [None])
+        self.assertEqual(cur.rowcount, 3)
+        self.assertTrue(self.conn.idle)
+
+    def test_empty_cursor(self):
+        cur = self.conn.cursor(u'SELECT * FROM empty', columnar=True)
+        self.conn.send(cur)
+        batches = []
+        cur.request(lambda cur, rows: batches.append(rows))
+        self.assertEqual(batches, [[]])
+        self.assertTrue(cur.finished)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_connection
+----------------------------------
+
+Tests for `connection` module.
+"""
+
+from __future__ import division, absolute_import
+
+import struct
+
+from twisted.trial import unittest
+
+from thrum import auth
+from thrum import connection
+from thrum import constants
+from thrum import errors
+from thrum.tests.helpers import (
+    BIND_COMPLETE, FakeTransport, NO_DATA, PARSE_COMPLETE, STARTED,
+    auth_request, command_complete, data_row, error_response, message, ready,
+    row_description, sent)
+
+
+class ConnectionTests(unittest.TestCase):
+
+    def connect(self, password=None):
+        conn = connection.Connection(u'alice', u'db', password)
+        self.startups = []
+        conn.startup_callbacks.append(
+            lambda conn, error: self.startups.append(error))
+        transport = FakeTransport()
+        conn.connection_made(transport)
+        return conn, transport
+
+    def test_startup(self):
+        conn, transport = self.connect()
+        data = transport.take()
+        length, protocol = struct.unpack('!ii', data[:8])
+        self.assertEqual(length, len(data))
+        self.assertEqual(protocol, constants.DEFAULT_PROTOCOL_VERSION)
+        self.assertEqual(data[8:], b'client_encoding\x00UTF8\x00'
+                                   b'database\x00db\x00user\x00alice\x00\x00')
+
+        conn.data_received(STARTED[:10])
+        self.assertFalse(conn.ready)
+        conn.data_received(STARTED[10:])
+        self.assertTrue(conn.ready)
+        self.assertTrue(conn.idle)
+        self.assertEqual(self.startups, [None])
+        self.assertEqual(conn.parameters, {u'client_encoding': u'UTF8'})
+        self.assertEqual((conn.backend_pid, conn.backend_secret), (42, 99))
+
+    def test_startup_parameters(self):
+        conn = connection.Connection(
+            u'alice', parameters={u'client_encoding': u'LATIN1',
+                                  u'application_name': u'app'})
+        transport = FakeTransport()
+        conn.connection_made(transport)
+        self.assertEqual(transport.take()[8:],
+                         b'application_name\x00app\x00'
+                         b'client_encoding\x00LATIN1\x00'
+                         b'user\x00alice\x00\x00')
+
+    def test_md5(self):
+        conn, transport = self.connect(u'secret')
+        transport.take()
+        conn.data_received(auth_request(constants.AUTH_MD5_PASSWORD,
+                                        b'salt'))
+        self.assertEqual(sent(transport.take()), [
+            (constants.PASSWORD,
+             auth.md5_password(u'alice', u'secret', b'salt') + b'\x00')])
+
+    def test_cleartext(self):
+        conn, transport = self.connect(u'secret')
+        transport.take()
+        conn.data_received(auth_request(constants.AUTH_CLEARTEXT_PASSWORD))
+        self.assertEqual(sent(transport.take()),
+                         [(constants.PASSWORD, b'secret\x00')])
+
+    def test_sasl(self):
+        conn, transport = self.connect(u'secret')
+        transport.take()
+        conn.data_received(auth_request(constants.AUTH_SASL,
+                                        b'SCRAM-SHA-256\x00\x00'))
+        (code, payload), = sent(transport.take())
+        self.assertEqual(code, constants.PASSWORD)
+        self.assertTrue(payload.startswith(b'SCRAM-SHA-256\x00'))
+        self.assertEqual(payload[18:21], b'n,,')
+
+    def test_no_password(self):
+        conn, transport = self.connect()
+        with self.assertRaises(errors.ThrumError):
+            conn.data_received(auth_request(constants.AUTH_MD5_PASSWORD,
+                                            b'salt'))
+
+    def test_startup_error(self):
+        conn, transport = self.connect()
+        conn.data_received(error_response(b'28P01', b'bad password'))
+        self.assertFalse(conn.ready)
+        error, = self.startups
+        self.assertEqual(error.sqlstate_code, u'28P01')
+
+    def test_pipeline(self):
+        conn, transport = self.connect()
+        conn.data_received(STARTED)
+        transport.take()
+
+        pipe = conn.pipeline()
+        result = pipe.execute(u'SELECT 1')
+        conn.send(pipe)
+        self.assertEqual(len(conn), 1)
+        self.assertFalse(conn.idle)
+        self.assertEqual(transport.take()[-5:], constants.SYNC_MSG)
+
+        key = (constants.INT4OID,)
+        conn.data_received(PARSE_COMPLETE + row_description(*key) +
+                           BIND_COMPLETE + data_row(key, (1,)) +
+                           command_complete(b'SELECT 1') +
+                           ready(constants.IDLE_IN_TRANSACTION))
+        self.assertTrue(pipe.done)
+        self.assertEqual(result.rows, [(1,)])
+        self.assertEqual(len(conn), 0)
+        self.assertEqual(conn.transaction_status,
+                         constants.IDLE_IN_TRANSACTION)
+        self.assertFalse(conn.idle)
+
+    def test_queued_pipelines(self):
+        conn, transport = self.connect()
+        conn.data_received(STARTED)
+        first = conn.pipeline()
+        first.execute(u'SELECT 1')
+        second = conn.pipeline()
+        second.execute(u'SELECT 2')
+        conn.send(first)
+        conn.send(second)
+        statuses = []
+        conn.ready_callbacks.append(
+            lambda conn: statuses.append(len(conn)))
+        responses = (PARSE_COMPLETE + NO_DATA + BIND_COMPLETE +
+                     command_complete(b'SELECT 0') + ready())
+        conn.data_received(responses * 2)
+        self.assertTrue(first.done and second.done)
+        self.assertEqual(statuses, [1, 0])
+
+    def test_send_before_startup(self):
+        conn, transport = self.connect()
+        transport.take()
+        pipe = conn.pipeline()
+        result = pipe.execute(u'SELECT 1')
+        conn.send(pipe)
+        self.assertEqual(len(conn), 1)
+        self.assertEqual(transport.take(), b'')
+
+        conn.data_received(STARTED)
+        self.assertEqual(self.startups, [None])
+        self.assertEqual(transport.take()[-5:], constants.SYNC_MSG)
+        conn.data_received(PARSE_COMPLETE + NO_DATA + BIND_COMPLETE +
+                           command_complete(b'SELECT 0') + ready())
+        self.assertTrue(pipe.done)
+        self.assertIs(result.error, None)
+        self.assertTrue(conn.idle)
+
+    def test_connection_lost(self):
+        conn, transport = self.connect()
+        conn.data_received(STARTED)
+        pipe = conn.pipeline()
+        result = pipe.execute(u'SELECT 1')
+        conn.send(pipe)
+        conn.connection_lost('gone')
+        self.assertTrue(pipe.done)
+        self.assertIsInstance(result.error, errors.ThrumError)
+        self.assertFalse(conn.idle)
+        with self.assertRaises(errors.ThrumError):
+            conn.send(conn.pipeline())
+
+    def test_notifications(self):
+        conn, transport = self.connect()
+        conn.data_received(STARTED)
+        received = []
+        conn.notification_callbacks.append(
+            lambda *args: received.append(args))
+        conn.data_received(message(constants.NOTIFICATION_RESPONSE,
+                                   struct.pack('!i', 7) + b'chan\x00hi\x00'))
+        self.assertEqual(received, [(7, u'chan', u'hi')])
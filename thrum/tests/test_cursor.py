@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_cursor
+----------------------------------
+
+Tests for `cursor` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial import unittest
+
+from thrum import connection
+from thrum import constants
+from thrum import cursor
+from thrum import errors
+from thrum import rows
+from thrum import statements
+from thrum.tests.helpers import (
+    BIND_COMPLETE, CLOSE_COMPLETE, FakeTransport, NO_DATA, PARSE_COMPLETE,
+    PORTAL_SUSPENDED, READY, STARTED, codes, command_complete, error_response,
+    int_rows, respond, row_description)
+
+INT4 = (constants.INT4OID,)
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CursorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.batches = []
+
+    def start(self, fetch_size=2, **kwargs):
+        cur = cursor.Cursor(u'SELECT n FROM t', fetch_size=fetch_size,
+                            clock=self.clock, **kwargs)
+        transport = FakeTransport()
+        cur.write_to(transport)
+        return cur, transport
+
+    def request(self, cur):
+        cur.request(lambda cur, rows: self.batches.append(rows))
+
+    def test_batches(self):
+        cur, transport = self.start()
+        self.assertEqual(codes(transport.take()), b'PBDEH')
+        respond(cur, PARSE_COMPLETE, BIND_COMPLETE, row_description(*INT4),
+                int_rows(1, 2), PORTAL_SUSPENDED)
+        self.assertTrue(cur.suspended)
+        # Nothing more is requested until the consumer asks
+        self.assertEqual(transport.take(), b'')
+
+        self.request(cur)
+        self.assertEqual(self.batches, [[(1,), (2,)]])
+        self.assertEqual(transport.take(), b'')
+        self.request(cur)
+        self.assertEqual(codes(transport.take()), b'EH')
+        respond(cur, int_rows(3), command_complete(b'SELECT 3'))
+        self.assertEqual(self.batches, [[(1,), (2,)], [(3,)]])
+        self.assertEqual(codes(transport.take()), b'S')
+        self.assertEqual(cur.command_tag, b'SELECT 3')
+        self.assertEqual(cur.rowcount, 3)
+
+        done = []
+        cur.callbacks.append(done.append)
+        respond(cur, READY)
+        self.assertEqual(done, [cur])
+        self.request(cur)
+        self.assertEqual(self.batches[-1], [])
+
+    def test_no_rows(self):
+        cur, transport = self.start()
+        self.request(cur)
+        respond(cur, PARSE_COMPLETE, BIND_COMPLETE, NO_DATA,
+                command_complete(b'UPDATE 0'))
+        self.assertEqual(self.batches, [[]])
+        self.assertTrue(cur.complete)
+
+    def test_error(self):
+        cur, transport = self.start()
+        self.request(cur)
+        respond(cur, PARSE_COMPLETE, BIND_COMPLETE, row_description(*INT4),
+                int_rows(1), error_response(b'22012', b'division'))
+        self.assertEqual(self.batches, [[]])
+        self.assertEqual(cur.error.sqlstate_code, u'22012')
+        self.assertEqual(codes(transport.take())[-1:], b'S')
+        respond(cur, READY)
+        self.assertTrue(cur.done)
+
+    def test_close_suspended(self):
+        cur, transport = self.start()
+        respond(cur, PARSE_COMPLETE, BIND_COMPLETE, row_description(*INT4),
+                int_rows(1, 2), PORTAL_SUSPENDED)
+        transport.take()
+        cur.close()
+        self.assertEqual(codes(transport.take()), b'CS')
+        self.request(cur)
+        self.assertEqual(self.batches, [[]])
+        respond(cur, CLOSE_COMPLETE, READY)
+        self.assertTrue(cur.done)
+
+    def test_close_in_flight(self):
+        cur, transport = self.start()
+        self.request(cur)
+        transport.take()
+        cur.close()
+        self.assertEqual(transport.take(), b'')
+        respond(cur, PARSE_COMPLETE, BIND_COMPLETE, row_description(*INT4),
+                int_rows(1, 2), PORTAL_SUSPENDED)
+        self.assertEqual(codes(transport.take()), b'CS')
+        self.assertEqual(self.batches, [])
+        respond(cur, CLOSE_COMPLETE, READY)
+        self.assertEqual(self.batches, [[]])
+
+    def test_adaptive(self):
+        cur, transport = self.start(fetch_size=100, min_fetch_size=25,
+                                    max_fetch_size=200)
+        self.clock.now = 1.0
+        respond(cur, PARSE_COMPLETE, BIND_COMPLETE, row_description(*INT4),
+                int_rows(1), PORTAL_SUSPENDED)
+        self.request(cur)
+
+        # A consumer that's quicker than the round trip gets bigger batches
+        self.request(cur)
+        self.assertEqual(cur.fetch_size, 200)
+        self.clock.now = 2.0
+        respond(cur, int_rows(2), PORTAL_SUSPENDED)
+        self.request(cur)
+        self.assertEqual(cur.fetch_size, 200)
+
+        # A slow one gets smaller batches
+        self.clock.now = 3.0
+        respond(cur, int_rows(3), PORTAL_SUSPENDED)
+        self.clock.now = 20.0
+        self.request(cur)
+        self.assertEqual(cur.fetch_size, 100)
+
+    def test_fixed(self):
+        cur, transport = self.start(adaptive=False)
+        self.clock.now = 1.0
+        respond(cur, PARSE_COMPLETE, BIND_COMPLETE, row_description(*INT4),
+                int_rows(1), PORTAL_SUSPENDED)
+        self.request(cur)
+        self.request(cur)
+        self.assertEqual(cur.fetch_size, 2)
+
+    def test_cached_statement(self):
+        cache = statements.StatementCache()
+        statement = cache.add(u'SELECT n FROM t', ())
+        statement.parsed = True
+        statement.describe(rows.parse_row_description(
+            row_description(*INT4)[5:]))
+        cur, transport = self.start(statements=cache)
+        self.assertEqual(codes(transport.take()), b'BEH')
+        self.request(cur)
+        respond(cur, BIND_COMPLETE, int_rows(7),
+                command_complete(b'SELECT 1'))
+        self.assertEqual(self.batches, [[(7,)]])
+
+    def test_parameters(self):
+        with self.assertRaises(errors.ThrumError):
+            cursor.Cursor(u'SELECT $1', (1,))
+        with self.assertRaises(ValueError):
+            cursor.Cursor(u'SELECT 1', fetch_size=0)
+
+
+class ExclusiveTests(unittest.TestCase):
+
+    def test_held_back(self):
+        conn = connection.Connection(u'alice', statement_cache_size=0)
+        transport = FakeTransport()
+        conn.connection_made(transport)
+        conn.data_received(STARTED)
+        transport.take()
+
+        cur = conn.cursor(u'SELECT n FROM t', fetch_size=2)
+        conn.send(cur)
+        pipe = conn.pipeline()
+        result = pipe.execute(u'SELECT 1')
+        conn.send(pipe)
+        self.assertEqual(codes(transport.take()), b'PBDEH')
+        self.assertEqual(len(conn), 2)
+
+        conn.data_received(PARSE_COMPLETE + BIND_COMPLETE +
+                           row_description(*INT4) + int_rows(1, 2) +
+                           PORTAL_SUSPENDED)
+        cur.close()
+        self.assertEqual(codes(transport.take()), b'CS')
+        conn.data_received(CLOSE_COMPLETE + READY)
+        self.assertTrue(cur.done)
+        self.assertEqual(codes(transport.take()), b'PBDES')
+
+        conn.data_received(PARSE_COMPLETE + BIND_COMPLETE +
+                           row_description(*INT4) + int_rows(5) +
+                           command_complete(b'SELECT 1') + READY)
+        self.assertEqual(result.rows, [(5,)])
+        self.assertTrue(conn.idle)
+
+    def test_connection_lost(self):
+        conn = connection.Connection(u'alice')
+        conn.connection_made(FakeTransport())
+        conn.data_received(STARTED)
+        cur = conn.cursor(u'SELECT n FROM t')
+        conn.send(cur)
+        pipe = conn.pipeline()
+        result = pipe.execute(u'SELECT 1')
+        conn.send(pipe)
+        conn.connection_lost('gone')
+        self.assertTrue(cur.done and pipe.done)
+        self.assertIsInstance(cur.error, errors.ThrumError)
+        self.assertIsInstance(result.error, errors.ThrumError)
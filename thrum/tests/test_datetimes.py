@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_datetimes
+----------------------------------
+
+Tests for `datetimes` module.
+"""
+
+from __future__ import division, absolute_import
+
+import datetime
+
+from twisted.trial import unittest
+
+from thrum import binary
+from thrum import constants
+from thrum import datetimes
+from thrum import rows
+
+utc = datetimes.utc
+
+
+class PlusOne(datetime.tzinfo):
+
+    def utcoffset(self, dt):
+        return datetime.timedelta(hours=1)
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+
+class DateTests(unittest.TestCase):
+
+    def test_date(self):
+        for value, days in ((datetime.date(2000, 1, 1), 0),
+                            (datetime.date(2000, 1, 2), 1),
+                            (datetime.date(1999, 12, 31), -1),
+                            (datetime.date(2017, 2, 11), 6251)):
+            self.assertEqual(datetimes.date_send(value), binary.i_pack(days))
+            self.assertEqual(datetimes.date_recv(binary.i_pack(days)), value)
+            self.assertEqual(datetimes.date_recv_raw(binary.i_pack(days)),
+                             days)
+
+    def test_date_infinity(self):
+        self.assertEqual(
+            datetimes.date_recv(binary.i_pack(constants.MAX_INT4)),
+            datetime.date.max)
+        self.assertEqual(
+            datetimes.date_recv(binary.i_pack(constants.MIN_INT4)),
+            datetime.date.min)
+        self.assertEqual(datetimes.date_send(datetime.date.max),
+                         binary.i_pack(constants.MAX_INT4))
+        with self.assertRaises((ValueError, OverflowError)):
+            datetimes.date_recv(binary.i_pack(3000000))
+
+    def test_time(self):
+        value = datetime.time(13, 14, 15, 161718)
+        usec = ((13 * 60 + 14) * 60 + 15) * 1000000 + 161718
+        self.assertEqual(datetimes.time_send(value), binary.q_pack(usec))
+        self.assertEqual(datetimes.time_recv(binary.q_pack(usec)), value)
+        self.assertEqual(datetimes.time_recv_raw(binary.q_pack(usec)), usec)
+        self.assertEqual(
+            datetimes.time_recv(binary.q_pack(24 * 3600 * 1000000)),
+            datetime.time.max)
+
+
+class TimestampTests(unittest.TestCase):
+
+    def test_timestamp(self):
+        value = datetime.datetime(2017, 2, 11, 12, 30, 45, 123456)
+        usec = int((value - datetime.datetime(2000, 1, 1)).total_seconds()
+                   * 1000000)
+        data = datetimes.timestamp_send(value)
+        self.assertEqual(data, binary.q_pack(usec))
+        self.assertEqual(datetimes.timestamp_recv(data), value)
+        self.assertEqual(datetimes.timestamp_recv_raw(data), usec)
+        self.assertEqual(
+            datetimes.timestamp_recv(datetimes.timestamp_send(
+                datetime.datetime(1900, 6, 1, 0, 0, 0, 1))),
+            datetime.datetime(1900, 6, 1, 0, 0, 0, 1))
+
+    def test_unix_epoch(self):
+        data = datetimes.timestamp_send(datetime.datetime(1970, 1, 1))
+        self.assertEqual(binary.q_unpack(data)[0] + datetimes.UNIX_EPOCH_USEC,
+                         0)
+
+    def test_timestamptz(self):
+        value = datetime.datetime(2017, 2, 11, 12, 30, tzinfo=utc)
+        data = datetimes.timestamptz_send(value)
+        result = datetimes.timestamptz_recv(data)
+        self.assertEqual(result, value)
+        self.assertEqual(result.tzinfo, utc)
+
+        plus_one = PlusOne()
+        self.assertEqual(
+            datetimes.timestamptz_send(value.astimezone(plus_one)), data)
+        self.assertEqual(
+            datetimes.timestamptz_send(value.replace(tzinfo=None)), data)
+
+    def test_timestamp_infinity(self):
+        for send, recv, maximum, minimum in (
+                (datetimes.timestamp_send, datetimes.timestamp_recv,
+                 datetime.datetime.max, datetime.datetime.min),
+                (datetimes.timestamptz_send, datetimes.timestamptz_recv,
+                 datetime.datetime.max.replace(tzinfo=utc),
+                 datetime.datetime.min.replace(tzinfo=utc))):
+            self.assertEqual(send(maximum), binary.q_pack(constants.MAX_INT8))
+            self.assertEqual(send(minimum), binary.q_pack(constants.MIN_INT8))
+            self.assertEqual(recv(binary.q_pack(constants.MAX_INT8)), maximum)
+            self.assertEqual(recv(binary.q_pack(constants.MIN_INT8)), minimum)
+
+
+class IntervalTests(unittest.TestCase):
+
+    def test_interval(self):
+        value = datetime.timedelta(days=3, hours=4, microseconds=5)
+        data = datetimes.interval_send(value)
+        self.assertEqual(data, binary.qii_pack(4 * 3600 * 1000000 + 5, 3, 0))
+        self.assertEqual(datetimes.interval_recv(data), value)
+        self.assertEqual(datetimes.interval_recv_raw(data),
+                         (4 * 3600 * 1000000 + 5, 3, 0))
+
+    def test_negative(self):
+        value = -datetime.timedelta(hours=1)
+        data = datetimes.interval_send(value)
+        self.assertEqual(datetimes.interval_recv(data), value)
+
+    def test_months(self):
+        self.assertEqual(datetimes.interval_recv(binary.qii_pack(0, 1, 2)),
+                         datetime.timedelta(days=61))
+
+
+class RegisteredTests(unittest.TestCase):
+
+    key = ((constants.DATEOID, constants.FC_BINARY),
+           (constants.TIMESTAMPTZOID, constants.FC_BINARY))
+
+    def test_objects(self):
+        value = (datetime.date(2017, 2, 11),
+                 datetime.datetime(2017, 2, 11, 1, 2, 3, tzinfo=utc))
+        data = rows.get_row_encoder((constants.DATEOID,
+                                     constants.TIMESTAMPTZOID))(value)
+        self.assertEqual(rows.get_row_decoder(self.key)(data), value)
+
+    def test_raw(self):
+        self.patch(rows, 'fixed_width', dict(rows.fixed_width))
+        self.addCleanup(rows.decoders.clear)
+        self.addCleanup(rows.encoders.clear)
+        for type_oid, fmt in datetimes.raw_formats.items():
+            rows.register_fixed_width(type_oid, fmt)
+
+        data = rows.get_row_encoder((constants.DATEOID,
+                                     constants.TIMESTAMPTZOID))((1, -2))
+        self.assertEqual(rows.get_row_decoder(self.key)(data), (1, -2))
+        self.assertIn('row_unpack', rows.get_row_decoder(self.key).source)
@@ -45,3 +45,50 @@ class PostgresErrorTests(unittest.TestCase):
         e = errors.PostgresError({})
         with self.assertRaises(errors.PostgresError):
             raise e
+
+
+def payload(code, text=b'boom'):
+    return b'SERROR\x00VERROR\x00C' + code + b'\x00M' + text + b'\x00\x00'
+
+
+class FromPayloadTests(unittest.TestCase):
+
+    def test_subclass(self):
+        e = errors.from_payload(memoryview(payload(b'23505')))
+        self.assertIsInstance(e, errors.UniqueViolation)
+        self.assertIsInstance(e, errors.IntegrityError)
+        self.assertIsInstance(e, errors.PostgresError)
+        self.assertEqual(e.sqlstate_code, u'23505')
+        self.assertEqual(e.message, u'boom')
+        self.assertEqual(str(e), 'UniqueViolation: boom')
+
+    def test_lazy(self):
+        e = errors.from_payload(payload(b'40001'))
+        self.assertIs(e._fields, None)
+        self.assertEqual(e.payload, payload(b'40001'))
+        self.assertEqual(e.severity, u'ERROR')
+        self.assertEqual(e.fields[u'C'], u'40001')
+        self.assertIs(type(e), errors.SerializationFailure)
+
+    def test_class_fallback(self):
+        self.assertIs(type(errors.from_payload(payload(b'23999'))),
+                      errors.IntegrityError)
+        self.assertIs(type(errors.from_payload(payload(b'ZZ123'))),
+                      errors.PostgresError)
+        e = errors.from_payload(b'SFATAL\x00Mno code\x00\x00')
+        self.assertIs(type(e), errors.PostgresError)
+        self.assertEqual(e.sqlstate_code, None)
+
+    def test_table(self):
+        for sqlstate, cls in errors.sqlstate_errors.items():
+            self.assertEqual(cls.sqlstate, sqlstate)
+            self.assertIs(errors.error_class(sqlstate), cls)
+        self.assertIs(errors.error_class(None), errors.PostgresError)
+
+    def test_find_sqlstate(self):
+        self.assertEqual(errors.find_sqlstate(payload(b'42P01')), u'42P01')
+        self.assertEqual(errors.find_sqlstate(b'\x00'), None)
+
+    def test_catch(self):
+        with self.assertRaises(errors.DataError):
+            raise errors.from_payload(payload(b'22012'))
@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_fakeserver
+----------------------------------
+
+Tests for `fakeserver` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import task
+from twisted.trial import unittest
+
+from thrum import binary
+from thrum import connection
+from thrum import constants
+from thrum import errors
+from thrum import fakeserver
+from thrum import framing
+from thrum import messages
+from thrum import notify
+from thrum import pgcopy
+from thrum import txconnection
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+else:
+    from thrum import aioconnection
+
+INT4 = (constants.INT4OID,)
+LATIN1 = {u'client_encoding': u'LATIN1'}
+
+
+class Client(object):
+    '''
+    Records the messages that the server sends
+    '''
+
+    def __init__(self):
+        self.framer = framing.MessageFramer()
+        self.received = []
+        self.lost = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        writer = messages.MessageWriter()
+        writer.startup({u'user': u'alice'})
+        writer.write_to(transport)
+
+    def data_received(self, data):
+        self.framer.feed(data)
+        for code, payload in self.framer:
+            self.received.append((code, bytes(payload)))
+
+    def connection_lost(self, reason):
+        self.lost = True
+
+    def send(self, *calls):
+        writer = messages.MessageWriter()
+        for name, args in calls:
+            getattr(writer, name)(*args)
+        del self.received[:]
+        writer.write_to(self.transport)
+        return self.received
+
+    def codes(self):
+        return b''.join(code for code, payload in self.received)
+
+
+def connect(server, password=None):
+    conn = connection.Connection(u'alice', u'db', password)
+    startups = []
+    conn.startup_callbacks.append(lambda conn, error: startups.append(error))
+    server.loopback(conn)
+    return conn, startups
+
+
+def run(conn, sql, params=(), type_oids=()):
+    pipe = conn.pipeline()
+    result = pipe.execute(sql, params, type_oids)
+    conn.send(pipe)
+    return result
+
+
+class StartupTests(unittest.TestCase):
+
+    def check(self, auth, password=u'secret'):
+        server = fakeserver.FakeServer(users={u'alice': u'secret'},
+                                       auth=auth, scram_iterations=16)
+        conn, startups = connect(server, password)
+        return conn, startups
+
+    def test_trust(self):
+        conn, startups = connect(fakeserver.FakeServer())
+        self.assertEqual(startups, [None])
+        self.assertTrue(conn.idle)
+        self.assertEqual(conn.parameters[u'client_encoding'], u'UTF8')
+        self.assertEqual(conn.backend_pid, 1001)
+
+    def test_client_encoding(self):
+        server = fakeserver.FakeServer(parameters=LATIN1)
+        conn, startups = connect(server)
+        self.assertEqual(conn.parameters[u'client_encoding'], u'UTF8')
+        conn = connection.Connection(u'alice', parameters=LATIN1)
+        server.loopback(conn)
+        self.assertEqual(conn.parameters[u'client_encoding'], u'LATIN1')
+
+    def test_cleartext(self):
+        conn, startups = self.check(fakeserver.CLEARTEXT)
+        self.assertEqual(startups, [None])
+
+    def test_md5(self):
+        conn, startups = self.check(fakeserver.MD5)
+        self.assertEqual(startups, [None])
+
+    def test_scram(self):
+        conn, startups = self.check(fakeserver.SCRAM_SHA_256)
+        self.assertEqual(startups, [None])
+        self.assertTrue(conn.idle)
+
+    def test_bad_password(self):
+        for auth in (fakeserver.CLEARTEXT, fakeserver.MD5,
+                     fakeserver.SCRAM_SHA_256):
+            conn, startups = self.check(auth, u'wrong')
+            error, = startups
+            self.assertEqual(error.sqlstate_code, u'28P01')
+            self.assertTrue(conn.closed)
+
+    def send_before_startup(self, password):
+        server = fakeserver.FakeServer(users={u'alice': u'secret'},
+                                       auth=fakeserver.SCRAM_SHA_256,
+                                       scram_iterations=16)
+        server.script(u'SELECT 1', fakeserver.Result(
+            [(u'n', constants.INT4OID)], [(1,)]))
+        conn = connection.Connection(u'alice', u'db', password)
+        result = run(conn, u'SELECT 1')
+        server.loopback(conn)
+        return conn, result
+
+    def test_send_before_startup(self):
+        conn, result = self.send_before_startup(u'secret')
+        self.assertEqual(result.rows, [(1,)])
+        self.assertTrue(conn.idle)
+
+    def test_send_before_failed_startup(self):
+        conn, result = self.send_before_startup(u'wrong')
+        self.assertIsInstance(result.error, errors.ThrumError)
+        self.assertTrue(conn.closed)
+
+    def test_unknown_user(self):
+        server = fakeserver.FakeServer(users={u'bob': u'x'},
+                                       auth=fakeserver.MD5)
+        conn, startups = connect(server, u'x')
+        self.assertEqual(startups[0].sqlstate_code, u'28000')
+
+    def test_ssl_request(self):
+        session = fakeserver.FakeServer().session()
+        client = Client()
+        session.connection_made(client)
+        written = []
+        client.write = written.append
+        session.data_received(b'\x00\x00\x00\x08' + binary.i_pack(
+            constants.SSL_REQUEST_CODE))
+        self.assertEqual(written, [b'N'])
+        self.assertFalse(session.authenticated)
+
+    def test_no_users(self):
+        with self.assertRaises(ValueError):
+            fakeserver.FakeServer(auth=fakeserver.MD5)
+
+
+class ExtendedQueryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fakeserver.FakeServer(record=True)
+        self.conn, startups = connect(self.server)
+
+    def test_script(self):
+        self.server.script(u'SELECT n FROM t', fakeserver.Result(
+            [(u'n', constants.INT4OID)], [(1,), (None,), (3,)]))
+        result = run(self.conn, u'SELECT n FROM t')
+        self.assertEqual(result.rows, [(1,), (None,), (3,)])
+        self.assertEqual(result.command_tag, b'SELECT 3')
+        # The second time the statement is cached
+        result = run(self.conn, u'SELECT n FROM t')
+        self.assertEqual(len(result.rows), 3)
+
+    def test_parameters(self):
+        self.server.script(u'SELECT $1 + $2', lambda session, params:
+                           fakeserver.Result([(u'sum', constants.INT8OID)],
+                                             [(sum(params or ()),)]))
+        result = run(self.conn, u'SELECT $1 + $2', (2, 3),
+                     (constants.INT4OID, constants.INT8OID))
+        self.assertEqual(result.rows, [(5,)])
+        self.assertEqual(self.server.log[-1], (u'SELECT $1 + $2', (2, 3)))
+
+    def test_pipeline(self):
+        self.server.script(u'INSERT', fakeserver.Result(
+            command_tag=b'INSERT 0 1'))
+        pipe = self.conn.pipeline()
+        results = pipe.executemany(u'INSERT', [(1,), (2,)], INT4)
+        self.conn.send(pipe)
+        self.assertEqual([result.command_tag for result in results],
+                         [b'INSERT 0 1'] * 2)
+
+    def test_no_script(self):
+        pipe = self.conn.pipeline()
+        first = pipe.execute(u'SELECT nothing')
+        second = pipe.execute(u'SELECT 1')
+        self.conn.send(pipe)
+        self.assertEqual(first.error.sqlstate_code, u'42P01')
+        self.assertIsInstance(second.error, errors.PipelineAborted)
+        self.assertTrue(self.conn.idle)
+
+    def test_error(self):
+        self.server.script(u'SELECT 1/0', fakeserver.Result(
+            error=(b'22012', u'division by zero')))
+        result = run(self.conn, u'SELECT 1/0')
+        self.assertEqual(result.error.sqlstate_code, u'22012')
+        self.assertEqual(result.error.message, u'division by zero')
+
+    def test_default(self):
+        self.server.default = fakeserver.Result(command_tag=b'OK')
+        self.assertEqual(run(self.conn, u'ANYTHING').command_tag, b'OK')
+
+    def test_transaction(self):
+        self.server.script(u'SELECT 1/0', fakeserver.Result(
+            error=(b'22012', u'division by zero')))
+        run(self.conn, u'BEGIN')
+        self.assertEqual(self.conn.transaction_status,
+                         constants.IDLE_IN_TRANSACTION)
+        run(self.conn, u'SELECT 1/0')
+        self.assertEqual(self.conn.transaction_status,
+                         constants.IDLE_IN_FAILED_TRANSACTION)
+        result = run(self.conn, u'COMMIT')
+        self.assertEqual(result.command_tag, b'ROLLBACK')
+        self.assertTrue(self.conn.idle)
+
+    def test_cursor(self):
+        self.server.script(u'SELECT * FROM big', fakeserver.generate(
+            [(u'n', constants.INT8OID), (u'name', constants.TEXTOID)], 5))
+        cur = self.conn.cursor(u'SELECT * FROM big', fetch_size=2,
+                               adaptive=False)
+        self.conn.send(cur)
+        batches = []
+        while not cur.finished:
+            cur.request(lambda cur, rows: batches.append(rows))
+        self.assertEqual([len(rows) for rows in batches], [2, 2, 1])
+        self.assertEqual(batches[2], [(4, b'row 4')])
+        self.assertTrue(cur.done)
+        self.assertTrue(self.conn.idle)
+
+    def test_notifications(self):
+        other, startups = connect(self.server)
+        dispatcher = notify.Dispatcher(lambda channel: run(
+            self.conn, u'LISTEN ' + notify.quote_ident(channel)))
+        dispatcher.attach(self.conn)
+        received = []
+        dispatcher.subscribe(u'Cache', callback=received.append)
+        run(other, u'''NOTIFY "Cache", 'it''s gone' ''')
+        self.server.notify(u'Cache', u'again', 7)
+        self.server.notify(u'cache', u'elsewhere')
+        self.assertEqual([(n.pid, n.payload) for n in received],
+                         [(1002, u"it's gone"), (7, u'again')])
+
+    def test_terminate(self):
+        self.conn.terminate()
+        self.assertTrue(self.conn.closed)
+        self.assertEqual(self.server.sessions, set())
+
+
+class SimpleQueryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fakeserver.FakeServer()
+        self.client = Client()
+        self.session = self.server.loopback(self.client)
+
+    def test_text_results(self):
+        self.server.script(u'SELECT a, b, c', fakeserver.Result(
+            [(u'a', constants.INT4OID), (u'b', constants.BOOLOID),
+             (u'c', constants.FLOAT8OID)], [(1, True, 0.5)]))
+        received = self.client.send(('query', (u'SELECT a, b, c',)))
+        self.assertEqual(self.client.codes(), b'TDCZ')
+        self.assertEqual(received[1][1],
+                         b'\x00\x03\x00\x00\x00\x011\x00\x00\x00\x01t'
+                         b'\x00\x00\x00\x030.5')
+
+    def test_empty_query(self):
+        self.client.send(('query', (u' ',)))
+        self.assertEqual(self.client.codes(), b'IZ')
+
+    def test_copy_out(self):
+        self.server.script(u'COPY t TO STDOUT', fakeserver.Result(
+            [(u'n', constants.INT4OID)], [(1,), (2,)],
+            copy=fakeserver.COPY_OUT))
+        received = self.client.send(('query', (u'COPY t TO STDOUT',)))
+        self.assertEqual(self.client.codes(), b'HdcCZ')
+        decoder = pgcopy.CopyOutDecoder(INT4)
+        decoder.feed(received[1][1])
+        self.assertEqual(list(decoder.columns()[0]), [1, 2])
+        self.assertEqual(received[3][1], b'COPY 2\x00')
+
+    def test_copy_in(self):
+        self.server.script(u'COPY t FROM STDIN', fakeserver.Result(
+            [(u'n', constants.INT4OID)], copy=fakeserver.COPY_IN))
+        self.client.send(('query', (u'COPY t FROM STDIN',)))
+        self.assertEqual(self.client.codes(), b'G')
+        for message in pgcopy.copy_in_messages([(5,), (6,)], INT4):
+            self.client.transport.write(message)
+        self.assertEqual(self.client.codes(), b'GCZ')
+        sql, columns = self.server.copied[0]
+        self.assertEqual(list(columns[0]), [5, 6])
+
+    def test_copy_fail(self):
+        self.server.script(u'COPY t FROM STDIN', fakeserver.Result(
+            [(u'n', constants.INT4OID)], copy=fakeserver.COPY_IN))
+        self.client.send(('query', (u'COPY t FROM STDIN',)))
+        self.client.transport.write(b'f\x00\x00\x00\x07no\x00')
+        self.assertEqual(self.client.codes(), b'GEZ')
+
+    def test_extended_text_and_suspend(self):
+        self.server.script(u'SELECT n', fakeserver.Result(
+            [(u'n', constants.INT4OID)], [(1,), (2,), (3,)]))
+        received = self.client.send(
+            ('parse', (b'', u'SELECT n')),
+            ('bind', (b'', b'', b'\x00\x00', constants.FC_BINARY,
+                      constants.FC_TEXT)),
+            ('describe', (constants.PORTAL, b'')),
+            ('execute', (b'', 2)),
+            ('execute', (b'', 2)),
+            ('sync', ()))
+        self.assertEqual(self.client.codes(), b'12TDDsDCZ')
+        self.assertEqual(received[3][1], b'\x00\x01\x00\x00\x00\x011')
+
+    def test_unexpected_message(self):
+        self.client.send(('append', (b'?\x00\x00\x00\x04',)))
+        self.assertEqual(self.client.codes(), b'E')
+        self.assertTrue(self.client.lost)
+
+
+class LatencyTests(unittest.TestCase):
+
+    def test_latency(self):
+        clock = task.Clock()
+        server = fakeserver.FakeServer(call_later=clock.callLater)
+        server.script(u'SELECT slow', fakeserver.Result(
+            [(u'n', constants.INT4OID)], [(1,)], latency=0.5))
+        conn, startups = connect(server)
+        result = run(conn, u'SELECT slow')
+        self.assertFalse(result.done)
+        clock.advance(0.4)
+        self.assertFalse(result.done)
+        clock.advance(0.1)
+        self.assertEqual(result.rows, [(1,)])
+        self.assertTrue(conn.idle)
+
+
+class TCPTests(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def test_twisted(self):
+        server = fakeserver.FakeServer(users={u'alice': u'pw'},
+                                       auth=fakeserver.SCRAM_SHA_256,
+                                       scram_iterations=16)
+        server.script(u'SELECT n', fakeserver.generate(
+            [(u'n', constants.INT4OID)], 3))
+        port = reactor.listenTCP(0, server.twisted_factory(),
+                                 interface=u'127.0.0.1')
+        self.addCleanup(port.stopListening)
+        conn = yield txconnection.connect(reactor, u'127.0.0.1',
+                                          port.getHost().port,
+                                          user=u'alice', password=u'pw')
+        result = yield conn.execute(u'SELECT n')
+        self.assertEqual(result.rows, [(0,), (1,), (2,)])
+        yield conn.close()
+
+    def latin1_server(self):
+        server = fakeserver.FakeServer(parameters=LATIN1)
+        server.script(u'SELECT name', fakeserver.Result(
+            [(u'name', constants.TEXTOID)], [(b'caf\xe9',)]))
+        return server
+
+    @defer.inlineCallbacks
+    def test_twisted_decode_text(self):
+        port = reactor.listenTCP(0, self.latin1_server().twisted_factory(),
+                                 interface=u'127.0.0.1')
+        self.addCleanup(port.stopListening)
+        conn = yield txconnection.connect(reactor, u'127.0.0.1',
+                                          port.getHost().port,
+                                          user=u'alice', decode_text=True,
+                                          parameters=LATIN1)
+        result = yield conn.execute(u'SELECT name')
+        self.assertEqual(result.rows, [(u'caf\xe9',)])
+        yield conn.close()
+
+    def test_asyncio(self):
+        if asyncio is None:
+            raise unittest.SkipTest("asyncio is not available")
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        server = fakeserver.FakeServer(users={u'alice': u'pw'},
+                                       auth=fakeserver.MD5)
+        server.script(u'SELECT n', fakeserver.generate(
+            [(u'n', constants.INT4OID)], 3))
+        listener = loop.run_until_complete(
+            loop.create_server(server.session, u'127.0.0.1', 0))
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            conn = loop.run_until_complete(aioconnection.connect(
+                u'127.0.0.1', port, user=u'alice', password=u'pw',
+                loop=loop))
+            result = loop.run_until_complete(conn.execute(u'SELECT n'))
+            self.assertEqual(result.rows, [(0,), (1,), (2,)])
+            loop.run_until_complete(conn.close())
+        finally:
+            listener.close()
+            loop.run_until_complete(listener.wait_closed())
+
+    def test_asyncio_decode_text(self):
+        if asyncio is None:
+            raise unittest.SkipTest("asyncio is not available")
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        listener = loop.run_until_complete(loop.create_server(
+            self.latin1_server().session, u'127.0.0.1', 0))
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            conn = loop.run_until_complete(aioconnection.connect(
+                u'127.0.0.1', port, user=u'alice', loop=loop,
+                decode_text=True, parameters=LATIN1))
+            result = loop.run_until_complete(conn.execute(u'SELECT name'))
+            self.assertEqual(result.rows, [(u'caf\xe9',)])
+            loop.run_until_complete(conn.close())
+        finally:
+            listener.close()
+            loop.run_until_complete(listener.wait_closed())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_framing
+----------------------------------
+
+Tests for `framing` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial import unittest
+
+from thrum import binary
+from thrum import constants
+from thrum import errors
+from thrum import framing
+from thrum.tests.helpers import message
+
+
+class MessageFramerTests(unittest.TestCase):
+
+    def test_whole_messages(self):
+        framer = framing.MessageFramer()
+        framer.feed(message(constants.DATA_ROW, b'row one') +
+                    message(constants.READY_FOR_QUERY, constants.IDLE))
+        messages = [(code, bytes(payload)) for code, payload in framer]
+        self.assertEqual(messages, [(constants.DATA_ROW, b'row one'),
+                                    (constants.READY_FOR_QUERY, b'I')])
+        self.assertEqual(len(framer), 0)
+
+    def test_payload_is_memoryview(self):
+        framer = framing.MessageFramer()
+        framer.feed(message(constants.DATA_ROW, b'abc'))
+        code, payload = next(iter(framer))
+        self.assertIsInstance(payload, memoryview)
+        self.assertEqual(code, constants.DATA_ROW)
+
+    if framing._view is not memoryview:
+        test_payload_is_memoryview.skip = "Payloads are copies on Python 2"
+
+    def test_no_size_hint(self):
+        framer = framing.MessageFramer(size_hint=0)
+        framer.feed(message(constants.DATA_ROW, b'abc'))
+        framer.feed(message(constants.READY_FOR_QUERY, b'I'))
+        self.assertEqual([(code, bytes(payload)) for code, payload in framer],
+                         [(constants.DATA_ROW, b'abc'),
+                          (constants.READY_FOR_QUERY, b'I')])
+
+    def test_split_messages(self):
+        framer = framing.MessageFramer(size_hint=8)
+        data = b''.join(message(constants.DATA_ROW, b'x' * index)
+                        for index in range(20))
+        received = []
+        for index in range(0, len(data), 3):
+            framer.feed(data[index:index + 3])
+            received.extend(bytes(payload) for code, payload in framer)
+        self.assertEqual(received, [b'x' * index for index in range(20)])
+        self.assertEqual(len(framer), 0)
+
+    def test_partial_message_is_kept(self):
+        framer = framing.MessageFramer(size_hint=16)
+        data = message(constants.COMMAND_COMPLETE, b'SELECT 1\x00')
+        framer.feed(data[:-2])
+        self.assertEqual(list(framer), [])
+        self.assertEqual(len(framer), len(data) - 2)
+        framer.feed(data[-2:])
+        self.assertEqual([bytes(payload) for code, payload in framer],
+                         [b'SELECT 1\x00'])
+
+    def test_compaction_reuses_buffer(self):
+        framer = framing.MessageFramer(size_hint=32)
+        buf = framer.buffer
+        for _ in range(10):
+            framer.feed(message(constants.DATA_ROW, b'12345678'))
+            framer.feed(message(constants.DATA_ROW, b'1234'))
+            self.assertEqual(len(list(framer)), 2)
+        self.assertIs(framer.buffer, buf)
+
+        framer.feed(message(constants.DATA_ROW, b'1234')[:6])
+        framer.feed(b'\x00' * 26)
+        self.assertIs(framer.buffer, buf)
+
+    def test_growth(self):
+        framer = framing.MessageFramer(size_hint=4)
+        payload = b'y' * 1000
+        framer.feed(message(constants.DATA_ROW, payload))
+        self.assertEqual([bytes(p) for code, p in framer], [payload])
+
+    def test_memoryview_survives_growth(self):
+        framer = framing.MessageFramer(size_hint=16)
+        framer.feed(message(constants.DATA_ROW, b'abc') + b'D')
+        code, payload = next(iter(framer))
+        framer.feed(binary.i_pack(104) + b'z' * 100)
+        self.assertEqual(bytes(payload), b'abc')
+
+    def test_bad_length(self):
+        framer = framing.MessageFramer()
+        framer.feed(constants.DATA_ROW + binary.i_pack(3))
+        with self.assertRaises(errors.ThrumError):
+            list(framer)
+
+    def test_dispatch(self):
+        framer = framing.MessageFramer()
+        rows = []
+        done = []
+        handlers = {
+            constants.DATA_ROW: lambda p: rows.append(bytes(p)),
+            constants.COMMAND_COMPLETE: lambda p: done.append(bytes(p))}
+        framer.feed(message(constants.DATA_ROW, b'one') +
+                    message(constants.DATA_ROW, b'two') +
+                    message(constants.COMMAND_COMPLETE, b'SELECT 2\x00') +
+                    message(constants.READY_FOR_QUERY)[:3])
+        framer.dispatch(handlers)
+        self.assertEqual(rows, [b'one', b'two'])
+        self.assertEqual(done, [b'SELECT 2\x00'])
+        self.assertEqual(len(framer), 3)
+
+    def test_dispatch_unhandled(self):
+        framer = framing.MessageFramer()
+        framer.feed(message(constants.NOTICE_RESPONSE))
+        with self.assertRaises(errors.ThrumError):
+            framer.dispatch({})
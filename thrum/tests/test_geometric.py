@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_geometric
+----------------------------------
+
+Tests for `geometric` module.
+"""
+
+from __future__ import division, absolute_import
+
+import array
+import struct
+
+from twisted.trial import unittest
+
+from thrum import constants
+from thrum import geometric
+from thrum import rows
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FixedTests(unittest.TestCase):
+
+    def test_point(self):
+        data = geometric.point_send((1.5, -2.0))
+        self.assertEqual(data, struct.pack('!dd', 1.5, -2.0))
+        self.assertEqual(geometric.point_recv(data), (1.5, -2.0))
+
+    def test_lseg(self):
+        value = ((0.0, 1.0), (2.0, 3.0))
+        data = geometric.lseg_send(value)
+        self.assertEqual(data, struct.pack('!dddd', 0.0, 1.0, 2.0, 3.0))
+        self.assertEqual(geometric.lseg_recv(data), value)
+
+    def test_box(self):
+        data = geometric.box_send(((0.0, 5.0), (3.0, 1.0)))
+        self.assertEqual(data, struct.pack('!dddd', 3.0, 5.0, 0.0, 1.0))
+        self.assertEqual(geometric.box_recv(data), ((3.0, 5.0), (0.0, 1.0)))
+
+    def test_circle(self):
+        value = ((1.0, 2.0), 3.0)
+        data = geometric.circle_send(value)
+        self.assertEqual(data, struct.pack('!ddd', 1.0, 2.0, 3.0))
+        self.assertEqual(geometric.circle_recv(data), value)
+
+
+class PointListTests(unittest.TestCase):
+
+    points = [(float(index), index * 0.5) for index in range(1000)]
+
+    def test_polygon(self):
+        data = geometric.polygon_send(self.points)
+        self.assertEqual(data[:4], struct.pack('!i', 1000))
+        self.assertEqual(data[4:20], struct.pack('!dd', 0.0, 0.0))
+        self.assertEqual(data[-16:], struct.pack('!dd', 999.0, 499.5))
+        points = geometric.polygon_recv(data)
+        self.assertIsInstance(points, array.array)
+        self.assertEqual(list(zip(points[::2], points[1::2])), self.points)
+        self.assertEqual(geometric.polygon_send(points), data)
+
+    def test_path(self):
+        data = geometric.path_send((True, self.points[:3]))
+        self.assertEqual(data[:5], b'\x01\x00\x00\x00\x03')
+        closed, points = geometric.path_recv(memoryview(b'xx' + data), 2)
+        self.assertTrue(closed)
+        self.assertEqual(points, array.array('d', [0, 0, 1, 0.5, 2, 1]))
+
+        closed, points = geometric.path_recv(geometric.path_send((False, [])))
+        self.assertFalse(closed)
+        self.assertEqual(len(points), 0)
+
+    def test_bad_count(self):
+        data = geometric.polygon_send(self.points[:2])
+        with self.assertRaises(ValueError):
+            geometric.polygon_recv(data[:-1])
+        with self.assertRaises(ValueError):
+            geometric.polygon_send(array.array('d', [1.0, 2.0, 3.0]))
+
+    def test_numpy(self):
+        if numpy is None:
+            raise unittest.SkipTest("numpy is not installed")
+        data = geometric.polygon_send(self.points)
+        points = geometric.polygon_recv_numpy(data)
+        self.assertEqual(points.shape, (1000, 2))
+        self.assertEqual(points[999].tolist(), [999.0, 499.5])
+        self.assertEqual(geometric.polygon_send(points), data)
+
+
+class RegisteredTests(unittest.TestCase):
+
+    def test_row(self):
+        key = (constants.POINTOID, constants.CIRCLEOID, constants.POLYGONOID)
+        value = ((1.0, 2.0), ((0.0, 0.0), 1.0), [(0.0, 0.0), (1.0, 1.0)])
+        data = rows.get_row_encoder(key)(value)
+        decode_row = rows.get_row_decoder(
+            tuple((type_oid, constants.FC_BINARY) for type_oid in key))
+        point, circle, polygon = decode_row(data)
+        self.assertEqual((point, circle), value[:2])
+        self.assertEqual(polygon.tolist(), [0.0, 0.0, 1.0, 1.0])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_lru
+----------------------------------
+
+Tests for `lru` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial import unittest
+
+from thrum import lru
+
+
+class LRUCacheTests(unittest.TestCase):
+
+    def test_get(self):
+        cache = lru.LRUCache(maxsize=2)
+        cache['a'] = 1
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('b', 2), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_getitem(self):
+        cache = lru.LRUCache(maxsize=2)
+        cache['a'] = None
+        self.assertEqual(cache['a'], None)
+        with self.assertRaises(KeyError):
+            cache['b']
+
+    def test_eviction_order(self):
+        cache = lru.LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(list(cache), ['a', 'c'])
+
+    def test_replace_does_not_evict(self):
+        cache = lru.LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a'] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 0)
+        self.assertEqual(cache['a'], 3)
+
+    def test_on_evict(self):
+        evicted = []
+        cache = lru.LRUCache(maxsize=1,
+                             on_evict=lambda k, v: evicted.append((k, v)))
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(evicted, [('a', 1)])
+
+    def test_stats(self):
+        cache = lru.LRUCache(maxsize=1)
+        self.assertEqual(cache.hit_rate, 0.0)
+        cache['a'] = 1
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['maxsize'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_peek(self):
+        cache = lru.LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.peek('a'), 1)
+        self.assertIs(cache.peek('c'), None)
+        self.assertEqual(cache.hits + cache.misses, 0)
+        # Peeking didn't make 'a' the most recently used item
+        cache['c'] = 3
+        self.assertNotIn('a', cache)
+
+    def test_bad_maxsize(self):
+        with self.assertRaises(ValueError):
+            lru.LRUCache(maxsize=0)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_messages
+----------------------------------
+
+Tests for `messages` module.
+"""
+
+from __future__ import division, absolute_import
+
+import struct
+
+from twisted.trial import unittest
+
+from thrum import constants
+from thrum import messages
+from thrum import rows
+from thrum import textcodec
+from thrum.tests.helpers import FakeTransport, sent
+
+
+class MessageWriterTests(unittest.TestCase):
+
+    def test_query(self):
+        writer = messages.MessageWriter()
+        writer.query(u'SELECT 1')
+        self.assertEqual(writer.build(), b'Q\x00\x00\x00\x0dSELECT 1\x00')
+        self.assertEqual(len(writer), 0)
+
+    def test_parse(self):
+        writer = messages.MessageWriter()
+        writer.parse(b'st', u'SELECT $1, $2',
+                     (constants.INT4OID, constants.TEXTOID))
+        (code, payload), = sent(writer.build())
+        self.assertEqual(code, constants.PARSE)
+        self.assertEqual(payload, b'st\x00SELECT $1, $2\x00' +
+                         struct.pack('!hII', 2, 23, 25))
+
+    def test_bind(self):
+        params = rows.get_row_encoder((constants.INT4OID,))((7,))
+        writer = messages.MessageWriter()
+        writer.bind(b'', u'st', params)
+        writer.bind(b'p', b'', result_formats=(0, 1))
+        first, second = sent(writer.build())
+        self.assertEqual(first, (constants.BIND,
+                                 b'\x00st\x00' + struct.pack('!hh', 1, 1) +
+                                 params + struct.pack('!hh', 1, 1)))
+        self.assertEqual(second, (constants.BIND,
+                                  b'p\x00\x00' + struct.pack('!hh', 1, 1) +
+                                  struct.pack('!h', 0) +
+                                  struct.pack('!hhh', 2, 0, 1)))
+
+    def test_describe_execute_close(self):
+        writer = messages.MessageWriter()
+        writer.describe(constants.PORTAL, b'p')
+        writer.execute(b'p', 100)
+        writer.close(constants.STATEMENT, u'st')
+        self.assertEqual(sent(writer.build()), [
+            (constants.DESCRIBE, b'Pp\x00'),
+            (constants.EXECUTE, b'p\x00' + struct.pack('!i', 100)),
+            (constants.CLOSE, b'Sst\x00')])
+
+    def test_codec(self):
+        writer = messages.MessageWriter(
+            codec=textcodec.get_codec(u'LATIN1'))
+        writer.query(u"SELECT 'caf\xe9'")
+        writer.parse(b'', u"SELECT 'caf\xe9'")
+        self.assertEqual(sent(writer.build()), [
+            (constants.QUERY, b"SELECT 'caf\xe9'\x00"),
+            (constants.PARSE, b"\x00SELECT 'caf\xe9'\x00\x00\x00")])
+
+        # The startup packet precedes the backend's client_encoding
+        writer.startup({u'user': u'jos\xe9'})
+        self.assertIn(b'user\x00jos\xc3\xa9\x00', writer.build())
+
+    def test_single_write(self):
+        writer = messages.MessageWriter()
+        transport = FakeTransport()
+        writer.write_to(transport)
+        self.assertEqual(transport.writes, [])
+
+        writer.parse(b'', u'SELECT 1')
+        writer.bind(b'', b'')
+        writer.execute(b'')
+        writer.flush()
+        writer.sync()
+        size = len(writer)
+        writer.write_to(transport)
+        data, = transport.writes
+        self.assertEqual(len(data), size)
+        self.assertEqual([code for code, payload in sent(data)],
+                         [constants.PARSE, constants.BIND, constants.EXECUTE,
+                          constants.FLUSH, constants.SYNC])
+        self.assertEqual(len(writer), 0)
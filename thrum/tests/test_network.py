@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_network
+----------------------------------
+
+Tests for `network` module.
+"""
+
+from __future__ import division, absolute_import
+
+import ipaddress
+
+from twisted.trial import unittest
+
+from thrum import binary
+from thrum import constants
+from thrum import network
+from thrum import rows
+
+
+class InetTests(unittest.TestCase):
+
+    def test_ipv4_address(self):
+        value = ipaddress.ip_address(u'192.168.1.2')
+        data = network.inet_send(value)
+        self.assertEqual(data, b'\x02\x20\x00\x04\xc0\xa8\x01\x02')
+        self.assertEqual(network.inet_recv(data), value)
+        self.assertEqual(network.inet_recv_raw(data),
+                         (constants.PGSQL_AF_INET, 32, 0xc0a80102))
+
+    def test_ipv4_interface(self):
+        value = ipaddress.ip_interface(u'10.1.2.3/8')
+        data = network.inet_send(value)
+        self.assertEqual(data, b'\x02\x08\x00\x04\x0a\x01\x02\x03')
+        self.assertEqual(network.inet_recv(data), value)
+        self.assertEqual(network.inet_send(u'10.1.2.3/8'), data)
+
+    def test_ipv6(self):
+        value = ipaddress.ip_address(u'2001:db8::1')
+        data = network.inet_send(value)
+        self.assertEqual(data[:4], b'\x03\x80\x00\x10')
+        self.assertEqual(data[4:], value.packed)
+        self.assertEqual(network.inet_recv(data), value)
+        self.assertEqual(network.inet_recv_raw(data),
+                         (constants.PGSQL_AF_INET6, 128, int(value)))
+
+        value = ipaddress.ip_interface(u'2001:db8::1/64')
+        self.assertEqual(network.inet_recv(network.inet_send(value)), value)
+
+    def test_cidr(self):
+        for text in (u'192.168.0.0/16', u'2001:db8::/32'):
+            value = ipaddress.ip_network(text)
+            data = network.cidr_send(text)
+            self.assertEqual(data[2:3], b'\x01')
+            self.assertEqual(network.cidr_recv(data), value)
+            self.assertEqual(network.cidr_send(value), data)
+
+    def test_offset(self):
+        data = b'xx' + network.inet_send(u'1.2.3.4')
+        self.assertEqual(network.inet_recv(memoryview(data), 2),
+                         ipaddress.ip_address(u'1.2.3.4'))
+
+    def test_bad_family(self):
+        with self.assertRaises(ValueError):
+            network.inet_recv(b'\x07\x20\x00\x04\x00\x00\x00\x00')
+
+
+class MacaddrTests(unittest.TestCase):
+
+    def test_macaddr(self):
+        data = network.macaddr_send(u'08:00:2B:01:02:03')
+        self.assertEqual(data, b'\x08\x00\x2b\x01\x02\x03')
+        self.assertEqual(network.macaddr_recv(data), u'08:00:2b:01:02:03')
+        self.assertEqual(network.macaddr_recv_raw(data), 0x08002b010203)
+        self.assertEqual(network.macaddr_send(0x08002b010203), data)
+        self.assertEqual(network.macaddr_send(u'08-00-2b-01-02-03'), data)
+
+    def test_macaddr8(self):
+        data = network.macaddr8_send(u'08:00:2b:01:02:03:04:05')
+        self.assertEqual(data, b'\x08\x00\x2b\x01\x02\x03\x04\x05')
+        self.assertEqual(network.macaddr8_recv(data),
+                         u'08:00:2b:01:02:03:04:05')
+        self.assertEqual(network.macaddr8_recv_raw(data), 0x08002b0102030405)
+
+    def test_macaddr8_high(self):
+        # Above sys.maxint, so a long on Python 2
+        data = network.macaddr8_send(u'ff:ee:dd:cc:bb:aa:99:88')
+        value = network.macaddr8_recv_raw(data)
+        self.assertEqual(value, 0xffeeddccbbaa9988)
+        self.assertEqual(network.macaddr8_send(value), data)
+
+    def test_bad_macaddr(self):
+        with self.assertRaises(ValueError):
+            network.macaddr_send(u'08:00:2b')
+        with self.assertRaises(ValueError):
+            network.macaddr_send(2 ** 48)
+
+
+class RegisteredTests(unittest.TestCase):
+
+    def test_row(self):
+        key = (constants.INETOID, constants.CIDROID, constants.MACADDROID)
+        value = (ipaddress.ip_address(u'127.0.0.1'),
+                 ipaddress.ip_network(u'127.0.0.0/8'),
+                 u'00:11:22:33:44:55')
+        data = rows.get_row_encoder(key)(value)
+        decode_row = rows.get_row_decoder(
+            tuple((type_oid, constants.FC_BINARY) for type_oid in key))
+        self.assertEqual(decode_row(data), value)
+        self.assertEqual(binary.h_unpack(data)[0], 3)
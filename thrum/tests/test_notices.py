@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_notices
+----------------------------------
+
+Tests for `notices` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.internet import task
+from twisted.trial import unittest
+
+from thrum import connection
+from thrum import constants
+from thrum import notices
+from thrum.tests.helpers import FakeTransport, LogCapture, STARTED, message
+
+
+def payload(text, code=b'00000'):
+    return (b'SNOTICE\x00VNOTICE\x00C' + code + b'\x00M' + text +
+            b'\x00Wloop\x00\x00')
+
+
+def notice(text, code=b'00000'):
+    return notices.Notice(payload(text, code))
+
+
+class NoticeTests(unittest.TestCase):
+
+    def test_lazy(self):
+        n = notice(b'hello')
+        self.assertIs(n._fields, None)
+        self.assertEqual(n.key(), (b'00000', b'hello'))
+        self.assertIs(n._fields, None)
+        self.assertEqual(n.message, u'hello')
+        self.assertEqual(n.severity, u'NOTICE')
+        self.assertEqual(n.where, u'loop')
+        self.assertEqual(n.hint, None)
+
+
+class NoticeSinkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.batches = []
+
+    def sink(self, **kwargs):
+        sink = notices.NoticeSink(clock=self.clock.seconds, **kwargs)
+        sink.handlers.append(self.batches.append)
+        return sink
+
+    def messages(self):
+        return [[(n.message, n.count) for n in batch]
+                for batch in self.batches]
+
+    def test_rate_limited(self):
+        sink = self.sink(interval=1.0, call_later=self.clock.callLater)
+        sink(notice(b'first'))
+        self.assertEqual(self.messages(), [[(u'first', 1)]])
+        for text in (b'a', b'b', b'a', b'a'):
+            sink(notice(text))
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(len(sink), 2)
+        self.clock.advance(1.0)
+        self.assertEqual(self.messages()[1], [(u'a', 3), (u'b', 1)])
+        self.assertEqual(sink.stats(), {'buffered': 0, 'received': 5,
+                                        'coalesced': 2, 'dropped': 0,
+                                        'delivered': 3, 'failed': 0})
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_coalesce_by_sqlstate(self):
+        sink = self.sink(interval=10.0)
+        sink(notice(b'x'))
+        sink(notice(b'same', b'01000'))
+        sink(notice(b'same', b'01000'))
+        sink(notice(b'same', b'00000'))
+        self.assertEqual(len(sink), 2)
+        sink.flush()
+        self.assertEqual(self.messages()[1], [(u'same', 2), (u'same', 1)])
+
+    def test_without_timer(self):
+        sink = self.sink(interval=1.0)
+        sink(notice(b'a'))
+        sink(notice(b'b'))
+        self.assertEqual(len(self.batches), 1)
+        self.clock.advance(2.0)
+        sink(notice(b'c'))
+        self.assertEqual(self.messages()[1], [(u'b', 1), (u'c', 1)])
+        sink.flush()
+        self.assertEqual(len(self.batches), 2)
+
+    def test_batch_size(self):
+        sink = self.sink(interval=60.0, batch_size=3,
+                         call_later=self.clock.callLater)
+        for text in (b'a', b'b', b'c', b'd', b'd'):
+            sink(notice(text))
+        self.assertEqual(self.messages(), [[(u'a', 1)],
+                                           [(u'b', 1), (u'c', 1),
+                                            (u'd', 1)]])
+        self.clock.advance(60.0)
+        self.assertEqual(self.messages()[2], [(u'd', 1)])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_bounded(self):
+        sink = self.sink(maxsize=2, interval=60.0)
+        for text in (b'a', b'b', b'c', b'd'):
+            sink(notice(text))
+        self.assertEqual(sink.dropped, 1)
+        sink.flush()
+        self.assertEqual(self.messages(), [[(u'a', 1)],
+                                           [(u'c', 1), (u'd', 1)]])
+
+    def test_failing_handler(self):
+        sink = notices.NoticeSink()
+
+        def fail(batch):
+            raise ZeroDivisionError()
+        sink.handlers.append(fail)
+        sink.handlers.append(self.batches.append)
+        with LogCapture() as records:
+            sink(notice(b'a'))
+        self.assertEqual(self.messages(), [[(u'a', 1)]])
+        self.assertEqual(sink.failed, 1)
+        record, = records
+        self.assertIs(record.exc_info[0], ZeroDivisionError)
+
+    def test_bad_size(self):
+        with self.assertRaises(ValueError):
+            notices.NoticeSink(maxsize=0)
+
+    def test_connection(self):
+        conn = connection.Connection(u'alice')
+        conn.connection_made(FakeTransport())
+        conn.data_received(STARTED)
+        sink = self.sink(interval=60.0)
+        sink.attach(conn)
+        for _ in range(3):
+            conn.data_received(message(constants.NOTICE_RESPONSE,
+                                       payload(b'loud')))
+        sink.detach(conn)
+        conn.data_received(message(constants.NOTICE_RESPONSE,
+                                   payload(b'quiet')))
+        sink.flush()
+        self.assertEqual(self.messages(), [[(u'loud', 1)], [(u'loud', 2)]])
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_notify
+----------------------------------
+
+Tests for `notify` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial import unittest
+
+from thrum import connection
+from thrum import constants
+from thrum import notify
+from thrum.tests.helpers import (
+    BIND_COMPLETE, FakeTransport, LogCapture, PARSE_COMPLETE, READY, STARTED,
+    command_complete, data_row, notification, row_description)
+
+
+class DispatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.listening = []
+        self.dispatcher = notify.Dispatcher(
+            lambda channel: self.listening.append((u'LISTEN', channel)),
+            lambda channel: self.listening.append((u'UNLISTEN', channel)))
+
+    def test_fan_out(self):
+        first, second = [], []
+        one = self.dispatcher.subscribe(u'chan', callback=first.append)
+        self.dispatcher.subscribe(u'chan', callback=second.append)
+        self.dispatcher(7, u'chan', u'hi')
+        self.dispatcher(7, u'other', u'lost')
+        expected = [notify.Notification(7, u'chan', u'hi')]
+        self.assertEqual(first, expected)
+        self.assertEqual(second, expected)
+        self.assertEqual(self.dispatcher.unrouted, 1)
+        self.assertEqual(self.listening, [(u'LISTEN', u'chan')])
+
+        self.dispatcher.unsubscribe(one)
+        self.dispatcher(7, u'chan', u'again')
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 2)
+        self.assertEqual(len(self.dispatcher), 1)
+
+    def test_failing_callback(self):
+        received = []
+
+        def fail(notification):
+            raise ZeroDivisionError()
+        self.dispatcher.subscribe(u'chan', callback=fail)
+        self.dispatcher.subscribe(u'chan', callback=received.append)
+        with LogCapture() as records:
+            self.dispatcher(7, u'chan', u'hi')
+        self.assertEqual(received, [notify.Notification(7, u'chan', u'hi')])
+        self.assertEqual(self.dispatcher.stats()['failed'], 1)
+        record, = records
+        self.assertIs(record.exc_info[0], ZeroDivisionError)
+
+    def test_unlisten(self):
+        sub = self.dispatcher.subscribe(u'chan')
+        sub.close()
+        sub.close()
+        self.assertEqual(self.listening, [(u'LISTEN', u'chan'),
+                                          (u'UNLISTEN', u'chan')])
+        self.assertEqual(self.dispatcher.channels, {})
+
+    def test_unsubscribe_in_callback(self):
+        received = []
+
+        def once(notification):
+            received.append(notification)
+            sub.close()
+        sub = self.dispatcher.subscribe(u'chan', callback=once)
+        other = self.dispatcher.subscribe(u'chan')
+        self.dispatcher(1, u'chan', u'a')
+        self.dispatcher(1, u'chan', u'b')
+        self.assertEqual(len(received), 1)
+        self.assertEqual(len(other), 2)
+
+    def test_request(self):
+        sub = self.dispatcher.subscribe(u'chan')
+        received = []
+        self.dispatcher(1, u'chan', u'a')
+        sub.request(received.append)
+        sub.request(received.append)
+        self.assertEqual(len(received), 1)
+        self.dispatcher(1, u'chan', u'b')
+        self.assertEqual([n.payload for n in received], [u'a', u'b'])
+        with self.assertRaises(ValueError):
+            sub.request(received.append)
+            sub.request(received.append)
+        sub.close()
+        self.assertEqual(received[-1], None)
+
+    def fill(self, policy):
+        sub = self.dispatcher.subscribe(u'chan', maxsize=2, policy=policy)
+        for payload in u'abc':
+            self.dispatcher(1, u'chan', payload)
+        return sub
+
+    def test_drop_oldest(self):
+        sub = self.fill(notify.DROP_OLDEST)
+        self.assertEqual([n.payload for n in sub.queue], [u'b', u'c'])
+        self.assertEqual(sub.dropped, 1)
+        self.assertEqual(sub.received, 3)
+
+    def test_drop_newest(self):
+        sub = self.fill(notify.DROP_NEWEST)
+        self.assertEqual([n.payload for n in sub.queue], [u'a', u'b'])
+        self.assertEqual(self.dispatcher.stats()['dropped'], 1)
+
+    def test_reset(self):
+        sub = self.fill(notify.RESET)
+        self.assertEqual(list(sub.queue), [notify.OVERFLOW])
+        self.assertEqual(sub.dropped, 3)
+        for payload in u'de':
+            self.dispatcher(1, u'chan', payload)
+        self.assertEqual(list(sub.queue), [notify.OVERFLOW])
+        self.assertEqual(sub.dropped, 5)
+
+    def test_bad_policy(self):
+        with self.assertRaises(ValueError):
+            self.dispatcher.subscribe(u'chan', policy=u'never')
+        with self.assertRaises(ValueError):
+            self.dispatcher.subscribe(u'chan', maxsize=0)
+
+    def test_quote_ident(self):
+        self.assertEqual(notify.quote_ident(u'a"b'), u'"a""b"')
+
+    def test_interleaved(self):
+        conn = connection.Connection(u'alice')
+        conn.connection_made(FakeTransport())
+        conn.data_received(STARTED)
+        self.dispatcher.attach(conn)
+        received = []
+        self.dispatcher.subscribe(u'chan', callback=received.append)
+
+        pipe = conn.pipeline()
+        result = pipe.execute(u'SELECT 1')
+        conn.send(pipe)
+        key = (constants.INT4OID,)
+        conn.data_received(PARSE_COMPLETE + row_description(*key) +
+                           notification(3, b'chan', b'first') +
+                           BIND_COMPLETE + data_row(key, (1,)))
+        self.assertEqual(received, [notify.Notification(3, u'chan',
+                                                        u'first')])
+        conn.data_received(command_complete(b'SELECT 1') + READY)
+        self.assertEqual(result.rows, [(1,)])
+
+        self.dispatcher.detach(conn)
+        conn.data_received(notification(3, b'chan', b'second'))
+        self.assertEqual(len(received), 1)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_numeric
+----------------------------------
+
+Tests for `numeric` module.
+"""
+
+from __future__ import division, absolute_import
+
+import random
+import struct
+from decimal import Decimal
+
+from twisted.trial import unittest
+
+from thrum import constants
+from thrum import numeric
+from thrum import rows
+
+
+def wire(ndigits, weight, sign, dscale, *digits):
+    return struct.pack('!hhHh' + 'h' * len(digits),
+                       ndigits, weight, sign, dscale, *digits)
+
+
+class NumericTests(unittest.TestCase):
+
+    # Encodings as sent by Postgres
+    samples = ((Decimal('0'), wire(0, 0, constants.NUMERIC_POS, 0)),
+               (Decimal('0.00'), wire(0, 0, constants.NUMERIC_POS, 2)),
+               (Decimal('1.50'),
+                wire(2, 0, constants.NUMERIC_POS, 2, 1, 5000)),
+               (Decimal('12345.678'),
+                wire(3, 1, constants.NUMERIC_POS, 3, 1, 2345, 6780)),
+               (Decimal('-0.0001'), wire(1, -1, constants.NUMERIC_NEG, 4, 1)),
+               (Decimal('100000000'), wire(1, 2, constants.NUMERIC_POS, 0, 1)),
+               (Decimal('-99999999.99999999'),
+                wire(4, 1, constants.NUMERIC_NEG, 8, 9999, 9999, 9999, 9999)))
+
+    def test_numeric_send(self):
+        for value, data in self.samples:
+            self.assertEqual(numeric.numeric_send(value), data)
+
+    def test_numeric_recv(self):
+        for value, data in self.samples:
+            result = numeric.numeric_recv(data)
+            self.assertEqual(result, value)
+            self.assertEqual(str(result), str(value))
+
+    def test_offset(self):
+        data = numeric.numeric_send(Decimal('3.14'))
+        self.assertEqual(numeric.numeric_recv(b'xyz' + data, 3, len(data)),
+                         Decimal('3.14'))
+
+    def test_special(self):
+        self.assertTrue(numeric.numeric_recv(
+            numeric.numeric_send(Decimal('NaN'))).is_nan())
+        self.assertEqual(numeric.numeric_send(Decimal('NaN')),
+                         wire(0, 0, constants.NUMERIC_NAN, 0))
+        for value in (Decimal('Infinity'), Decimal('-Infinity')):
+            self.assertEqual(
+                numeric.numeric_recv(numeric.numeric_send(value)), value)
+        with self.assertRaises(ValueError):
+            numeric.numeric_recv(wire(0, 0, 0x1234, 0))
+
+    def test_int_and_float(self):
+        self.assertEqual(numeric.numeric_send(-12345),
+                         numeric.numeric_send(Decimal('-12345')))
+        self.assertEqual(numeric.numeric_send(0.1),
+                         numeric.numeric_send(Decimal('0.1')))
+        big = 10 ** 100 + 1
+        self.assertEqual(numeric.numeric_recv(numeric.numeric_send(big)), big)
+
+    def test_exponents(self):
+        for text in ('1E+5', '1.23E-10', '5E+3', '123E-2'):
+            value = Decimal(text)
+            result = numeric.numeric_recv(numeric.numeric_send(value))
+            self.assertEqual(result, value)
+
+    def test_round_trip(self):
+        rand = random.Random(1700)
+        for _ in range(2000):
+            digits = ''.join(rand.choice('0123456789')
+                             for _ in range(rand.randint(1, 40)))
+            point = rand.randint(1, len(digits))
+            text = rand.choice(('', '-')) + digits[:point]
+            if point < len(digits):
+                text += '.' + digits[point:]
+            value = Decimal(text)
+            if not value:
+                value = abs(value)
+            result = numeric.numeric_recv(numeric.numeric_send(value))
+            self.assertEqual(str(result), str(value))
+
+    def test_registered(self):
+        encode_row = rows.get_row_encoder((constants.NUMERICOID,))
+        decode_row = rows.get_row_decoder(
+            ((constants.NUMERICOID, constants.FC_BINARY),))
+        self.assertEqual(decode_row(encode_row((Decimal('-1.25'),))),
+                         (Decimal('-1.25'),))
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_pgcopy
+----------------------------------
+
+Tests for `pgcopy` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial import unittest
+
+from thrum import binary
+from thrum import constants
+from thrum import errors
+from thrum import pgcopy
+from thrum import rows
+
+TYPES = (constants.INT4OID, constants.TEXTOID, constants.FLOAT8OID)
+
+
+class CopyInTests(unittest.TestCase):
+
+    def test_single_chunk(self):
+        data = b''.join(pgcopy.copy_in_chunks([(1, u'one', 1.5)], TYPES))
+        self.assertEqual(
+            data,
+            b'PGCOPY\n\xff\r\n\x00'
+            b'\x00\x00\x00\x00\x00\x00\x00\x00'
+            b'\x00\x03'
+            b'\x00\x00\x00\x04\x00\x00\x00\x01'
+            b'\x00\x00\x00\x03one'
+            b'\x00\x00\x00\x08?\xf8\x00\x00\x00\x00\x00\x00'
+            b'\xff\xff')
+
+    def test_nulls(self):
+        data = b''.join(pgcopy.copy_in_chunks([(None, None, None)], TYPES))
+        self.assertEqual(data[19:-2], binary.h_pack(3) + constants.NULL * 3)
+
+    def test_no_rows(self):
+        data = b''.join(pgcopy.copy_in_chunks([], TYPES))
+        self.assertEqual(data, pgcopy.HEADER + pgcopy.TRAILER)
+
+    def test_chunking(self):
+        source = [(index, u'row %d' % (index,), index / 2.0)
+                  for index in range(1000)]
+        chunks = list(pgcopy.copy_in_chunks(iter(source), TYPES,
+                                            chunk_size=1024))
+        self.assertTrue(len(chunks) > 10)
+        for chunk in chunks[:-1]:
+            self.assertTrue(1024 <= len(chunk) < 1024 + 64)
+
+        data = b''.join(chunks)
+        self.assertTrue(data.startswith(pgcopy.HEADER))
+        self.assertTrue(data.endswith(pgcopy.TRAILER))
+
+        decode_row = rows.get_row_decoder(
+            tuple((type_oid, constants.FC_BINARY) for type_oid in TYPES))
+        pos = len(pgcopy.HEADER)
+        decoded = []
+        while True:
+            count = binary.h_unpack(data, pos)[0]
+            if count == -1:
+                break
+            start = pos
+            pos += 2
+            for _ in range(count):
+                pos += 4 + max(binary.i_unpack(data, pos)[0], 0)
+            decoded.append(decode_row(data[start:pos]))
+        self.assertEqual(pos + 2, len(data))
+        self.assertEqual(decoded, [(index, text.encode('utf-8'), half)
+                                   for index, text, half in source])
+
+    def test_messages(self):
+        messages = list(pgcopy.copy_in_messages(
+            [(1, b'x', 0.0)] * 100, TYPES, chunk_size=256))
+        self.assertEqual(messages[-1], constants.COPY_DONE_MSG)
+        payloads = []
+        for message in messages[:-1]:
+            code, length = binary.ci_unpack(message)
+            self.assertEqual(code, constants.COPY_DATA)
+            self.assertEqual(length, len(message) - 1)
+            payloads.append(message[5:])
+        self.assertEqual(b''.join(payloads),
+                         b''.join(pgcopy.copy_in_chunks(
+                             [(1, b'x', 0.0)] * 100, TYPES)))
+
+
+class CopyOutDecoderTests(unittest.TestCase):
+
+    def stream(self, source, type_oids):
+        return b''.join(pgcopy.copy_in_chunks(source, type_oids))
+
+    def test_fixed_width(self):
+        type_oids = (constants.INT2OID, constants.INT4OID, constants.INT8OID,
+                     constants.FLOAT4OID, constants.FLOAT8OID,
+                     constants.BOOLOID)
+        source = [(index, -index, index * 2 ** 33, index / 2.0, index / 4.0,
+                   bool(index % 2)) for index in range(500)]
+        decoder = pgcopy.CopyOutDecoder(type_oids)
+        decoder.feed(memoryview(self.stream(source, type_oids)))
+        self.assertTrue(decoder.done)
+        self.assertEqual(decoder.row_count, 500)
+
+        columns = decoder.columns()
+        self.assertEqual([getattr(column, 'typecode', None)
+                          for column in columns],
+                         ['h', 'i', binary.array_typecode('q', 8), 'f', 'd',
+                          'B'])
+        for index, column in enumerate(columns):
+            self.assertEqual(list(column), [row[index] for row in source])
+        self.assertEqual(decoder.nulls, [[]] * 6)
+
+    def test_nulls(self):
+        type_oids = (constants.INT4OID, constants.FLOAT8OID)
+        source = [(index, None if index % 7 == 3 else index / 8.0)
+                  for index in range(200)]
+        source[0] = (None, None)
+        decoder = pgcopy.CopyOutDecoder(type_oids)
+        decoder.feed(self.stream(source, type_oids))
+        ints, floats = decoder.columns()
+        self.assertEqual(decoder.nulls[0], [0])
+        self.assertEqual(decoder.nulls[1],
+                         [0] + [index for index in range(200)
+                                if index % 7 == 3])
+        self.assertEqual(list(ints), [0] + list(range(1, 200)))
+        self.assertEqual(list(floats),
+                         [value or 0.0 for index, value in source])
+
+    def test_variable_width(self):
+        type_oids = (constants.INT8OID, constants.TEXTOID,
+                     constants.INT4ARRAYOID)
+        source = [(1, u'one', [1]), (2, None, None), (None, u'three', [])]
+        decoder = pgcopy.CopyOutDecoder(type_oids)
+        decoder.feed(self.stream(source, type_oids))
+        ids, names, arrays = decoder.columns()
+        null = 0 if binary.array_typecode('q', 8) else None
+        self.assertEqual(list(ids), [1, 2, null])
+        self.assertEqual(decoder.nulls, [[2], [1], [1]])
+        self.assertEqual(names, [b'one', None, b'three'])
+        self.assertEqual([None if value is None else list(value)
+                          for value in arrays], [[1], None, []])
+
+    def test_split_messages(self):
+        for type_oids, source in (
+                ((constants.INT4OID, constants.INT8OID),
+                 [(index, None if index % 5 else index)
+                  for index in range(100)]),
+                ((constants.INT4OID, constants.TEXTOID),
+                 [(index, u'x' * index) for index in range(100)])):
+            data = self.stream(source, type_oids)
+            for size in (1, 7, 64):
+                decoder = pgcopy.CopyOutDecoder(type_oids)
+                for index in range(0, len(data), size):
+                    self.assertFalse(decoder.done)
+                    decoder.feed(data[index:index + size])
+                self.assertTrue(decoder.done)
+                self.assertEqual(decoder.row_count, 100)
+                self.assertEqual(list(decoder.columns()[0]), list(range(100)))
+
+    def test_large_field(self):
+        # Without a single growing buffer each message would copy what had
+        # arrived of the field so far, and this would take minutes
+        field = bytes(bytearray(range(256))) * (4 << 12)
+        type_oids = (constants.INT4OID, constants.BYTEAOID, constants.INT4OID)
+        data = self.stream([(1, field, 2)], type_oids)
+        decoder = pgcopy.CopyOutDecoder(type_oids)
+        view = memoryview(data)
+        for index in range(0, len(data), 1024):
+            decoder.feed(view[index:index + 1024])
+            self.assertTrue(len(decoder._buffer) <= len(field) + 1024)
+        self.assertTrue(decoder.done)
+        ids, values, others = decoder.columns()
+        self.assertEqual(values, [field])
+        self.assertEqual(list(others), [2])
+        self.assertEqual(len(decoder._buffer), 0)
+
+    def test_header_extension(self):
+        data = (pgcopy.SIGNATURE + binary.ii_pack(0, 3) + b'ext' +
+                binary.h_pack(1) + binary.i_pack(4) + binary.i_pack(9) +
+                pgcopy.TRAILER)
+        decoder = pgcopy.CopyOutDecoder((constants.INT4OID,))
+        decoder.feed(data)
+        self.assertEqual(list(decoder.columns()[0]), [9])
+
+    def test_errors(self):
+        decoder = pgcopy.CopyOutDecoder((constants.INT4OID,))
+        with self.assertRaises(errors.ThrumError):
+            decoder.feed(b'1\t2\n' * 10)
+
+        decoder = pgcopy.CopyOutDecoder((constants.INT4OID,))
+        with self.assertRaises(errors.ThrumError):
+            decoder.feed(self.stream([(1, 2)], (constants.INT4OID,) * 2))
+
+        decoder = pgcopy.CopyOutDecoder((constants.INT4OID,))
+        decoder.feed(self.stream([], (constants.INT4OID,)))
+        with self.assertRaises(errors.ThrumError):
+            decoder.feed(pgcopy.TRAILER)
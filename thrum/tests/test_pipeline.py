@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_pipeline
+----------------------------------
+
+Tests for `pipeline` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial import unittest
+
+from thrum import constants
+from thrum import errors
+from thrum import pipeline
+from thrum.tests.helpers import (
+    BIND_COMPLETE, NO_DATA, PARSE_COMPLETE, READY, codes, command_complete,
+    data_row, error_response, respond, row_description)
+
+
+class PipelineTests(unittest.TestCase):
+
+    def test_one_parse(self):
+        pipe = pipeline.Pipeline()
+        results = pipe.executemany(u'INSERT INTO t VALUES ($1)',
+                                   [(1,), (2,), (3,)], (constants.INT4OID,))
+        pipe.execute(u'SELECT 1')
+        self.assertEqual(len(pipe), 4)
+        self.assertEqual(codes(pipe.build()), b'PBDEBEBEPBDES')
+        with self.assertRaises(errors.ThrumError):
+            pipe.execute(u'SELECT 2')
+
+        respond(pipe, PARSE_COMPLETE,
+                BIND_COMPLETE, NO_DATA, command_complete(b'INSERT 0 1'),
+                BIND_COMPLETE, command_complete(b'INSERT 0 1'),
+                BIND_COMPLETE, command_complete(b'INSERT 0 1'))
+        self.assertFalse(pipe.done)
+        self.assertEqual([result.command_tag for result in results],
+                         [b'INSERT 0 1'] * 3)
+        self.assertEqual(results[0].columns, None)
+
+    def test_rows(self):
+        pipe = pipeline.Pipeline()
+        key = (constants.INT4OID, constants.INT8OID)
+        first = pipe.execute(u'SELECT $1, 2::int8', (1,), (constants.INT4OID,))
+        second = pipe.execute(u'SELECT $1, 2::int8', (5,),
+                              (constants.INT4OID,))
+        done = []
+        pipe.callbacks.append(done.append)
+        pipe.build()
+        respond(pipe, PARSE_COMPLETE, BIND_COMPLETE, row_description(*key),
+                data_row(key, (1, 2)), command_complete(b'SELECT 1'),
+                BIND_COMPLETE, data_row(key, (5, 2)),
+                data_row(key, (6, 2)), command_complete(b'SELECT 2'), READY)
+        self.assertTrue(pipe.done)
+        self.assertEqual(done, [pipe])
+        self.assertEqual(pipe.transaction_status, constants.IDLE)
+        self.assertEqual(first.rows, [(1, 2)])
+        self.assertEqual(second.rows, [(5, 2), (6, 2)])
+        self.assertEqual([column.type_oid for column in second.columns],
+                         list(key))
+        self.assertTrue(first.done and second.done)
+
+    def test_error(self):
+        pipe = pipeline.Pipeline()
+        first = pipe.execute(u'SELECT 1')
+        second = pipe.execute(u'SELECT 1/0')
+        third = pipe.execute(u'SELECT 3')
+        pipe.build()
+        respond(pipe, PARSE_COMPLETE, BIND_COMPLETE, NO_DATA,
+                command_complete(b'SELECT 0'), PARSE_COMPLETE, BIND_COMPLETE,
+                NO_DATA, error_response(b'22012', b'division by zero'), READY)
+        self.assertTrue(pipe.done)
+        self.assertIs(first.error, None)
+        self.assertIsInstance(second.error, errors.PostgresError)
+        self.assertEqual(second.error.sqlstate_code, u'22012')
+        self.assertIs(pipe.error, second.error)
+        self.assertIsInstance(third.error, errors.PipelineAborted)
+        self.assertFalse(third.done)
+        with self.assertRaises(errors.PostgresError):
+            second.raise_error()
+
+    def test_params_mismatch(self):
+        pipe = pipeline.Pipeline()
+        with self.assertRaises(errors.ThrumError):
+            pipe.execute(u'SELECT $1', (1, 2), (constants.INT4OID,))
+
+    def test_unexpected(self):
+        pipe = pipeline.Pipeline()
+        pipe.execute(u'SELECT 1')
+        pipe.build()
+        with self.assertRaises(errors.ThrumError):
+            respond(pipe, BIND_COMPLETE)
+
+
+class ParseFieldsTests(unittest.TestCase):
+
+    def test_parse_fields(self):
+        fields = errors.parse_fields(
+            memoryview(b'SERROR\x00C23505\x00Mduplicate key\x00\x00'))
+        self.assertEqual(fields, {'S': u'ERROR', 'C': u'23505',
+                                  'M': u'duplicate key'})
+        self.assertEqual(errors.parse_fields(b'\x00'), {})
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_pool
+----------------------------------
+
+Tests for `pool` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.internet import defer
+from twisted.internet import task
+from twisted.trial import unittest
+
+from thrum import constants
+from thrum import errors
+from thrum import pool
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.connected = True
+        self.pending = 0
+        self.transaction_status = constants.IDLE
+        self.closed = defer.Deferred()
+        self.executed = []
+        self.rollback_fails = False
+
+    @property
+    def idle(self):
+        return (self.connected and not self.pending and
+                self.transaction_status == constants.IDLE)
+
+    def execute(self, sql):
+        self.executed.append(sql)
+        if self.rollback_fails:
+            return defer.fail(errors.ThrumError("nope"))
+        self.transaction_status = constants.IDLE
+        return defer.succeed(None)
+
+    def close(self):
+        if self.connected:
+            self.connected = False
+            self.closed.callback(self)
+        return self.closed
+
+
+class ConnectionPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.made = []
+        self.connecting = []
+
+    def connect(self):
+        d = defer.Deferred()
+        self.connecting.append(d)
+        return d
+
+    def finish_connecting(self):
+        while self.connecting:
+            conn = FakeConnection()
+            self.made.append(conn)
+            self.connecting.pop(0).callback(conn)
+
+    def make_pool(self, **kwargs):
+        p = pool.ConnectionPool(self.connect, reactor=self.clock, **kwargs)
+        d = p.start()
+        self.finish_connecting()
+        self.successResultOf(d)
+        self.addCleanup(p.close)
+        return p
+
+    def test_start(self):
+        p = self.make_pool(min_size=2, max_size=4)
+        self.assertEqual(p.stats(), {'size': 2, 'idle': 2, 'busy': 0,
+                                     'connecting': 0, 'waiters': 0})
+
+    def test_acquire_release(self):
+        p = self.make_pool(min_size=1)
+        conn = self.successResultOf(p.acquire())
+        self.assertEqual(p.stats()['busy'], 1)
+        p.release(conn)
+        self.assertIs(self.successResultOf(p.acquire()), conn)
+
+    def test_grow_and_wait(self):
+        p = self.make_pool(min_size=1, max_size=2)
+        first = self.successResultOf(p.acquire())
+        d2 = p.acquire()
+        self.assertEqual(len(self.connecting), 1)
+        d3 = p.acquire()
+        # At max_size, so d3 waits rather than opening another
+        self.assertEqual(len(self.connecting), 1)
+        self.finish_connecting()
+        second = self.successResultOf(d2)
+        self.assertNoResult(d3)
+        d4 = p.acquire()
+        p.release(first)
+        self.assertIs(self.successResultOf(d3), first)
+        p.release(second)
+        self.assertIs(self.successResultOf(d4), second)
+
+    def test_rollback(self):
+        p = self.make_pool(min_size=1, max_size=1)
+        conn = self.successResultOf(p.acquire())
+        conn.transaction_status = constants.IDLE_IN_TRANSACTION
+        p.release(conn)
+        self.assertEqual(conn.executed, [u'ROLLBACK'])
+        self.assertIs(self.successResultOf(p.acquire()), conn)
+
+    def test_failed_rollback(self):
+        p = self.make_pool(min_size=1, max_size=1)
+        conn = self.successResultOf(p.acquire())
+        conn.transaction_status = constants.IDLE_IN_FAILED_TRANSACTION
+        conn.rollback_fails = True
+        p.release(conn)
+        self.assertFalse(conn.connected)
+        d = p.acquire()
+        self.finish_connecting()
+        self.assertIsNot(self.successResultOf(d), conn)
+
+    def test_never_hand_out_busy(self):
+        p = self.make_pool(min_size=1, max_size=2)
+        conn = self.successResultOf(p.acquire())
+        conn.pending = 1
+        p.release(conn)
+        self.assertFalse(conn.connected)
+        self.assertEqual(len(p), 0)
+
+    def test_lost_while_idle(self):
+        p = self.make_pool(min_size=1)
+        self.made[0].close()
+        self.assertEqual(len(p), 0)
+        d = p.acquire()
+        self.finish_connecting()
+        self.assertIs(self.successResultOf(d), self.made[1])
+
+    def test_reap(self):
+        p = self.make_pool(min_size=1, max_size=3, idle_timeout=60,
+                           reap_interval=10)
+        conns = [p.acquire() for _ in range(3)]
+        self.finish_connecting()
+        for d in conns:
+            p.release(self.successResultOf(d))
+        self.assertEqual(len(p), 3)
+        self.clock.advance(50)
+        self.assertEqual(len(p), 3)
+        self.clock.advance(20)
+        self.assertEqual(len(p), 1)
+
+    def test_run(self):
+        p = self.make_pool(min_size=1)
+        d = p.run(lambda conn, value: value * 2, 21)
+        self.assertEqual(self.successResultOf(d), 42)
+        self.assertEqual(p.stats()['idle'], 1)
+
+    def test_cancel_waiter(self):
+        p = self.make_pool(min_size=1, max_size=1)
+        self.successResultOf(p.acquire())
+        d = p.acquire()
+        d.cancel()
+        self.failureResultOf(d, defer.CancelledError)
+        self.assertEqual(p.stats()['waiters'], 0)
+
+    def test_connect_failure(self):
+        p = self.make_pool(min_size=0, max_size=1)
+        d = p.acquire()
+        self.connecting.pop().errback(errors.ThrumError("refused"))
+        self.failureResultOf(d, errors.ThrumError)
+
+    def test_close(self):
+        p = self.make_pool(min_size=1, max_size=1)
+        conn = self.successResultOf(p.acquire())
+        d = p.acquire()
+        p.close()
+        self.failureResultOf(d, errors.ThrumError)
+        self.assertFalse(conn.connected)
+        self.failureResultOf(p.acquire(), errors.ThrumError)
+
+    def test_bad_sizes(self):
+        with self.assertRaises(ValueError):
+            pool.ConnectionPool(self.connect, min_size=3, max_size=2,
+                                reactor=self.clock)
@@ -63,3 +63,44 @@ class BytesBuilderTests(unittest.TestCase):
         for i in range(3):
             l.append(i)
         self.assertEqual(len(l), 23)
+
+
+class ByteArrayBuilderTests(unittest.TestCase):
+    def test_empty(self):
+        bb = pypy.ByteArrayBuilder()
+        self.assertEqual(len(bb), 0)
+        self.assertEqual(bb.build(), b"")
+        bb.append(b"x" * 32)
+        self.assertEqual(len(bb), 32)
+        self.assertEqual(bb.build(), b"x" * 32)
+
+    def test_grow(self):
+        bb = pypy.ByteArrayBuilder()
+        for i in range(1000):
+            bb.append(b"abc")
+        self.assertEqual(len(bb), 3000)
+        self.assertEqual(bb.build(), b"abc" * 1000)
+
+    def test_append_slice(self):
+        bb = pypy.ByteArrayBuilder()
+        bb.append_slice(bytearray(b"0123456789"), 2, 5)
+        bb.append_slice(memoryview(b"0123456789"), 7, 10)
+        self.assertEqual(bb.build(), b"234789")
+
+    def test_write_at(self):
+        bb = pypy.ByteArrayBuilder()
+        bb.append(b"C\x00\x00\x00\x00")
+        bb.append(b"payload")
+        bb.write_at(1, b"\x00\x00\x00\x0b")
+        self.assertEqual(bb.build(), b"C\x00\x00\x00\x0bpayload")
+        with self.assertRaises(IndexError):
+            bb.write_at(11, b"xx")
+        with self.assertRaises(IndexError):
+            bb.write_at(-1, b"x")
+
+    def test_build_again(self):
+        bb = pypy.ByteArrayBuilder()
+        bb.append(b"one")
+        self.assertEqual(bb.build(), b"one")
+        bb.append(b" two")
+        self.assertEqual(bb.build(), b"one two")
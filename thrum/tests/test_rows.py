@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_rows
+----------------------------------
+
+Tests for `rows` module.
+"""
+
+from __future__ import division, absolute_import
+
+import struct
+
+from twisted.trial import unittest
+
+from thrum import binary
+from thrum import constants
+from thrum import rows
+from thrum import textcodec
+
+BINARY = constants.FC_BINARY
+TEXT = constants.FC_TEXT
+
+
+def field(fmt, value):
+    data = struct.pack('!' + fmt, value)
+    return binary.i_pack(len(data)) + data
+
+
+def data_row(*fields):
+    return binary.h_pack(len(fields)) + b''.join(fields)
+
+
+class RowDescriptionTests(unittest.TestCase):
+
+    def test_parse_row_description(self):
+        payload = (binary.h_pack(2) +
+                   b'id\x00' + binary.ihihih_pack(16384, 1, 23, 4, -1, 1) +
+                   b'name\x00' + binary.ihihih_pack(16384, 2, 25, -1, -1, 0))
+
+        columns = rows.parse_row_description(memoryview(payload))
+        self.assertEqual(len(columns), 2)
+        self.assertEqual(columns[0].name, b'id')
+        self.assertEqual(columns[0].type_oid, constants.INT4OID)
+        self.assertEqual(columns[0].format_code, BINARY)
+        self.assertEqual(columns[1],
+                         rows.Column(b'name', 16384, 2, 25, -1, -1, 0))
+        self.assertEqual(rows.row_key(columns),
+                         ((constants.INT4OID, BINARY),
+                          (constants.TEXTOID, TEXT)))
+
+
+class RowDecoderTests(unittest.TestCase):
+
+    def test_fixed_width(self):
+        key = ((constants.INT2OID, BINARY),
+               (constants.INT4OID, BINARY),
+               (constants.INT8OID, BINARY),
+               (constants.FLOAT4OID, BINARY),
+               (constants.FLOAT8OID, BINARY),
+               (constants.BOOLOID, BINARY),
+               (constants.OIDOID, BINARY))
+        decode_row = rows.get_row_decoder(key)
+        payload = data_row(field('h', -2), field('i', 4), field('q', 2 ** 40),
+                           field('f', 1.5), field('d', -0.25),
+                           field('?', True), field('I', 2 ** 32 - 1))
+        expected = (-2, 4, 2 ** 40, 1.5, -0.25, True, 2 ** 32 - 1)
+        self.assertEqual(decode_row(payload), expected)
+        self.assertEqual(decode_row(memoryview(payload)), expected)
+
+    def test_fixed_width_nulls(self):
+        key = ((constants.INT4OID, BINARY), (constants.INT8OID, BINARY))
+        decode_row = rows.get_row_decoder(key)
+        self.assertEqual(decode_row(data_row(constants.NULL, field('q', 8))),
+                         (None, 8))
+        self.assertEqual(decode_row(data_row(field('i', 4), constants.NULL)),
+                         (4, None))
+        self.assertEqual(decode_row(data_row(constants.NULL, constants.NULL)),
+                         (None, None))
+
+    def test_mixed(self):
+        key = ((constants.INT4OID, BINARY),
+               (constants.TEXTOID, TEXT),
+               (constants.INT4OID, TEXT),
+               (constants.BYTEAOID, BINARY),
+               (constants.INT8ARRAYOID, BINARY))
+        decode_row = rows.get_row_decoder(key)
+        array_data = binary.array_pack([1, 2, 3], constants.INT8OID)
+        payload = data_row(field('i', 7),
+                           binary.i_pack(5) + b'hello',
+                           binary.i_pack(2) + b'42',
+                           constants.NULL,
+                           binary.i_pack(len(array_data)) + array_data)
+        row = decode_row(memoryview(payload))
+        self.assertEqual(row[:4], (7, b'hello', b'42', None))
+        self.assertEqual(list(row[4]), [1, 2, 3])
+        self.assertIsInstance(row[1], bytes)
+
+    def test_single_column(self):
+        decode_row = rows.get_row_decoder(((constants.TEXTOID, TEXT),))
+        self.assertEqual(decode_row(data_row(binary.i_pack(1) + b'x')),
+                         (b'x',))
+
+    def test_no_columns(self):
+        decode_row = rows.get_row_decoder(())
+        self.assertEqual(decode_row(data_row()), ())
+
+    def test_cached(self):
+        key = ((constants.INT2OID, BINARY), (constants.INT2OID, TEXT))
+        decode_row = rows.get_row_decoder(key)
+        self.assertIs(rows.get_row_decoder(key), decode_row)
+
+    def test_register_binary_decoder(self):
+        key = ((constants.TEXTOID, BINARY),)
+        self.assertEqual(
+            rows.get_row_decoder(key)(data_row(binary.i_pack(2) + b'ab')),
+            (b'ab',))
+
+        def decode_text(data, offset, length):
+            return bytes(data[offset:offset + length]).decode('utf-8')
+
+        self.patch(rows, 'binary_decoders', dict(rows.binary_decoders))
+        self.addCleanup(rows.decoders.clear)
+        rows.register_binary_decoder(constants.TEXTOID, decode_text)
+        self.assertEqual(
+            rows.get_row_decoder(key)(data_row(binary.i_pack(2) + b'ab')),
+            (u'ab',))
+
+
+class RowEncoderTests(unittest.TestCase):
+
+    def test_fixed_width(self):
+        key = (constants.INT2OID, constants.INT4OID, constants.INT8OID,
+               constants.FLOAT8OID, constants.BOOLOID)
+        encode_row = rows.get_row_encoder(key)
+        self.assertEqual(encode_row((-2, 4, 8, 0.5, False)),
+                         data_row(field('h', -2), field('i', 4), field('q', 8),
+                                  field('d', 0.5), field('?', False)))
+        self.assertEqual(encode_row((None, 4, None, 0.5, None)),
+                         data_row(constants.NULL, field('i', 4),
+                                  constants.NULL, field('d', 0.5),
+                                  constants.NULL))
+
+    def test_variable_width(self):
+        key = (constants.TEXTOID, constants.BYTEAOID, constants.INT4ARRAYOID)
+        encode_row = rows.get_row_encoder(key)
+        array_data = binary.array_pack([1, None], constants.INT4OID)
+        self.assertEqual(encode_row((u'caf\xe9', b'\x00\x01', [1, None])),
+                         data_row(binary.i_pack(5) + b'caf\xc3\xa9',
+                                  binary.i_pack(2) + b'\x00\x01',
+                                  binary.i_pack(len(array_data)) + array_data))
+        self.assertEqual(encode_row((None, None, None)),
+                         data_row(constants.NULL, constants.NULL,
+                                  constants.NULL))
+
+    def test_round_trip(self):
+        key = (constants.INT8OID, constants.TEXTOID, constants.FLOAT4OID)
+        encode_row = rows.get_row_encoder(key)
+        decode_row = rows.get_row_decoder(
+            tuple((type_oid, BINARY) for type_oid in key))
+        for row in ((1, b'one', 1.5), (None, b'', -2.0), (3, None, None)):
+            self.assertEqual(decode_row(encode_row(row)), row)
+
+    def test_single_column(self):
+        self.assertEqual(
+            rows.get_row_encoder((constants.INT4OID,))((5,)),
+            data_row(field('i', 5)))
+        self.assertEqual(rows.get_row_encoder(())(()), data_row())
+
+    def test_cached(self):
+        key = (constants.INT2OID, constants.TEXTOID)
+        self.assertIs(rows.get_row_encoder(key), rows.get_row_encoder(key))
+
+    def test_codec(self):
+        key = (constants.TEXTOID, constants.VARCHAROID)
+        utf8 = textcodec.get_codec(u'UTF8')
+        latin1 = textcodec.get_codec(u'LATIN1')
+        self.assertIs(rows.get_row_encoder(key, utf8),
+                      rows.get_row_encoder(key))
+        encode_row = rows.get_row_encoder(key, latin1)
+        self.assertIs(rows.get_row_encoder(key, latin1), encode_row)
+        self.assertEqual(encode_row((u'caf\xe9', b'caf\xc3\xa9')),
+                         data_row(binary.i_pack(4) + b'caf\xe9',
+                                  binary.i_pack(5) + b'caf\xc3\xa9'))
+        with self.assertRaises(UnicodeEncodeError):
+            encode_row((u'\u65e5', None))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_statements
+----------------------------------
+
+Tests for `statements` module.
+"""
+
+from __future__ import division, absolute_import
+
+import struct
+
+from twisted.trial import unittest
+
+from thrum import constants
+from thrum import pipeline
+from thrum import statements
+from thrum.tests.helpers import (
+    BIND_COMPLETE, CLOSE_COMPLETE, NO_DATA, PARSE_COMPLETE, READY, codes,
+    command_complete, data_row, error_response, message, respond,
+    row_description, sent)
+
+INT4 = (constants.INT4OID,)
+
+
+def parameter_description(*type_oids):
+    return message(constants.PARAMETER_DESCRIPTION,
+                   struct.pack('!h%dI' % len(type_oids), len(type_oids),
+                               *type_oids))
+
+
+class StatementCacheTests(unittest.TestCase):
+
+    def test_add(self):
+        cache = statements.StatementCache(maxsize=2)
+        self.assertIs(cache.get(u'SELECT 1', ()), None)
+        first = cache.add(u'SELECT 1', ())
+        second = cache.add(u'SELECT 2', ())
+        self.assertNotEqual(first.name, second.name)
+        self.assertIs(cache.get(u'SELECT 1', ()), first)
+        self.assertEqual(cache.hit_rate, 0.5)
+
+        cache.add(u'SELECT 3', ())
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn((u'SELECT 2', ()), cache)
+        self.assertEqual(cache.take_closing(), [second.name])
+        self.assertEqual(cache.take_closing(), [])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_discard(self):
+        cache = statements.StatementCache()
+        statement = cache.add(u'SELECT 1', ())
+        cache.discard(statement)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.take_closing(), [])
+
+
+class CachedPipelineTests(unittest.TestCase):
+
+    def run_select(self, cache, *responses):
+        pipe = pipeline.Pipeline(statements=cache)
+        result = pipe.execute(u'SELECT $1', (7,), INT4)
+        data = pipe.build()
+        respond(pipe, *responses)
+        self.assertTrue(pipe.done)
+        return data, result
+
+    def test_reuse(self):
+        cache = statements.StatementCache()
+        data, result = self.run_select(
+            cache, PARSE_COMPLETE, parameter_description(*INT4),
+            row_description(*INT4), BIND_COMPLETE, data_row(INT4, (7,)),
+            command_complete(b'SELECT 1'), READY)
+        self.assertEqual(codes(data), b'PDBES')
+        self.assertEqual(result.rows, [(7,)])
+        statement = cache.get(u'SELECT $1', INT4)
+        self.assertEqual(statement.param_oids, INT4)
+        self.assertEqual(statement.columns[0].format_code,
+                         constants.FC_BINARY)
+
+        # The second time there's no Parse or Describe
+        data, result = self.run_select(
+            cache, BIND_COMPLETE, data_row(INT4, (7,)),
+            command_complete(b'SELECT 1'), READY)
+        self.assertEqual(codes(data), b'BES')
+        self.assertEqual(sent(data)[0][1][:len(statement.name) + 2],
+                         b'\x00' + statement.name + b'\x00')
+        self.assertEqual(result.rows, [(7,)])
+
+    def test_evict(self):
+        cache = statements.StatementCache(maxsize=1)
+        pipe = pipeline.Pipeline(statements=cache)
+        pipe.execute(u'SELECT 1')
+        first = cache.get(u'SELECT 1', ())
+        pipe.execute(u'SELECT 2')
+        data = pipe.build()
+        self.assertEqual(codes(data), b'PDBEPDCBES')
+        self.assertEqual(sent(data)[6],
+                         (constants.CLOSE, b'S' + first.name + b'\x00'))
+        respond(pipe, PARSE_COMPLETE, NO_DATA, BIND_COMPLETE,
+                command_complete(b'SELECT 0'), PARSE_COMPLETE, NO_DATA,
+                CLOSE_COMPLETE, BIND_COMPLETE, command_complete(b'SELECT 0'),
+                READY)
+        self.assertTrue(pipe.done)
+        self.assertEqual(cache.closing, [])
+
+    def test_failed_parse(self):
+        cache = statements.StatementCache()
+        pipe = pipeline.Pipeline(statements=cache)
+        result = pipe.execute(u'SELEC 1')
+        pipe.build()
+        respond(pipe, error_response(b'42601', b'syntax error'), READY)
+        self.assertEqual(result.error.sqlstate_code, u'42601')
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.closing, [])
+
+    def test_aborted_close(self):
+        cache = statements.StatementCache(maxsize=1)
+        pipe = pipeline.Pipeline(statements=cache)
+        pipe.execute(u'SELECT 1')
+        first = cache.get(u'SELECT 1', ())
+        pipe.execute(u'SELECT 2')
+        pipe.build()
+        respond(pipe, PARSE_COMPLETE, NO_DATA, BIND_COMPLETE,
+                error_response(b'XX000', b'oops'), READY)
+        # SELECT 2 was never parsed, and SELECT 1 is still open
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.closing, [first.name])
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_textcodec
+----------------------------------
+
+Tests for `textcodec` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.trial import unittest
+
+from thrum import connection
+from thrum import constants
+from thrum import errors
+from thrum import rows
+from thrum import textcodec
+from thrum.tests.helpers import (
+    AUTH_OK, BIND_COMPLETE, FakeTransport, PARSE_COMPLETE, READY, STARTED,
+    command_complete, data_row, parameter_status, ready, row_description,
+    sent)
+
+TEXT = constants.TEXTOID
+INT4 = constants.INT4OID
+
+
+def columns(*type_oids):
+    return tuple(rows.Column(b'c', 0, 0, type_oid, -1, -1,
+                             constants.FC_BINARY) for type_oid in type_oids)
+
+
+class CodecTests(unittest.TestCase):
+
+    def test_names(self):
+        self.assertEqual(textcodec.python_encoding(u'UTF8'), 'utf-8')
+        self.assertEqual(textcodec.python_encoding(u'SQL_ASCII'),
+                         'iso8859-1')
+        self.assertEqual(textcodec.python_encoding(u'WIN1252'), 'cp1252')
+        self.assertEqual(textcodec.python_encoding(u'WIN866'), 'cp866')
+        self.assertEqual(textcodec.python_encoding(u'ISO_8859_5'),
+                         'iso8859-5')
+        self.assertEqual(textcodec.python_encoding(u'EUC_JP'), 'euc_jp')
+        for name in (u'MULE_INTERNAL', u'NOPE'):
+            with self.assertRaises(errors.ThrumError):
+                textcodec.python_encoding(name)
+
+    def test_shared(self):
+        codec = textcodec.get_codec(u'UTF8')
+        self.assertIs(textcodec.get_codec(u'UTF8'), codec)
+        self.assertEqual(codec.fast, 'utf-8' in textcodec.FAST_ENCODINGS)
+        self.assertFalse(textcodec.get_codec(u'LATIN1').fast)
+
+    def test_decode(self):
+        for name in (u'UTF8', u'LATIN1', u'EUC_JP'):
+            codec = textcodec.get_codec(name)
+            text = u'caf\xe9' if name != u'EUC_JP' else u'日本'
+            data = codec.encode(text)
+            self.assertEqual(codec.decode(data), text)
+            self.assertEqual(codec.decode(memoryview(data)), text)
+
+    def test_sql_ascii(self):
+        codec = textcodec.get_codec(u'SQL_ASCII')
+        data = b'caf\xc3\xa9 \xff'
+        text = codec.decode(data)
+        self.assertEqual(codec.encode(text), data)
+        self.assertEqual(codec.decode_rows([(data,)], columns(TEXT)),
+                         [(text,)])
+
+    def test_decode_rows(self):
+        codec = textcodec.get_codec(u'LATIN1')
+        batch = [(1, b'caf\xe9', None), (2, None, b'x'), (3, b'', b'')]
+        self.assertEqual(codec.decode_rows(batch, columns(INT4, TEXT, TEXT)),
+                         [(1, u'caf\xe9', None), (2, None, u'x'),
+                          (3, u'', u'')])
+        self.assertEqual(codec.decode_rows([(1,)], columns(INT4)), [(1,)])
+        self.assertEqual(codec.decode_rows([], columns(TEXT)), [])
+
+    def test_decode_rows_all_text(self):
+        codec = textcodec.get_codec(u'UTF8')
+        batch = [(b'a', b'\xc3\xa9'), (b'b', b'c')]
+        self.assertEqual(codec.decode_rows(batch, columns(TEXT, TEXT)),
+                         [(u'a', u'\xe9'), (u'b', u'c')])
+
+    def test_text_format(self):
+        cols = (rows.Column(b'c', 0, 0, INT4, 4, -1, constants.FC_TEXT),)
+        self.assertEqual(textcodec.text_columns(cols), (0,))
+        self.assertEqual(textcodec.text_columns(columns(INT4, TEXT)), (1,))
+
+
+class CopyTextDecoderTests(unittest.TestCase):
+
+    def test_split_character(self):
+        decoder = textcodec.get_codec(u'UTF8').copy_decoder()
+        data = u'1\tcaf\xe9\n2\t日本\n3\tend'.encode('utf-8')
+        lines = []
+        for pos in range(len(data)):
+            lines.extend(decoder.feed(data[pos:pos + 1]))
+        lines.extend(decoder.finish())
+        self.assertEqual(lines, [u'1\tcaf\xe9', u'2\t日本',
+                                 u'3\tend'])
+        self.assertEqual(decoder.line_count, 3)
+
+    def test_chunks(self):
+        decoder = textcodec.get_codec(u'UTF8').copy_decoder()
+        self.assertEqual(decoder.feed(memoryview(b'a\nb\nc')), [u'a', u'b'])
+        self.assertEqual(decoder.feed(b'd\n'), [u'cd'])
+        self.assertEqual(decoder.finish(), [])
+
+    def test_truncated(self):
+        decoder = textcodec.get_codec(u'UTF8').copy_decoder()
+        self.assertEqual(decoder.feed(b'a\n\xc3'), [u'a'])
+        with self.assertRaises(errors.ThrumError):
+            decoder.finish()
+
+
+class ConnectionTests(unittest.TestCase):
+
+    def connect(self, decode_text=False):
+        conn = connection.Connection(u'alice', decode_text=decode_text)
+        conn.connection_made(FakeTransport())
+        conn.data_received(STARTED)
+        return conn
+
+    def test_client_encoding(self):
+        conn = self.connect()
+        self.assertEqual(conn.codec.encoding, 'utf-8')
+        conn.data_received(parameter_status(b'client_encoding', b'LATIN1'))
+        self.assertEqual(conn.codec.name, u'LATIN1')
+        self.assertEqual(conn.parameters[u'client_encoding'], u'LATIN1')
+        conn.data_received(parameter_status(b'application_name', b'caf\xe9'))
+        self.assertEqual(conn.parameters[u'application_name'], u'caf\xe9')
+
+    def query(self, conn):
+        pipe = conn.pipeline()
+        result = pipe.execute(u'SELECT 1')
+        conn.send(pipe)
+        conn.data_received(PARSE_COMPLETE + row_description(INT4, TEXT) +
+                           BIND_COMPLETE +
+                           data_row((INT4, TEXT), (1, b'caf\xe9')) +
+                           command_complete(b'SELECT 1') + READY)
+        return result
+
+    def test_decode_text(self):
+        conn = self.connect(decode_text=True)
+        conn.data_received(parameter_status(b'client_encoding', b'LATIN1'))
+        self.assertEqual(self.query(conn).rows, [(1, u'caf\xe9')])
+
+    def test_bytes(self):
+        conn = self.connect()
+        self.assertEqual(self.query(conn).rows, [(1, b'caf\xe9')])
+
+    def test_encode(self):
+        conn = connection.Connection(
+            u'alice', parameters={u'client_encoding': u'LATIN1'},
+            decode_text=True)
+        self.assertEqual(conn.codec.name, u'LATIN1')
+        transport = FakeTransport()
+        conn.connection_made(transport)
+        conn.data_received(AUTH_OK +
+                           parameter_status(b'client_encoding', b'LATIN1') +
+                           ready())
+        transport.take()
+
+        pipe = conn.pipeline()
+        result = pipe.execute(u"SELECT $1 || '\xe9'", (u'caf\xe9',), (TEXT,))
+        conn.send(pipe)
+        messages = dict(sent(transport.take()))
+        self.assertIn(b"\x00SELECT $1 || '\xe9'\x00",
+                      messages[constants.PARSE])
+        self.assertIn(b'\x00\x00\x00\x04caf\xe9', messages[constants.BIND])
+
+        conn.data_received(PARSE_COMPLETE + row_description(TEXT) +
+                           BIND_COMPLETE +
+                           data_row((TEXT,), (b'caf\xe9\xe9',)) +
+                           command_complete(b'SELECT 1') + READY)
+        self.assertEqual(result.rows, [(u'caf\xe9\xe9',)])
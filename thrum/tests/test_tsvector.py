@@ -14,6 +14,9 @@ from __future__ import division, absolute_import
 
 from twisted.trial import unittest
 
+from thrum import constants
+from thrum import rows
+from thrum import textcodec
 from thrum import tsvector
 
 
@@ -134,3 +137,80 @@ class TsVectorTests(unittest.TestCase):
     def test_vector_entry_repr(self):
         tse = tsvector.TsVectorEntry("hoop", 1, 'A')
         self.assertEqual(str(tse), "<TsVectorEntry (hoop:1A)>")
+
+
+class BinaryTests(unittest.TestCase):
+
+    def vector(self):
+        tsv = tsvector.TsVector()
+        tsv.add_entry(u'bridge', 1, 'A')
+        tsv.add_entry(u'bridge', 6)
+        tsv.add_entry(u'caf\xe9', 2, 'B')
+        tsv.add_entry(u'bare')
+        return tsv
+
+    def test_send(self):
+        data = tsvector.tsvector_send(self.vector())
+        self.assertEqual(data,
+                         b'\x00\x00\x00\x03' +
+                         b'bridge\x00\x00\x02\xc0\x01\x00\x06' +
+                         b'caf\xc3\xa9\x00\x00\x01\x80\x02' +
+                         b'bare\x00\x00\x00')
+
+    def test_round_trip(self):
+        tsv = self.vector()
+        data = b'xx' + tsvector.tsvector_send(tsv)
+        for buf in (data, memoryview(data)):
+            decoded = tsvector.tsvector_recv(buf, 2, len(data) - 2)
+            self.assertEqual(list(decoded.entries), list(tsv.entries))
+            for text, entry in tsv.entries.items():
+                self.assertEqual(decoded.entries[text], entry)
+
+    def test_positions(self):
+        tsv = tsvector.TsVector()
+        tsv.add_entry(u'x', 3, 'C')
+        tsv.add_entry(u'x', 3, 'A')
+        tsv.add_entry(u'x', 20000)
+        tsv.add_entry(u'x', 1)
+        data = tsvector.tsvector_send(tsv)
+        self.assertEqual(data[-8:], b'\x00\x03\x00\x01\xc0\x03\x3f\xff')
+        entry = tsvector.tsvector_recv(data)[0]
+        self.assertEqual(entry.positions,
+                         set([(1, 'D'), (3, 'A'), (16383, 'D')]))
+
+    def test_position_count(self):
+        for count, kept in ((256, 256), (257, 256)):
+            tsv = tsvector.TsVector()
+            for position in range(count, 0, -1):
+                tsv.add_entry(u'x', position)
+            entry = tsvector.tsvector_recv(tsvector.tsvector_send(tsv))[0]
+            self.assertEqual(sorted(entry.positions),
+                             [(position, 'D')
+                              for position in range(1, kept + 1)])
+
+    def test_bad_lexeme(self):
+        for text in (u'', u'a\x00b', u'x' * 2048):
+            tsv = tsvector.TsVector()
+            tsv.add_entry(text)
+            with self.assertRaises(ValueError):
+                tsvector.tsvector_send(tsv)
+
+    def test_row_codec(self):
+        key = (constants.TSVECTOROID,)
+        data = rows.get_row_encoder(key)((self.vector(),))
+        decode_row = rows.get_row_decoder(((constants.TSVECTOROID,
+                                            constants.FC_BINARY),))
+        decoded, = decode_row(memoryview(data))
+        self.assertEqual(decoded[u'bridge'], self.vector()[u'bridge'])
+
+    def test_client_encoding(self):
+        codec = textcodec.get_codec(u'LATIN1')
+        data = rows.get_row_encoder((constants.TSVECTOROID,), codec)(
+            (self.vector(),))
+        self.assertIn(b'caf\xe9\x00', data)
+        self.assertNotIn(b'caf\xc3\xa9', data)
+        decode_row = rows.get_row_decoder(
+            ((constants.TSVECTOROID, constants.FC_BINARY),), codec)
+        decoded, = decode_row(data)
+        self.assertEqual(sorted(decoded.entries), sorted(
+            self.vector().entries))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+test_txconnection
+----------------------------------
+
+Tests for `txconnection` module.
+"""
+
+from __future__ import division, absolute_import
+
+from twisted.internet import error
+from twisted.python import failure
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+
+from thrum import constants
+from thrum import errors
+from thrum import notify
+from thrum import txconnection
+from thrum.tests.helpers import (
+    BIND_COMPLETE, NO_DATA, PARSE_COMPLETE, PORTAL_SUSPENDED, STARTED,
+    command_complete, data_row, error_response, int_rows, notification, ready,
+    row_description)
+
+
+class PostgresProtocolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.proto = txconnection.PostgresProtocol(u'alice', u'db')
+        self.transport = proto_helpers.StringTransport()
+        self.proto.makeConnection(self.transport)
+
+    def start(self):
+        self.proto.dataReceived(STARTED)
+        self.transport.clear()
+
+    def test_ready(self):
+        results = []
+        self.proto.ready.addCallback(results.append)
+        self.assertTrue(self.transport.value().endswith(b'alice\x00\x00'))
+        self.start()
+        self.assertEqual(results, [self.proto])
+        self.assertTrue(self.proto.idle)
+        self.assertEqual(self.proto.transaction_status, constants.IDLE)
+
+    def test_startup_error(self):
+        self.proto.dataReceived(error_response(b'28P01', b'bad password'))
+        self.failureResultOf(self.proto.ready, errors.PostgresError)
+        self.assertTrue(self.transport.disconnecting)
+
+    def test_execute(self):
+        self.start()
+        d = self.proto.execute(u'SELECT $1', (5,), (constants.INT4OID,))
+        self.assertNoResult(d)
+        key = (constants.INT4OID,)
+        self.proto.dataReceived(PARSE_COMPLETE + row_description(*key) +
+                                BIND_COMPLETE + data_row(key, (5,)) +
+                                command_complete(b'SELECT 1') + ready())
+        self.assertEqual(self.successResultOf(d).rows, [(5,)])
+
+    def test_execute_error(self):
+        self.start()
+        d = self.proto.execute(u'SELECT 1/0')
+        self.proto.dataReceived(PARSE_COMPLETE + NO_DATA + BIND_COMPLETE +
+                                error_response(b'22012', b'division') +
+                                ready())
+        f = self.failureResultOf(d, errors.PostgresError)
+        self.assertEqual(f.value.sqlstate_code, u'22012')
+
+    def test_executemany(self):
+        self.start()
+        d = self.proto.executemany(u'INSERT', [(1,), (2,)],
+                                   (constants.INT4OID,))
+        self.proto.dataReceived(PARSE_COMPLETE + NO_DATA +
+                                (BIND_COMPLETE +
+                                 command_complete(b'INSERT 0 1')) * 2 +
+                                ready())
+        self.assertEqual([result.command_tag
+                          for result in self.successResultOf(d)],
+                         [b'INSERT 0 1'] * 2)
+
+    def test_cursor(self):
+        self.start()
+        cur = self.proto.cursor(u'SELECT n FROM t', fetch_size=2)
+        first = cur.fetch()
+        self.proto.dataReceived(PARSE_COMPLETE + BIND_COMPLETE +
+                                row_description(constants.INT4OID) +
+                                int_rows(1, 2) + PORTAL_SUSPENDED)
+        self.assertEqual(self.successResultOf(first), [(1,), (2,)])
+        second = cur.fetch()
+        self.assertNoResult(second)
+        self.proto.dataReceived(int_rows(3) + command_complete(b'SELECT 3'))
+        self.assertEqual(self.successResultOf(second), [(3,)])
+        closed = cur.close()
+        self.assertNoResult(closed)
+        self.proto.dataReceived(ready())
+        self.successResultOf(closed)
+        self.assertEqual(self.successResultOf(cur.fetch()), [])
+        self.assertTrue(self.proto.idle)
+
+    def test_cursor_error(self):
+        self.start()
+        cur = self.proto.cursor(u'SELECT 1/0')
+        d = cur.fetch()
+        self.proto.dataReceived(PARSE_COMPLETE + BIND_COMPLETE + NO_DATA +
+                                error_response(b'22012', b'division') +
+                                ready())
+        self.failureResultOf(d, errors.PostgresError)
+
+    def test_subscribe(self):
+        self.start()
+        notifications = self.proto.subscribe(u'cache', maxsize=1,
+                                             policy=notify.RESET)
+        self.assertIn(b'LISTEN "cache"', self.transport.value())
+        d = notifications.get()
+        self.proto.dataReceived(notification(5, b'cache', b'key'))
+        self.assertEqual(self.successResultOf(d),
+                         notify.Notification(5, u'cache', u'key'))
+        self.proto.dataReceived(notification(5, b'cache', b'a') +
+                                notification(5, b'cache', b'b'))
+        self.assertIs(self.successResultOf(notifications.get()),
+                      notify.OVERFLOW)
+        d = notifications.get()
+        self.transport.clear()
+        notifications.close()
+        self.assertIs(self.successResultOf(d), None)
+        self.assertIn(b'UNLISTEN "cache"', self.transport.value())
+
+    def test_connection_lost(self):
+        self.start()
+        d = self.proto.execute(u'SELECT 1')
+        self.proto.connectionLost(failure.Failure(error.ConnectionLost()))
+        self.failureResultOf(d, errors.ThrumError)
+        self.assertFalse(self.proto.connected)
+        self.assertEqual(self.successResultOf(self.proto.closed), self.proto)
+
+    def test_bad_data(self):
+        self.start()
+        self.proto.dataReceived(b'?\x00\x00\x00\x04')
+        self.assertFalse(self.proto.connected)
+
+    def test_close(self):
+        self.start()
+        self.proto.close()
+        self.assertEqual(self.transport.value(), constants.TERMINATE_MSG)
+        self.assertTrue(self.transport.disconnecting)
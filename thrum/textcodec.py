@@ -0,0 +1,214 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Decode and encode text in a connection's client_encoding, as reported by
+ParameterStatus, e.g.:
+
+codec = get_codec(u'UTF8')
+text = codec.decode(data)
+rows = codec.decode_rows(rows, columns)     # every text field of a batch
+
+decoder = codec.copy_decoder()
+for payload in copy_data_payloads:
+    for line in decoder.feed(payload):
+        ...
+decoder.finish()
+
+The Python codec is looked up once per encoding, through
+constants.pg_to_py, and codecs are shared by every connection with the same
+client_encoding. For UTF8 'decode' and 'encode' go straight to the
+interpreter's built-in codec.
+
+SQL_ASCII means the server doesn't interpret bytes above 127 at all, so
+rather than fail on them it is decoded as Latin-1, which maps every byte to
+a character and encodes back to the same bytes.
+
+decode_rows() decodes a whole batch with one call: every client encoding
+that Postgres supports is a superset of ASCII that never uses a zero byte
+within a character, and text can't contain NUL, so the batch's text fields
+are joined with NUL, decoded together and split apart again.
+
+A text COPY stream is split into CopyData messages without regard to
+characters, so a multibyte character may span two messages. The
+CopyTextDecoder from copy_decoder() keeps the bytes of an incomplete
+character, and the characters of an incomplete line, until the next
+message arrives.
+"""
+
+import codecs
+import functools
+
+from . import binary
+from . import constants
+from . import errors
+
+_text = type(u'')
+
+# Types whose binary format is the text in the client encoding
+TEXT_TYPES = frozenset((constants.TEXTOID, constants.VARCHAROID,
+                        constants.BPCHAROID, constants.NAMEOID))
+
+# Encodings the interpreter decodes without consulting the codec registry
+try:
+    _text(memoryview(b''), 'ascii')
+    FAST_ENCODINGS = frozenset(('utf-8', 'ascii'))
+except TypeError:
+    # Python 2's unicode() doesn't take a memoryview
+    FAST_ENCODINGS = frozenset()
+
+# Python codecs used in place of the ones in constants.pg_to_py
+_overrides = {'sql_ascii': 'latin-1'}
+
+_codecs = {}
+
+
+def python_encoding(name):
+    """
+    Return the name of the Python codec for the Postgres encoding 'name',
+    e.g. 'cp1252' for u'WIN1252'
+    """
+    key = name.lower()
+    encoding = _overrides.get(key) or constants.pg_to_py.get(key, key)
+    if encoding is None:
+        raise errors.ThrumError("Unsupported client_encoding %s" % (name,))
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        raise errors.ThrumError("Unsupported client_encoding %s" % (name,))
+
+
+def get_codec(name):
+    """
+    Return the TextCodec for the Postgres encoding 'name'
+    """
+    codec = _codecs.get(name)
+    if codec is None:
+        codec = TextCodec(name)
+        _codecs[name] = codec
+    return codec
+
+
+def text_columns(columns):
+    """
+    Return the indexes of the columns (from rows.parse_row_description)
+    whose fields are text in the client encoding
+    """
+    return tuple(index for index, column in enumerate(columns)
+                 if column.format_code == constants.FC_TEXT or
+                 column.type_oid in TEXT_TYPES)
+
+
+class TextCodec(object):
+    '''
+    The codec for one client encoding. 'name' is the Postgres name and
+    'encoding' the Python one. decode(data) takes bytes or a memoryview and
+    encode(text) returns bytes.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.encoding = python_encoding(name)
+        self.fast = self.encoding in FAST_ENCODINGS
+        info = codecs.lookup(self.encoding)
+        if self.fast:
+            self.decode = functools.partial(_text, encoding=self.encoding)
+            self.encode = functools.partial(_text.encode,
+                                            encoding=self.encoding)
+        else:
+            self.decode = _first(info.decode)
+            self.encode = _first(info.encode)
+
+    def __repr__(self):
+        return '<TextCodec %s (%s)>' % (self.name, self.encoding)
+
+    def decode_rows(self, rows, columns):
+        """
+        Return a list of 'rows' with their text fields decoded
+        """
+        indexes = text_columns(columns)
+        if not rows or not indexes:
+            return rows
+        fields = [row[index] for row in rows for index in indexes]
+        present = [field for field in fields if field is not None]
+        if not present:
+            return rows
+        values = self.decode(b'\x00'.join(present)).split(u'\x00')
+
+        if len(indexes) == len(columns) and len(present) == len(fields):
+            width = len(indexes)
+            return [tuple(values[pos:pos + width])
+                    for pos in range(0, len(values), width)]
+
+        values = iter(values)
+        decoded = []
+        append = decoded.append
+        for row in rows:
+            row = list(row)
+            for index in indexes:
+                if row[index] is not None:
+                    row[index] = next(values)
+            append(tuple(row))
+        return decoded
+
+    def copy_decoder(self):
+        """
+        Return a CopyTextDecoder for a text COPY stream in this encoding
+        """
+        return CopyTextDecoder(self.encoding)
+
+
+def _first(func):
+    """
+    Wrap a codec function that returns (result, length consumed)
+    """
+    def call(data):
+        return func(data)[0]
+    return call
+
+
+class CopyTextDecoder(object):
+    '''
+    Decode the payloads of the CopyData messages of a text COPY into lines,
+    without their newlines. 'line_count' is the number of lines returned.
+    '''
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.line_count = 0
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._partial = u''
+
+    def feed(self, data):
+        """
+        Consume the payload of a CopyData message and return a list of the
+        lines that it completes
+        """
+        if not isinstance(data, bytes):
+            data = binary.to_bytes(data)
+        text = self._decoder.decode(data)
+        if u'\n' not in text:
+            self._partial += text
+            return []
+        lines = (self._partial + text).split(u'\n')
+        self._partial = lines.pop()
+        self.line_count += len(lines)
+        return lines
+
+    def finish(self):
+        """
+        Return a list holding the final line if the stream didn't end with a
+        newline, or raise ThrumError if it ended within a character
+        """
+        try:
+            self._partial += self._decoder.decode(b'', True)
+        except UnicodeDecodeError:
+            raise errors.ThrumError("COPY data ends within a character")
+        if not self._partial:
+            return []
+        lines = [self._partial]
+        self._partial = u''
+        self.line_count += 1
+        return lines
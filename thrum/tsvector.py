@@ -11,11 +11,34 @@ TsVector class.
 This could conceivably be useful if you were writing (for example) some
 code to parse web pages using beautifulsoup and then index their content
 with Python/Postgres.
+
+tsvector_send() and tsvector_recv() encode and decode a TsVector in the
+binary format, so precomputed vectors can be sent as parameters or loaded
+with binary COPY without being rendered as text and parsed by the backend:
+an int32 lexeme count, then for each lexeme its NUL-terminated text, a uint16
+position count and a uint16 for each position, with the weight (D=0 to A=3)
+in the top two bits.
 """
 from collections import OrderedDict
 
 import re
 
+from . import binary
+
+i_pack = binary.i_pack
+i_unpack = binary.i_unpack
+H_pack = binary.H_pack
+H_unpack = binary.H_unpack
+
+WEIGHTS = {'A': 3, 'B': 2, 'C': 1, 'D': 0}
+WEIGHT_NAMES = ('D', 'C', 'B', 'A')
+
+# The backend's limits: higher positions are stored as MAX_POSITION
+MAX_POSITION = 16383
+MAX_LEXEME = 2047
+# Positions kept per lexeme; the backend rejects a binary tsvector with more
+MAX_POSITIONS = 256
+
 
 class TsVectorEntry(object):
     __slots__ = ('text', 'positions',)
@@ -203,3 +226,80 @@ class TsVector(object):
 
         entry = TsVectorEntry(text, position, weight)
         self.entries[text] = entry
+
+
+def _positions(positions):
+    """
+    Return the packed positions of an entry in ascending order, keeping the
+    highest weight of any position given more than once and only the first
+    MAX_POSITIONS, as the backend does
+    """
+    weights = {}
+    for position, weight in positions:
+        position = min(position, MAX_POSITION)
+        code = WEIGHTS[weight]
+        if weights.get(position, -1) < code:
+            weights[position] = code
+    return [(code << 14) | position
+            for position, code in sorted(weights.items())[:MAX_POSITIONS]]
+
+
+def _encode_utf8(text):
+    return text.encode('utf-8')
+
+
+def _decode_utf8(data):
+    return data.decode('utf-8')
+
+
+def tsvector_send(value, encode=_encode_utf8):
+    """
+    Return the binary format of the TsVector 'value', with its text lexemes
+    encoded by encode(text) in the client encoding
+    """
+    entries = value.entries
+    parts = [i_pack(len(entries))]
+    append = parts.append
+    for text, entry in entries.items():
+        lexeme = text if isinstance(text, bytes) else encode(text)
+        if not lexeme or len(lexeme) > MAX_LEXEME or b'\x00' in lexeme:
+            raise ValueError("Bad tsvector lexeme %r" % (text,))
+        append(lexeme)
+        append(b'\x00')
+        positions = _positions(entry.positions)
+        if positions:
+            count = len(positions)
+            append(binary.structs.get_pack('H' * (count + 1))(count,
+                                                              *positions))
+        else:
+            append(H_pack(0))
+    return b''.join(parts)
+
+
+def tsvector_recv(data, offset=0, length=None, decode=_decode_utf8):
+    """
+    Return the TsVector encoded at 'offset' in 'data', with its lexemes
+    decoded by decode(data) from the client encoding
+    """
+    if not isinstance(data, bytes):
+        end = None if length is None else offset + length
+        data = binary.to_bytes(data[offset:end])
+        offset = 0
+    count = i_unpack(data, offset)[0]
+    pos = offset + 4
+    vector = TsVector()
+    entries = vector.entries
+    for _ in range(count):
+        end = data.index(b'\x00', pos)
+        text = decode(data[pos:end])
+        npos = H_unpack(data, end + 1)[0]
+        pos = end + 3
+        entry = TsVectorEntry(text)
+        if npos:
+            packed = binary.structs.get_unpack('H' * npos)(data, pos)
+            pos += 2 * npos
+            entry.positions = set((word & MAX_POSITION,
+                                   WEIGHT_NAMES[word >> 14])
+                                  for word in packed)
+        entries[text] = entry
+    return vector
@@ -0,0 +1,266 @@
+#!/usr/bin/env pypy
+# -*- coding: utf-8 -*-
+# Copyright (c) Dónal McMullan
+# See LICENSE for details.
+
+"""
+Twisted protocol for a connection to Postgres, e.g.:
+
+conn = yield connect(reactor, u'localhost', 5432, user=u'postgres',
+                     database=u'test', password=u'secret')
+result = yield conn.execute(u'SELECT $1::int4 + 1', (1,), (INT4OID,))
+result.rows == [(2,)]
+
+All the protocol state lives in connection.Connection, which this wraps with
+Deferreds.
+"""
+
+from twisted.internet import defer
+from twisted.internet import protocol
+
+from . import connection
+from . import errors
+from . import notify
+
+
+class PostgresProtocol(protocol.Protocol):
+    '''
+    A connection to Postgres. 'ready' fires with the protocol once startup
+    and authentication have finished.
+    '''
+
+    def __init__(self, user, database=None, password=None, parameters=None,
+                 statement_cache_size=256, decode_text=False):
+        self.connection = connection.Connection(
+            user, database, password, parameters, statement_cache_size,
+            decode_text)
+        self.connection.startup_callbacks.append(self._startup_finished)
+        self.dispatcher = notify.Dispatcher(self.listen, self.unlisten)
+        self.dispatcher.attach(self.connection)
+        self.ready = defer.Deferred()
+        self.closed = defer.Deferred()
+
+    @property
+    def transaction_status(self):
+        return self.connection.transaction_status
+
+    @property
+    def idle(self):
+        return self.connection.idle
+
+    @property
+    def pending(self):
+        """
+        The number of operations waiting for responses
+        """
+        return len(self.connection)
+
+    def connectionMade(self):
+        self.connection.connection_made(self.transport)
+
+    def dataReceived(self, data):
+        try:
+            self.connection.data_received(data)
+        except Exception as e:
+            # We can't know where the next message starts
+            self.connected = 0
+            self.connection.connection_lost(e)
+            self.transport.abortConnection()
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        self.connected = 0
+        self.connection.connection_lost(reason.getErrorMessage())
+        if not self.closed.called:
+            self.closed.callback(self)
+
+    def _startup_finished(self, conn, error):
+        if error is None:
+            self.ready.callback(self)
+        else:
+            self.ready.errback(error)
+            if self.transport is not None:
+                self.transport.loseConnection()
+
+    def run_pipeline(self, pipe):
+        """
+        Send 'pipe' and return a Deferred that fires with it when all of its
+        responses have arrived. Errors are in the StatementResults.
+        """
+        d = defer.Deferred()
+        pipe.callbacks.append(d.callback)
+        self.connection.send(pipe)
+        return d
+
+    def pipeline(self):
+        return self.connection.pipeline()
+
+    def execute(self, sql, params=(), type_oids=(), columnar=False):
+        """
+        Return a Deferred that fires with the StatementResult for 'sql' or
+        fails with its error
+        """
+        pipe = self.connection.pipeline()
+        result = pipe.execute(sql, params, type_oids, columnar)
+        d = self.run_pipeline(pipe)
+        d.addCallback(lambda _: _raise_or_return(result))
+        return d
+
+    def executemany(self, sql, params_seq, type_oids=(), columnar=False):
+        """
+        Run 'sql' for each parameter sequence in one round trip. Return a
+        Deferred that fires with the StatementResults or fails with the
+        first error.
+        """
+        pipe = self.connection.pipeline()
+        results = pipe.executemany(sql, params_seq, type_oids, columnar)
+        d = self.run_pipeline(pipe)
+        d.addCallback(lambda _: [_raise_or_return(result)
+                                 for result in results])
+        return d
+
+    def cursor(self, sql, params=(), type_oids=(), fetch_size=1000,
+               adaptive=True, columnar=False):
+        """
+        Send a cursor.Cursor for 'sql' and return it wrapped in a Cursor
+        """
+        cur = self.connection.cursor(sql, params, type_oids, fetch_size,
+                                     adaptive, columnar)
+        self.connection.send(cur)
+        return Cursor(cur)
+
+    def listen(self, channel):
+        return self.execute(u'LISTEN ' + notify.quote_ident(channel))
+
+    def unlisten(self, channel):
+        if not self.connected:
+            return None
+        return self.execute(u'UNLISTEN ' + notify.quote_ident(channel))
+
+    def subscribe(self, channel, maxsize=1000, policy=notify.DROP_OLDEST):
+        """
+        Subscribe to 'channel', sending LISTEN if nothing else has, and
+        return its Notifications. To have a callback called with each
+        notification instead, use self.dispatcher.subscribe().
+        """
+        return Notifications(self.dispatcher.subscribe(
+            channel, maxsize=maxsize, policy=policy))
+
+    def close(self):
+        """
+        Send Terminate and close the connection. Return a Deferred that fires
+        when it's closed.
+        """
+        if self.connected:
+            self.connection.terminate()
+            self.transport.loseConnection()
+        return self.closed
+
+
+def _raise_or_return(result):
+    result.raise_error()
+    return result
+
+
+class Cursor(object):
+    '''
+    Fetch the rows of a cursor.Cursor in batches, e.g.:
+
+    cur = conn.cursor(u'SELECT * FROM big')
+    rows = yield cur.fetch()
+    while rows:
+        ...
+        rows = yield cur.fetch()
+    '''
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def fetch(self):
+        """
+        Return a Deferred that fires with the next batch of rows, which is
+        empty once there are no more, or fails with the cursor's error
+        """
+        d = defer.Deferred()
+
+        def delivered(cursor, rows):
+            if cursor.error is not None:
+                d.errback(cursor.error)
+            else:
+                d.callback(rows)
+        self.cursor.request(delivered)
+        return d
+
+    def close(self):
+        """
+        Stop fetching. Return a Deferred that fires when the connection has
+        moved on.
+        """
+        self.cursor.close()
+        d = defer.Deferred()
+        if self.cursor.done:
+            d.callback(None)
+        else:
+            self.cursor.callbacks.append(lambda cursor: d.callback(None))
+        return d
+
+
+class Notifications(object):
+    '''
+    Take the notifications queued for a notify.Subscription, e.g.:
+
+    notifications = conn.subscribe(u'invalidate')
+    notification = yield notifications.get()
+    '''
+
+    def __init__(self, subscription):
+        self.subscription = subscription
+
+    def get(self):
+        """
+        Return a Deferred that fires with the next notify.Notification, or
+        with None once the subscription is closed
+        """
+        d = defer.Deferred()
+        self.subscription.request(d.callback)
+        return d
+
+    def close(self):
+        self.subscription.close()
+
+
+class PostgresFactory(protocol.ClientFactory):
+
+    protocol = PostgresProtocol
+
+    def __init__(self, user, database=None, password=None, parameters=None,
+                 statement_cache_size=256, decode_text=False):
+        self.kwargs = dict(user=user, database=database, password=password,
+                           parameters=parameters,
+                           statement_cache_size=statement_cache_size,
+                           decode_text=decode_text)
+        self.ready = defer.Deferred()
+
+    def buildProtocol(self, addr):
+        proto = self.protocol(**self.kwargs)
+        proto.factory = self
+        proto.ready.chainDeferred(self.ready)
+        return proto
+
+    def clientConnectionFailed(self, connector, reason):
+        if not self.ready.called:
+            self.ready.errback(reason)
+
+
+def connect(reactor, host, port=5432, user=None, database=None,
+            password=None, parameters=None, statement_cache_size=256,
+            timeout=30, decode_text=False):
+    """
+    Connect to Postgres over TCP. Return a Deferred that fires with a
+    PostgresProtocol once it's ready for queries.
+    """
+    if user is None:
+        raise errors.ThrumError("A user name is required")
+    factory = PostgresFactory(user, database, password, parameters,
+                              statement_cache_size, decode_text)
+    reactor.connectTCP(host, port, factory, timeout=timeout)
+    return factory.ready